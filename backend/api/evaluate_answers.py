@@ -2,6 +2,9 @@
 """
 Node.js-callable script for evaluating student answers.
 Takes questions and student answers, returns detailed evaluation and feedback.
+
+With --stream, prints NDJSON instead: one "evaluation" record per answer as
+soon as it is graded, then a "summary" record.
 """
 
 import sys
@@ -19,7 +22,9 @@ sys.path.append(pic_process_dir)
 sys.path.append(question_dir)
 
 try:
-    from utils import evaluate_student_answers
+    from utils import iter_student_evaluations, summarize_evaluations
+    from timing import trace
+    from usage import usage_scope
 except ImportError as e:
     print(json.dumps({
         "success": False,
@@ -27,9 +32,146 @@ except ImportError as e:
     }))
     sys.exit(1)
 
+REQUIRED_FIELDS = ['image_description', 'questions', 'student_answers', 'language', 'level']
+
+def _validate_request(eval_data):
+    """Error response for a payload missing a required field, or None."""
+    for field in REQUIRED_FIELDS:
+        if field not in eval_data:
+            return {
+                "success": False,
+                "error": f"Missing required field: {field}"
+            }
+    return None
+
+def _metadata(eval_data, evaluations, prompt_cache):
+    # Failure counts and cache counters go here; the summary keeps the shape the app renders
+    return {
+        "evaluated_at": None,  # Will be set by Node.js
+        "user_id": eval_data.get("user_id"),
+        "request_type": "answer_evaluation",
+        "questions_count": len(eval_data["questions"]),
+        "questions_failed": sum(1 for evaluation in evaluations if evaluation.get("error")),
+        "language": eval_data["language"],
+        "level": eval_data["level"],
+        "prompt_cache": prompt_cache
+    }
+
+def _add_counts(totals, counts):
+    for key, value in counts.items():
+        totals[key] = totals.get(key, 0) + value
+
+def _usage_scope(eval_data):
+    return usage_scope(request_type="answer_evaluation",
+                       language=eval_data.get("language"), level=eval_data.get("level"))
+
+def evaluate_request(eval_data):
+    """
+    Evaluate one request payload and build the response sent to Node.js.
+
+    Args:
+        eval_data (dict): Parsed evaluation request (see REQUIRED_FIELDS)
+
+    Returns:
+        dict: Response payload; "success" is False if the request is invalid.
+        metadata.timings holds the span timings of the request and
+        metadata.usage its token usage and estimated cost.
+    """
+    with trace() as request_trace, _usage_scope(eval_data) as request_usage:
+        response = _evaluate_request(eval_data)
+    if response["success"]:
+        response["metadata"]["timings"] = request_trace.to_dict()
+        response["metadata"]["usage"] = request_usage.to_dict()
+    return response
+
+def _evaluate_request(eval_data):
+    # Extract required fields
+    error = _validate_request(eval_data)
+    if error:
+        return error
+    
+    # Prepare data for evaluation function
+    img_data = {
+        "description": eval_data["image_description"]
+    }
+    
+    user_data = {
+        "language": eval_data["language"],
+        "level": eval_data["level"]
+    }
+    
+    questions = eval_data["questions"]
+    student_answers = eval_data["student_answers"]
+    
+    # Perform evaluation (same output as utils.evaluate_student_answers, plus the
+    # prompt cache counters for the metadata)
+    results = {}
+    prompt_cache = {}
+    for i, evaluation, usage in iter_student_evaluations(img_data, user_data, questions, student_answers):
+        results[i] = evaluation
+        _add_counts(prompt_cache, usage)
+    evaluations = [results[i] for i in sorted(results)]
+    
+    # Format response for Node.js
+    return {
+        "success": True,
+        "evaluation_summary": {
+            "evaluations": evaluations,
+            "summary": summarize_evaluations(evaluations, user_data["level"], user_data["language"])
+        },
+        "metadata": _metadata(eval_data, evaluations, prompt_cache)
+    }
+
+def stream_evaluation(eval_data):
+    """
+    Streaming variant of evaluate_request.
+    
+    Yields NDJSON records, in order:
+        {"type": "evaluation", "evaluation": {...}}   one per answer, as each is graded
+        {"type": "summary", "success": true, "summary": {...}, "metadata": {...}}
+    or {"type": "error", "success": false, "error": ...} for an invalid request.
+    
+    Evaluations arrive in grading order; each carries its question_id. The
+    summary's metadata.timings and metadata.usage hold the span timings and
+    token usage of the request.
+    """
+    with trace() as request_trace, _usage_scope(eval_data) as request_usage:
+        for record in _stream_evaluation(eval_data):
+            if record["type"] == "summary":
+                record["metadata"]["timings"] = request_trace.to_dict()
+                record["metadata"]["usage"] = request_usage.to_dict()
+            yield record
+
+def _stream_evaluation(eval_data):
+    error = _validate_request(eval_data)
+    if error:
+        yield {"type": "error", **error}
+        return
+    
+    img_data = {"description": eval_data["image_description"]}
+    user_data = {"language": eval_data["language"], "level": eval_data["level"]}
+    
+    evaluations = {}
+    prompt_cache = {}
+    for i, evaluation, usage in iter_student_evaluations(
+            img_data, user_data, eval_data["questions"], eval_data["student_answers"]):
+        evaluations[i] = evaluation
+        _add_counts(prompt_cache, usage)
+        yield {"type": "evaluation", "evaluation": evaluation}
+    
+    ordered = [evaluations[i] for i in sorted(evaluations)]
+    yield {
+        "type": "summary",
+        "success": True,
+        "summary": summarize_evaluations(ordered, eval_data["level"], eval_data["language"]),
+        "metadata": _metadata(eval_data, ordered, prompt_cache)
+    }
+
 def main():
     parser = argparse.ArgumentParser(description='Evaluate student answers and provide feedback')
     parser.add_argument('--data', type=str, required=True, help='JSON data containing evaluation request')
+    parser.add_argument('--stream', action='store_true',
+                        help='Emit NDJSON records: each evaluation as soon as it is graded, then the summary')
     
     try:
         args = parser.parse_args()
@@ -44,50 +186,19 @@ def main():
             }))
             sys.exit(1)
         
-        # Extract required fields
-        required_fields = ['image_description', 'questions', 'student_answers', 'language', 'level']
-        for field in required_fields:
-            if field not in eval_data:
-                print(json.dumps({
-                    "success": False,
-                    "error": f"Missing required field: {field}"
-                }))
-                sys.exit(1)
+        if args.stream:
+            success = True
+            for record in stream_evaluation(eval_data):
+                print(json.dumps(record, ensure_ascii=False))
+                sys.stdout.flush()
+                success = record["type"] != "error"
+            sys.exit(0 if success else 1)
         
-        # Prepare data for evaluation function
-        img_data = {
-            "description": eval_data["image_description"]
-        }
-        
-        user_data = {
-            "language": eval_data["language"],
-            "level": eval_data["level"]
-        }
-        
-        questions = eval_data["questions"]
-        student_answers = eval_data["student_answers"]
+        response = evaluate_request(eval_data)
         
-        # Perform evaluation
-        evaluation_result = evaluate_student_answers(
-            img_data, 
-            user_data, 
-            questions, 
-            student_answers
-        )
-        
-        # Format response for Node.js
-        response = {
-            "success": True,
-            "evaluation_summary": evaluation_result,
-            "metadata": {
-                "evaluated_at": None,  # Will be set by Node.js
-                "user_id": eval_data.get("user_id"),
-                "request_type": "answer_evaluation",
-                "questions_count": len(questions),
-                "language": eval_data["language"],
-                "level": eval_data["level"]
-            }
-        }
+        if not response["success"]:
+            print(json.dumps(response))
+            sys.exit(1)
         
         # Output JSON response for Node.js to consume
         print(json.dumps(response, ensure_ascii=False, indent=2))
@@ -2,6 +2,8 @@
 """
 Node.js-callable wrapper for complete image processing and Q&A generation.
 Takes base64 image and user preferences, returns complete Q&A sets.
+With --stream, prints NDJSON records instead, one question per line as soon
+as each is generated.
 """
 
 import sys
@@ -20,7 +22,9 @@ sys.path.append(question_dir)
 
 try:
     from interface import pic_process
-    from utils import process_image_to_qa
+    from utils import process_image_to_qa, process_image_to_qa_targets, stream_complete_qa_set
+    from timing import trace
+    from usage import usage_scope
 except ImportError as e:
     print(json.dumps({
         "success": False,
@@ -28,59 +32,242 @@ except ImportError as e:
     }))
     sys.exit(1)
 
+def generate_image_qa(processor, base64_image, language='Spanish', level='A2', user_id=None):
+    """
+    Run the image → Q&A pipeline and build the response sent to Node.js.
+
+    Args:
+        processor (pic_process): Processor instance (reused across requests by worker.py)
+        base64_image (str): Base64 encoded image data
+        language (str): Target language
+        level (str): Language proficiency level
+        user_id (str): Optional user ID echoed in the metadata
+
+    Returns:
+        dict: Response payload; "success" is False if any step failed.
+        metadata.timings holds the span timings of the request and
+        metadata.usage its token usage and estimated cost.
+    """
+    with trace() as request_trace, \
+            usage_scope(request_type="image_qa_generation", language=language, level=level) as request_usage:
+        response = _generate_image_qa(processor, base64_image, language, level, user_id)
+    metadata = response.setdefault("metadata", {})
+    metadata["timings"] = request_trace.to_dict()
+    metadata["usage"] = request_usage.to_dict()
+    return response
+
+def _generate_image_qa(processor, base64_image, language, level, user_id):
+    # Step 1: Process image with pic_process
+    pic_result = processor.process_base64_image(base64_image)
+    
+    if pic_result.get('error'):
+        return {
+            "success": False,
+            "error": f"Image processing failed: {pic_result['error']}"
+        }
+    
+    # Step 2: Generate complete Q&A sets
+    qa_result = process_image_to_qa(pic_result, language, level)
+    
+    if qa_result.get('error'):
+        return {
+            "success": False,
+            "error": f"Q&A generation failed: {qa_result['error']}"
+        }
+    
+    # Step 3: Format response for Node.js/frontend consumption
+    return {
+        "success": True,
+        "image_analysis": {
+            "description": pic_result.get("description", ""),
+            "primary_object": pic_result.get("primary_object", ""),
+            "detected_objects": pic_result.get("objects", []),
+            "confidence": pic_result.get("confidence", 0.85)
+        },
+        "learning_context": qa_result["learning_context"],
+        "questions": qa_result["questions"],
+        "total_questions": qa_result["total_questions"],
+        "instructions": qa_result["instructions"],
+        "metadata": {
+            "processed_at": None,  # Will be set by Node.js
+            "user_id": user_id,
+            "request_type": "image_qa_generation",
+            "prompt_cache": qa_result.get("prompt_cache")
+        }
+    }
+
+def generate_image_qa_targets(processor, base64_image, targets, user_id=None):
+    """
+    Run the image → Q&A pipeline for several (language, level) targets at once.
+
+    The image is analyzed once; the Q&A calls share a cached prompt prefix.
+
+    Args:
+        processor (pic_process): Processor instance (reused across requests by worker.py)
+        base64_image (str): Base64 encoded image data
+        targets (list): "Language:LEVEL" strings, {"language", "level"} dicts or pairs
+        user_id (str): Optional user ID echoed in the metadata
+
+    Returns:
+        dict: Response payload with one entry per target under "results", keyed
+        "Language:LEVEL"; "success" is False if the image failed or every target did.
+        metadata.timings and metadata.usage cover the whole request.
+    """
+    with trace() as request_trace, \
+            usage_scope(request_type="image_qa_targets") as request_usage:
+        response = _generate_image_qa_targets(processor, base64_image, targets, user_id)
+    metadata = response.setdefault("metadata", {})
+    metadata["timings"] = request_trace.to_dict()
+    metadata["usage"] = request_usage.to_dict()
+    return response
+
+def _generate_image_qa_targets(processor, base64_image, targets, user_id):
+    if not targets:
+        return {"success": False, "error": "No targets given"}
+    
+    pic_result = processor.process_base64_image(base64_image)
+    
+    if pic_result.get('error'):
+        return {
+            "success": False,
+            "error": f"Image processing failed: {pic_result['error']}"
+        }
+    
+    qa_result = process_image_to_qa_targets(pic_result, targets)
+    
+    results = {}
+    for key, result in qa_result["results"].items():
+        if result.get("error"):
+            results[key] = {"success": False, "error": f"Q&A generation failed: {result['message']}"}
+            continue
+        results[key] = {
+            "success": True,
+            "learning_context": result["learning_context"],
+            "questions": result["questions"],
+            "total_questions": result["total_questions"],
+            "instructions": result["instructions"]
+        }
+    
+    return {
+        "success": qa_result["success"],
+        "image_analysis": {
+            "description": pic_result.get("description", ""),
+            "primary_object": pic_result.get("primary_object", ""),
+            "detected_objects": pic_result.get("objects", []),
+            "confidence": pic_result.get("confidence", 0.85)
+        },
+        "results": results,
+        "metadata": {
+            "processed_at": None,  # Will be set by Node.js
+            "user_id": user_id,
+            "request_type": "image_qa_targets",
+            "targets": list(results),
+            "prompt_cache": qa_result["prompt_cache"]
+        }
+    }
+
+def stream_image_qa(processor, base64_image, language='Spanish', level='A2', user_id=None):
+    """
+    Streaming variant of generate_image_qa.
+    
+    Yields NDJSON records, in order:
+        {"type": "image_analysis", "image_analysis": {...}}
+        {"type": "question", "question": {...}}       one per Q&A set, as each completes
+        {"type": "done", "success": true, "learning_context", "total_questions", "instructions", "metadata"}
+    or {"type": "error", "success": false, "error": ...} at the point of failure.
+    The final record's metadata.timings and metadata.usage hold the span
+    timings and token usage of the request.
+    """
+    with trace() as request_trace, \
+            usage_scope(request_type="image_qa_generation", language=language, level=level) as request_usage:
+        for record in _stream_image_qa(processor, base64_image, language, level, user_id):
+            if record["type"] in ("done", "error"):
+                metadata = record.setdefault("metadata", {})
+                metadata["timings"] = request_trace.to_dict()
+                metadata["usage"] = request_usage.to_dict()
+            yield record
+
+def _stream_image_qa(processor, base64_image, language, level, user_id):
+    pic_result = processor.process_base64_image(base64_image)
+    
+    if pic_result.get('error'):
+        yield {"type": "error", "success": False, "error": f"Image processing failed: {pic_result['error']}"}
+        return
+    
+    yield {
+        "type": "image_analysis",
+        "image_analysis": {
+            "description": pic_result.get("description", ""),
+            "primary_object": pic_result.get("primary_object", ""),
+            "detected_objects": pic_result.get("objects", []),
+            "confidence": pic_result.get("confidence", 0.85)
+        }
+    }
+    
+    img_data = {
+        "description": pic_result.get("description", ""),
+        "primary_object": pic_result.get("primary_object", ""),
+        "objects": pic_result.get("objects", [])
+    }
+    user_data = {"language": language, "level": level}
+    
+    for record in stream_complete_qa_set(img_data, user_data):
+        if record.get("error"):
+            yield {"type": "error", "success": False, "error": f"Q&A generation failed: {record['message']}"}
+            return
+        if not record.get("done"):
+            yield {"type": "question", "question": record}
+            continue
+        yield {
+            "type": "done",
+            "success": True,
+            "learning_context": {"language": language, "level": level},
+            "total_questions": record["total_questions"],
+            "instructions": f"Answer these {record['total_questions']} questions in {language} based on the image you saw.",
+            "metadata": {
+                "processed_at": None,  # Will be set by Node.js
+                "user_id": user_id,
+                "request_type": "image_qa_generation",
+                "prompt_cache": record["prompt_cache"]
+            }
+        }
+
 def main():
     parser = argparse.ArgumentParser(description='Process image and generate Q&A sets')
     parser.add_argument('--base64', type=str, required=True, help='Base64 encoded image data')
     parser.add_argument('--language', type=str, default='Spanish', help='Target language (e.g., Spanish, Japanese, Chinese)')
     parser.add_argument('--level', type=str, default='A2', help='Language proficiency level (A1, A2, B1, B2, C1, C2)')
     parser.add_argument('--user-id', type=str, help='User ID (optional)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Emit NDJSON records: image analysis, then each question as soon as it is generated')
+    parser.add_argument('--targets', type=str,
+                        help='Comma-separated Language:LEVEL targets (e.g. Spanish:A2,Japanese:B1); '
+                             'overrides --language/--level and returns results keyed by target')
     
     try:
         args = parser.parse_args()
         
-        # Step 1: Process image with pic_process
-        processor = pic_process()
-        
-        # Process the base64 image
-        pic_result = processor.process_base64_image(args.base64)
+        if args.targets:
+            targets = [target.strip() for target in args.targets.split(',') if target.strip()]
+            response = generate_image_qa_targets(pic_process(), args.base64, targets, args.user_id)
+            print(json.dumps(response, ensure_ascii=False, indent=2))
+            sys.stdout.flush()
+            sys.exit(0 if response["success"] else 1)
         
-        if pic_result.get('error'):
-            print(json.dumps({
-                "success": False,
-                "error": f"Image processing failed: {pic_result['error']}"
-            }))
-            sys.exit(1)
+        if args.stream:
+            success = True
+            for record in stream_image_qa(pic_process(), args.base64, args.language, args.level, args.user_id):
+                print(json.dumps(record, ensure_ascii=False))
+                sys.stdout.flush()
+                success = record["type"] != "error"
+            sys.exit(0 if success else 1)
         
-        # Step 2: Generate complete Q&A sets
-        qa_result = process_image_to_qa(pic_result, args.language, args.level)
+        response = generate_image_qa(pic_process(), args.base64, args.language, args.level, args.user_id)
         
-        if qa_result.get('error'):
-            print(json.dumps({
-                "success": False,
-                "error": f"Q&A generation failed: {qa_result['error']}"
-            }))
+        if not response["success"]:
+            print(json.dumps(response))
             sys.exit(1)
         
-        # Step 3: Format response for Node.js/frontend consumption
-        response = {
-            "success": True,
-            "image_analysis": {
-                "description": pic_result.get("description", ""),
-                "primary_object": pic_result.get("primary_object", ""),
-                "detected_objects": pic_result.get("objects", []),
-                "confidence": pic_result.get("confidence", 0.85)
-            },
-            "learning_context": qa_result["learning_context"],
-            "questions": qa_result["questions"],
-            "total_questions": qa_result["total_questions"],
-            "instructions": qa_result["instructions"],
-            "metadata": {
-                "processed_at": None,  # Will be set by Node.js
-                "user_id": args.user_id,
-                "request_type": "image_qa_generation"
-            }
-        }
-        
         # Output JSON response for Node.js to consume
         print(json.dumps(response, ensure_ascii=False, indent=2))
         sys.stdout.flush()
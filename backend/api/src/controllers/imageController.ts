@@ -1,82 +1,69 @@
-import { Response } from 'express';
+import { Request, Response } from 'express';
 import { DatabaseService, supabase } from '../utils/supabase';
 import { AuthRequest, ApiResponse, ImageAnalysisResponse, IFlashcard } from '../types';
 import { asyncHandler } from '../middleware';
 import sharp from 'sharp';
 import path from 'path';
 import fs from 'fs/promises';
-import { spawn } from 'child_process';
+import { pythonWorkerPool } from '../utils/pythonWorkerPool';
 
-// Complete image processing and Q&A generation using Python backend
+// Complete image processing and Q&A generation using the persistent Python workers
 const processImageWithPython = async (
   base64Image: string, 
   language: string = 'Spanish', 
   level: string = 'A2',
   userId?: string
 ): Promise<ImageAnalysisResponse> => {
-  return new Promise((resolve, reject) => {
-    const pythonScriptPath = path.join(__dirname, '../../process_image_qa.py');
-    const venvPythonPath = path.join(__dirname, '../../../venv/bin/python3');
-    
-    const args = [
-      pythonScriptPath,
-      '--base64', base64Image,
-      '--language', language,
-      '--level', level
-    ];
-    
-    if (userId) {
-      args.push('--user-id', userId);
-    }
-    
-    // Use virtual environment Python
-    const pythonProcess = spawn(venvPythonPath, args);
-
-    let stdout = '';
-    let stderr = '';
+  const result = await pythonWorkerPool.request('process_image_qa', {
+    base64: base64Image,
+    language,
+    level,
+    user_id: userId
+  });
 
-    pythonProcess.stdout.on('data', (data) => {
-      stdout += data.toString();
-    });
+  if (!result.success) {
+    throw new Error(result.error || 'Python processing failed');
+  }
 
-    pythonProcess.stderr.on('data', (data) => {
-      stderr += data.toString();
-    });
+  // Add timestamp to metadata
+  if (result.metadata) {
+    result.metadata.processed_at = new Date().toISOString();
+  }
 
-    pythonProcess.on('close', (code) => {
-      if (code !== 0) {
-        console.error('Python process stderr:', stderr);
-        reject(new Error(`Python process exited with code ${code}: ${stderr}`));
-        return;
-      }
+  return result as ImageAnalysisResponse;
+};
 
-      try {
-        const result = JSON.parse(stdout);
-        
-        if (!result.success) {
-          reject(new Error(result.error || 'Python processing failed'));
-          return;
-        }
-
-        // Add timestamp to metadata
-        if (result.metadata) {
-          result.metadata.processed_at = new Date().toISOString();
-        }
-
-        resolve(result as ImageAnalysisResponse);
-
-      } catch (parseError) {
-        console.error('Failed to parse Python output:', stdout);
-        console.error('Parse error:', parseError);
-        reject(new Error('Failed to parse Python process output'));
-      }
-    });
+// Clients opt into NDJSON streaming with ?stream=true or Accept: application/x-ndjson
+const wantsStream = (req: Request): boolean =>
+  req.query.stream === 'true' || req.query.stream === '1' || (req.get('Accept') || '').includes('application/x-ndjson');
+
+// Relay a streaming worker method as NDJSON: each partial record as it
+// arrives, then the final record. Once the first line is out the status is
+// fixed at 200, so failures are reported as a final {"type": "error"} record.
+const streamFromPython = async (res: Response, method: string, params: unknown): Promise<void> => {
+  res.status(200);
+  res.setHeader('Content-Type', 'application/x-ndjson; charset=utf-8');
+  res.setHeader('Cache-Control', 'no-cache');
+  res.setHeader('X-Accel-Buffering', 'no'); // keep reverse proxies from buffering the stream
+  res.flushHeaders();
+
+  const send = (record: any) => {
+    if (!res.writableEnded) {
+      res.write(JSON.stringify(record) + '\n');
+    }
+  };
 
-    pythonProcess.on('error', (error) => {
-      console.error('Failed to start Python process:', error);
-      reject(error);
-    });
-  });
+  try {
+    const final = await pythonWorkerPool.requestStream(method, params, send);
+    if (final?.metadata) {
+      final.metadata.processed_at = new Date().toISOString();
+    }
+    send(final);
+  } catch (error) {
+    console.error(`Streaming ${method} failed:`, error);
+    send({ type: 'error', success: false, error: error instanceof Error ? error.message : 'Unknown error' });
+  }
+  res.end();
 };
 
 export const analyzeImage = asyncHandler(async (req: AuthRequest, res: Response): Promise<void> => {
@@ -119,10 +106,13 @@ export const analyzeImage = asyncHandler(async (req: AuthRequest, res: Response)
         throw new Error('Base64 data too small to be a valid image');
       }
       
-      // Verify image format by checking magic bytes
+      // Verify image format by checking magic bytes (Python converts anything
+      // the vision API does not accept directly, e.g. HEIC)
       const isValidImage = imageBuffer[0] === 0xFF && imageBuffer[1] === 0xD8 && imageBuffer[2] === 0xFF || // JPEG
                           imageBuffer[0] === 0x89 && imageBuffer[1] === 0x50 && imageBuffer[2] === 0x4E || // PNG
-                          imageBuffer[0] === 0x47 && imageBuffer[1] === 0x49 && imageBuffer[2] === 0x46;   // GIF
+                          imageBuffer[0] === 0x47 && imageBuffer[1] === 0x49 && imageBuffer[2] === 0x46 || // GIF
+                          imageBuffer.toString('ascii', 0, 4) === 'RIFF' && imageBuffer.toString('ascii', 8, 12) === 'WEBP' || // WebP
+                          imageBuffer.toString('ascii', 4, 8) === 'ftyp'; // HEIC/HEIF/AVIF
       
       if (!isValidImage) {
         throw new Error('Base64 data does not appear to be a valid image format');
@@ -163,6 +153,17 @@ export const analyzeImage = asyncHandler(async (req: AuthRequest, res: Response)
     const imagePath = path.join(process.env.UPLOAD_PATH || './uploads', filename);
     await fs.writeFile(imagePath, processedImageBuffer);
 
+    if (wantsStream(req)) {
+      // image_analysis, then each question as soon as it is generated, then done
+      await streamFromPython(res, 'process_image_qa_stream', {
+        base64: base64ImageData,
+        language,
+        level,
+        user_id: userId
+      });
+      return;
+    }
+
     // Process image and generate complete Q&A using Python backend
     const analysisResult = await processImageWithPython(base64ImageData, language, level, userId);
     
@@ -227,11 +228,7 @@ export const evaluateAnswers = asyncHandler(async (req: AuthRequest, res: Respon
   }
 
   try {
-    // Create Python script for evaluation
-    const evaluationScriptPath = path.join(__dirname, '../../evaluate_answers.py');
-    const venvPythonPath = path.join(__dirname, '../../../venv/bin/python3');
-    
-    // Prepare data for Python script
+    // Prepare data for the Python evaluator
     const evaluationData = {
       image_description: imageDescription,
       questions: questions,
@@ -241,74 +238,36 @@ export const evaluateAnswers = asyncHandler(async (req: AuthRequest, res: Respon
       user_id: user?.id
     };
 
-    const pythonProcess = spawn(venvPythonPath, [
-      evaluationScriptPath,
-      '--data', JSON.stringify(evaluationData)
-    ]);
-
-    let stdout = '';
-    let stderr = '';
-
-    pythonProcess.stdout.on('data', (data) => {
-      stdout += data.toString();
-    });
-
-    pythonProcess.stderr.on('data', (data) => {
-      stderr += data.toString();
-    });
+    if (wantsStream(req)) {
+      // an evaluation per answer as it is graded, then the summary
+      await streamFromPython(res, 'evaluate_answers_stream', evaluationData);
+      return;
+    }
 
-    pythonProcess.on('close', (code) => {
-      if (code !== 0) {
-        console.error('Python evaluation process stderr:', stderr);
-        res.status(500).json({
-          success: false,
-          error: `Evaluation failed: ${stderr}`
-        });
-        return;
-      }
+    const evaluationResult = await pythonWorkerPool.request('evaluate_answers', evaluationData);
 
-      try {
-        const evaluationResult = JSON.parse(stdout);
-        
-        if (!evaluationResult.success) {
-          res.status(500).json({
-            success: false,
-            error: evaluationResult.error || 'Evaluation processing failed'
-          });
-          return;
-        }
-
-        // Return evaluation results
-        const response: ApiResponse = {
-          success: true,
-          message: 'Student answers evaluated successfully',
-          data: evaluationResult.evaluation_summary
-        };
-
-        res.status(200).json(response);
-
-      } catch (parseError) {
-        console.error('Failed to parse evaluation output:', stdout);
-        res.status(500).json({
-          success: false,
-          error: 'Failed to parse evaluation results'
-        });
-      }
-    });
-
-    pythonProcess.on('error', (error) => {
-      console.error('Failed to start evaluation process:', error);
+    if (!evaluationResult.success) {
       res.status(500).json({
         success: false,
-        error: 'Failed to start evaluation process'
+        error: evaluationResult.error || 'Evaluation processing failed'
       });
-    });
+      return;
+    }
+
+    // Return evaluation results
+    const response: ApiResponse = {
+      success: true,
+      message: 'Student answers evaluated successfully',
+      data: evaluationResult.evaluation_summary
+    };
+
+    res.status(200).json(response);
 
   } catch (error) {
     console.error('Answer evaluation error:', error);
     res.status(500).json({
       success: false,
-      error: 'Failed to evaluate answers'
+      error: `Evaluation failed: ${error instanceof Error ? error.message : 'Unknown error'}`
     });
   }
 });
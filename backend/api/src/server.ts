@@ -12,6 +12,7 @@ dotenv.config();
 import connectDatabase from './utils/database';
 import routes from './routes';
 import { globalErrorHandler, notFound } from './middleware';
+import { pythonWorkerPool } from './utils/pythonWorkerPool';
 
 const app: Application = express();
 
@@ -125,6 +126,10 @@ app.listen(PORT, '0.0.0.0', () => {
   console.log(`📁 Uploads directory: ${uploadsPath}`);
   console.log(`🌍 CORS origin: ${process.env.CORS_ORIGIN || 'http://localhost:8081'}`);
   console.log(`🔑 JWT secret configured: ${!!process.env.JWT_SECRET}`);
+
+  // Start the Python workers now so models are warm before the first request
+  pythonWorkerPool.start();
+  console.log(`🐍 Python workers: ${process.env.PYTHON_WORKERS || '2'}`);
 });
 
 // Handle unhandled promise rejections
@@ -0,0 +1,246 @@
+import { spawn, ChildProcessWithoutNullStreams } from 'child_process';
+import path from 'path';
+import readline from 'readline';
+
+// Supervisor for the long-lived Python workers in worker.py.
+// Each worker speaks JSON lines over stdin/stdout; requests carry an id so
+// several can be in flight per worker and responses may arrive out of order.
+// Streaming methods send {id, partial} lines before their response; each one
+// goes to the request's onPartial callback.
+// A request that hears nothing back within the timeout (for a stream: since
+// its last partial) is rejected and its worker is presumed stuck: it is
+// retired, replaced, and killed if it doesn't exit.
+
+interface PendingRequest {
+  method: string;
+  params: unknown;
+  resolve: (result: any) => void;
+  reject: (error: Error) => void;
+  attempts: number;
+  onPartial?: (partial: any) => void;
+  // Set once a partial has been delivered; the request can't be retried after that
+  streamed?: boolean;
+  timer?: NodeJS.Timeout;
+}
+
+interface WorkerResponse {
+  id?: string | null;
+  ok?: boolean;
+  result?: any;
+  partial?: any;
+  error?: string;
+  retry?: boolean;
+  event?: 'ready' | 'recycle';
+  reason?: string;
+}
+
+interface WorkerHandle {
+  process: ChildProcessWithoutNullStreams;
+  pending: Map<string, PendingRequest>;
+  accepting: boolean;
+  retired: boolean;
+  killTimer?: NodeJS.Timeout;
+}
+
+const MAX_ATTEMPTS = 2;
+const RESPAWN_DELAY_MS = 1000;
+// How long a retired worker may take to finish its in-flight work before it is killed
+const RETIRE_GRACE_MS = 30000;
+
+export class PythonWorkerPool {
+  private workers: WorkerHandle[] = [];
+  private nextId = 0;
+  private stopped = false;
+
+  constructor(
+    private size: number = parseInt(process.env.PYTHON_WORKERS || '2'),
+    private pythonPath: string = path.join(__dirname, '../../../venv/bin/python3'),
+    private scriptPath: string = path.join(__dirname, '../../worker.py'),
+    private timeoutMs: number = parseInt(process.env.PYTHON_WORKER_TIMEOUT_MS || '180000')
+  ) {}
+
+  start(): void {
+    this.stopped = false;
+    while (this.workers.length < this.size) {
+      this.workers.push(this.spawnWorker());
+    }
+  }
+
+  stop(): void {
+    this.stopped = true;
+    for (const worker of this.workers) {
+      worker.accepting = false;
+      worker.retired = true;
+      worker.process.stdin.end();
+    }
+    this.workers = [];
+  }
+
+  request<T = any>(method: string, params: unknown): Promise<T> {
+    return this.requestStream<T>(method, params);
+  }
+
+  // Call a streaming method: onPartial receives each partial record as it
+  // arrives, and the promise resolves with the final result.
+  requestStream<T = any>(method: string, params: unknown, onPartial?: (partial: any) => void): Promise<T> {
+    if (this.workers.length === 0) {
+      this.start();
+    }
+    return new Promise<T>((resolve, reject) => {
+      this.dispatch({ method, params, resolve, reject, attempts: 0, onPartial });
+    });
+  }
+
+  stats() {
+    return this.workers.map((worker) => ({
+      pid: worker.process.pid,
+      inFlight: worker.pending.size,
+      accepting: worker.accepting
+    }));
+  }
+
+  private dispatch(request: PendingRequest): void {
+    // Least-loaded worker that is still accepting work
+    const candidates = this.workers.filter((worker) => worker.accepting);
+    if (candidates.length === 0) {
+      request.reject(new Error('No Python workers available'));
+      return;
+    }
+    const worker = candidates.reduce((best, current) =>
+      current.pending.size < best.pending.size ? current : best
+    );
+
+    const id = String(this.nextId++);
+    request.attempts += 1;
+    worker.pending.set(id, request);
+    this.armTimer(worker, id, request);
+    worker.process.stdin.write(JSON.stringify({ id, method: request.method, params: request.params }) + '\n');
+  }
+
+  private armTimer(worker: WorkerHandle, id: string, request: PendingRequest): void {
+    this.settle(request);
+    if (this.timeoutMs > 0) {
+      request.timer = setTimeout(() => this.timeOut(worker, id), this.timeoutMs);
+    }
+  }
+
+  private timeOut(worker: WorkerHandle, id: string): void {
+    const request = worker.pending.get(id);
+    if (!request) {
+      return;
+    }
+    worker.pending.delete(id);
+    request.reject(new Error(`Python worker request '${request.method}' timed out after ${this.timeoutMs} ms`));
+    console.error(`Python worker ${worker.process.pid} did not answer '${request.method}' in time; replacing it`);
+    this.retire(worker, RETIRE_GRACE_MS);
+  }
+
+  // Stop routing work to a worker and start its replacement. It exits once its
+  // in-flight requests finish and stdin is closed; with graceMs it is killed
+  // if it is still running after that long.
+  private retire(worker: WorkerHandle, graceMs?: number): void {
+    if (!worker.retired) {
+      worker.accepting = false;
+      worker.retired = true;
+      worker.process.stdin.end();
+      if (!this.stopped) {
+        this.workers.push(this.spawnWorker());
+      }
+    }
+    if (graceMs !== undefined && !worker.killTimer) {
+      worker.killTimer = setTimeout(() => worker.process.kill('SIGKILL'), graceMs);
+    }
+  }
+
+  private settle(request: PendingRequest): void {
+    if (request.timer) {
+      clearTimeout(request.timer);
+      request.timer = undefined;
+    }
+  }
+
+  private spawnWorker(): WorkerHandle {
+    const child = spawn(this.pythonPath, [this.scriptPath]);
+    const worker: WorkerHandle = { process: child, pending: new Map(), accepting: true, retired: false };
+
+    const lines = readline.createInterface({ input: child.stdout });
+    lines.on('line', (line) => this.handleLine(worker, line));
+
+    child.stderr.on('data', (data) => {
+      process.stderr.write(`[python ${child.pid}] ${data}`);
+    });
+
+    child.on('exit', (code) => {
+      worker.accepting = false;
+      if (worker.killTimer) {
+        clearTimeout(worker.killTimer);
+      }
+      this.workers = this.workers.filter((w) => w !== worker);
+      for (const request of worker.pending.values()) {
+        this.settle(request);
+        request.reject(new Error(`Python worker exited with code ${code}`));
+      }
+      worker.pending.clear();
+      // A retired worker already has a replacement; anything else crashed
+      if (!this.stopped && !worker.retired) {
+        setTimeout(() => {
+          if (!this.stopped) {
+            this.workers.push(this.spawnWorker());
+          }
+        }, RESPAWN_DELAY_MS);
+      }
+    });
+
+    child.on('error', (error) => {
+      console.error('Failed to start Python worker:', error);
+    });
+
+    return worker;
+  }
+
+  private handleLine(worker: WorkerHandle, line: string): void {
+    let message: WorkerResponse;
+    try {
+      message = JSON.parse(line);
+    } catch (parseError) {
+      console.error('Failed to parse Python worker output:', line);
+      return;
+    }
+
+    if (message.event === 'recycle') {
+      this.retire(worker);
+      return;
+    }
+    if (message.event || message.id == null) {
+      return;
+    }
+
+    const request = worker.pending.get(message.id);
+    if (!request) {
+      return;
+    }
+    if (message.partial !== undefined) {
+      request.streamed = true;
+      this.armTimer(worker, message.id, request);
+      try {
+        request.onPartial?.(message.partial);
+      } catch (error) {
+        // A failing consumer (e.g. a client that hung up) must not take the pool down
+        console.error('Python worker stream consumer failed:', error);
+      }
+      return;
+    }
+    worker.pending.delete(message.id);
+    this.settle(request);
+
+    if (message.ok) {
+      request.resolve(message.result);
+    } else if (message.retry && !request.streamed && request.attempts < MAX_ATTEMPTS) {
+      this.dispatch(request);
+    } else {
+      request.reject(new Error(message.error || 'Python worker request failed'));
+    }
+  }
+}
+
+export const pythonWorkerPool = new PythonWorkerPool();
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Long-lived Python worker for the Node.js API.
+
+Instead of starting a new interpreter per HTTP request, the API keeps a few of
+these running (see src/utils/pythonWorkerPool.ts). Each worker imports the
+pipeline once, keeps the detector and API clients warm, and serves requests
+over a JSON-lines protocol on stdin/stdout.
+
+Protocol (one JSON object per line):
+
+    request:  {"id": "42", "method": "process_image_qa", "params": {...}}
+    partial:  {"id": "42", "partial": {...}}     (streaming methods, before the response)
+    response: {"id": "42", "ok": true, "result": {...}}
+              {"id": "42", "ok": false, "error": "...", "error_type": "...", "retry": false}
+    event:    {"event": "ready", "pid": 1234}
+              {"event": "recycle", "reason": "...", "handled": 500}
+
+Methods:
+    process_image_qa  params: base64, language, level, user_id  (same result as process_image_qa.py)
+    process_image_qa_targets  params: base64, targets, user_id  (same result as process_image_qa.py --targets)
+    process_image_qa_stream   params: as process_image_qa; the records of process_image_qa.py --stream:
+                              image_analysis and question records as partials, the done or
+                              error record as the result
+    evaluate_answers  params: evaluation request                (same result as evaluate_answers.py)
+    evaluate_answers_stream   params: as evaluate_answers; the records of evaluate_answers.py --stream:
+                              evaluation records as partials, the summary or error record
+                              as the result
+    ping              params: none  (returns pid, model-call retry/hedge counters and
+                                     single-flight coalescing counters)
+
+Several requests may be in flight at once; responses can arrive out of order
+and are matched by id. After --max-requests requests, or once resident memory
+passes --max-rss-mb, the worker emits a "recycle" event and answers any new
+request with retry=true. It exits once stdin is closed and in-flight work has
+finished, so the supervisor can start a fresh replacement.
+"""
+
+import sys
+import json
+import argparse
+import os
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from process_image_qa import generate_image_qa, generate_image_qa_targets, stream_image_qa, pic_process
+from evaluate_answers import evaluate_request, stream_evaluation
+from api_calls import api_call_stats
+from interface import image_flight
+from utils import qa_flight
+
+
+# Record types that end a stream; sent as the response rather than as a partial
+FINAL_RECORD_TYPES = ("done", "summary", "error")
+
+
+def current_rss_mb():
+    """Resident set size of this process in MiB."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        # Not Linux: fall back to peak RSS (KiB on Linux, bytes on macOS)
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+class Worker:
+    def __init__(self, concurrency, max_requests, max_rss_mb, out):
+        self.max_requests = max_requests
+        self.max_rss_mb = max_rss_mb
+        self.out = out
+        self.processor = pic_process()
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='worker')
+        self.handled = 0
+        self.recycling = False
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.methods = {
+            'process_image_qa': self._process_image_qa,
+            'process_image_qa_targets': self._process_image_qa_targets,
+            'evaluate_answers': evaluate_request,
+            'ping': self._ping,
+        }
+        # Generator methods: every record but the final one goes out as a partial
+        self.stream_methods = {
+            'process_image_qa_stream': self._process_image_qa_stream,
+            'evaluate_answers_stream': stream_evaluation,
+        }
+
+    def _ping(self, params):
+        return {
+            "success": True,
+            "pid": os.getpid(),
+            "api_calls": api_call_stats(),
+            "single_flight": {"image": image_flight.stats(), "qa": qa_flight.stats()},
+        }
+
+    def _process_image_qa(self, params):
+        return generate_image_qa(
+            self.processor,
+            params['base64'],
+            params.get('language', 'Spanish'),
+            params.get('level', 'A2'),
+            params.get('user_id'),
+        )
+
+    def _process_image_qa_stream(self, params):
+        return stream_image_qa(
+            self.processor,
+            params['base64'],
+            params.get('language', 'Spanish'),
+            params.get('level', 'A2'),
+            params.get('user_id'),
+        )
+
+    def _process_image_qa_targets(self, params):
+        return generate_image_qa_targets(
+            self.processor,
+            params['base64'],
+            params['targets'],
+            params.get('user_id'),
+        )
+
+    def warm_up(self):
+        """
+        Load the detector and API client before the first request arrives.
+
+        A failure here (e.g. ANTHROPIC_API_KEY unset) is only logged: exiting
+        would make the pool respawn the worker in a loop, while serving lets
+        each request report the error.
+        """
+        from generate_bounding_box import preload_detector
+        from config import get_anthropic_client
+        from timing import get_sink
+        get_sink()  # reports a bad TIMING_SINK now rather than on the first request
+        preload_detector()
+        try:
+            get_anthropic_client()
+        except Exception as e:
+            print(f"Warm-up: Anthropic client unavailable ({e}); requests will fail until this is fixed",
+                  file=sys.stderr)
+
+    def send(self, message):
+        line = json.dumps(message, ensure_ascii=False)
+        with self._write_lock:
+            self.out.write(line + '\n')
+            self.out.flush()
+
+    def submit(self, line):
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            method = request['method']
+        except (json.JSONDecodeError, KeyError, AttributeError) as e:
+            self.send({"id": None, "ok": False, "error": f"Invalid request: {str(e)}",
+                       "error_type": type(e).__name__, "retry": False})
+            return
+
+        if self.recycling:
+            self.send({"id": request_id, "ok": False, "error": "Worker is recycling",
+                       "error_type": "WorkerRecycling", "retry": True})
+            return
+
+        streaming = method in self.stream_methods
+        handler = self.stream_methods.get(method) or self.methods.get(method)
+        if handler is None:
+            self.send({"id": request_id, "ok": False, "error": f"Unknown method: {method}",
+                       "error_type": "ValueError", "retry": False})
+            return
+
+        self.executor.submit(self._run, request_id, handler, request.get('params') or {}, streaming)
+
+    def _stream(self, request_id, records):
+        """Send each record as a partial and return the final one."""
+        final = None
+        # Run the generator to the end so its usage scope closes before the response
+        for record in records:
+            if record.get("type") in FINAL_RECORD_TYPES:
+                final = record
+            else:
+                self.send({"id": request_id, "partial": record})
+        if final is None:
+            raise RuntimeError("Stream ended without a final record")
+        return final
+
+    def _run(self, request_id, handler, params, streaming=False):
+        try:
+            result = self._stream(request_id, handler(params)) if streaming else handler(params)
+            self.send({"id": request_id, "ok": True, "result": result})
+        except Exception as e:
+            sys.stderr.write(f"Error in worker request {request_id}: {str(e)}\n")
+            self.send({
+                "id": request_id,
+                "ok": False,
+                "error": f"Unexpected error: {str(e)}",
+                "error_type": type(e).__name__,
+                "traceback": traceback.format_exc() if os.environ.get('DEBUG') else None,
+                "retry": False,
+            })
+        finally:
+            self._after_request()
+
+    def _after_request(self):
+        with self._lock:
+            self.handled += 1
+            if self.recycling:
+                return
+            reason = None
+            if self.max_requests and self.handled >= self.max_requests:
+                reason = f"handled {self.handled} requests"
+            elif self.max_rss_mb and current_rss_mb() > self.max_rss_mb:
+                reason = f"resident memory above {self.max_rss_mb} MiB"
+            if reason is None:
+                return
+            self.recycling = True
+        sys.stderr.write(f"Worker {os.getpid()} recycling: {reason}\n")
+        self.send({"event": "recycle", "reason": reason, "handled": self.handled})
+
+    def serve(self, stdin):
+        self.send({"event": "ready", "pid": os.getpid()})
+        for line in stdin:
+            line = line.strip()
+            if line:
+                self.submit(line)
+        # stdin closed: finish what is in flight, then exit
+        self.executor.shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Persistent JSON-lines worker for the image/Q&A pipeline')
+    parser.add_argument('--concurrency', type=int,
+                        default=int(os.environ.get('PYTHON_WORKER_CONCURRENCY', '4')),
+                        help='Requests handled in parallel by this worker')
+    parser.add_argument('--max-requests', type=int,
+                        default=int(os.environ.get('PYTHON_WORKER_MAX_REQUESTS', '500')),
+                        help='Recycle after this many requests (0 disables)')
+    parser.add_argument('--max-rss-mb', type=int,
+                        default=int(os.environ.get('PYTHON_WORKER_MAX_RSS_MB', '4096')),
+                        help='Recycle once resident memory exceeds this many MiB (0 disables)')
+    parser.add_argument('--no-warm-up', action='store_true', help='Skip preloading models at startup')
+    args = parser.parse_args()
+
+    # Keep stdout for the protocol; anything else printed goes to stderr
+    protocol_out = sys.stdout
+    sys.stdout = sys.stderr
+
+    worker = Worker(args.concurrency, args.max_requests, args.max_rss_mb, protocol_out)
+    if not args.no_warm_up:
+        worker.warm_up()
+    worker.serve(sys.stdin)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Speed and box accuracy of the detector's CPU inference paths.
+
+Runs make_boxes() over the benchmark image set once per DETECTOR_BACKEND
+(detector_backends.py), each backend in its own process so load time and
+peak memory aren't shared, and compares every backend's boxes with eager's:
+
+    speed       load_s (including quantization or ONNX export), warmup_s
+                (first call, where torch.compile compiles), per-call wall
+                time and max_rss_mb
+    accuracy    for every (image, label) pair, the IoU of the best box with
+                eager's and the difference in its score
+
+make_boxes runs with threshold 0 so every label gets its best box. IoU is
+taken over the pairs eager scores at or above --threshold (what production
+would report), score deltas over all pairs, and "flips" counts the pairs
+that land on different sides of --threshold. A backend passes when its
+lowest IoU is at least --min-iou and its largest score delta at most
+--max-score-delta. Images go through preprocess_image first, as in the
+pipeline.
+
+The detector is loaded from the local Hugging Face cache (HF_HUB_OFFLINE=1),
+so run the pipeline once with network access first.
+
+Usage:
+    python3 detector_benchmark.py                                  # every backend, report on stdout
+    python3 detector_benchmark.py --backends eager,int8,onnx --iterations 5 --output detector.json
+    python3 detector_benchmark.py --labels "dog,ball,grass" --images ~/photos
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARK_DIR)
+PIC_PROCESS_DIR = os.path.join(BACKEND_DIR, 'pic_process')
+
+sys.path.insert(0, BENCHMARK_DIR)
+from images import load_images
+from run_benchmark import summarize, max_rss_mb, git_commit
+
+sys.path.append(PIC_PROCESS_DIR)
+from detector_backends import BACKENDS
+
+# Everyday objects like the ones get_image_words returns; they fit one prompt
+# chunk, as most real requests do
+DEFAULT_LABELS = ['person', 'dog', 'cat', 'car', 'bicycle', 'chair', 'table', 'cup',
+                  'book', 'bottle', 'laptop', 'plant', 'window', 'door', 'tree', 'sky']
+
+
+def run_worker(args):
+    """Time make_boxes under the DETECTOR_BACKEND this process was started with."""
+    from image_input import ImageInput
+    from preprocess import preprocess_image
+    from generate_bounding_box import make_boxes, detector_registry, detector_stats
+
+    images = [(name, preprocess_image(ImageInput(data)).pil) for name, data in load_images(args.images)]
+    labels = args.labels
+
+    started = time.perf_counter()
+    detector_registry.get()
+    load_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    make_boxes(images[0][1], labels, threshold=0.0)
+    warmup_s = time.perf_counter() - started
+
+    latencies, boxes = [], {}
+    for _ in range(args.iterations):
+        for name, image in images:
+            started = time.perf_counter()
+            rows = make_boxes(image, labels, threshold=0.0)
+            latencies.append(time.perf_counter() - started)
+            boxes[name] = rows.tolist()
+
+    return {
+        "load_s": round(load_s, 3),
+        "warmup_s": round(warmup_s, 3),
+        "calls": len(latencies),
+        "wall_ms": summarize(latencies),
+        "max_rss_mb": max_rss_mb(),
+        "detector": detector_stats(),
+        "boxes": boxes,
+    }
+
+
+def run_backend(backend, args):
+    """Run one backend's worker process; returns its report (or the error it failed with)."""
+    command = [sys.executable, os.path.abspath(__file__), '--worker', '--iterations', str(args.iterations),
+               '--labels', ','.join(args.labels)]
+    if args.images:
+        command += ['--images', args.images]
+    env = {**os.environ, 'DETECTOR_BACKEND': backend, 'USAGE_LOG': ''}
+    env.setdefault('HF_HUB_OFFLINE', '1')
+    env.setdefault('TRANSFORMERS_OFFLINE', '1')
+
+    print(f"Running {backend}...", file=sys.stderr)
+    process = subprocess.run(command, env=env, stdout=subprocess.PIPE, text=True)
+    if process.returncode != 0:
+        return {"error": f"worker exited with status {process.returncode}"}
+    return json.loads(process.stdout)
+
+
+def iou(a, b):
+    """Intersection over union of two [x0, y0, x1, y1] boxes."""
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    intersection = max(width, 0) * max(height, 0)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def compare_boxes(baseline, candidate, args):
+    """Accuracy of candidate's boxes against baseline's, both {image: rows of [x0, y0, x1, y1, score]}."""
+    ious, deltas, flips = [], [], 0
+    for name, rows in baseline.items():
+        for expected, actual in zip(rows, candidate.get(name, [])):
+            deltas.append(abs(actual[4] - expected[4]))
+            if (expected[4] >= args.threshold) != (actual[4] >= args.threshold):
+                flips += 1
+            if expected[4] >= args.threshold:
+                ious.append(iou(expected[:4], actual[:4]))
+
+    report = {
+        "pairs": len(deltas),
+        "pairs_above_threshold": len(ious),
+        "iou_mean": round(sum(ious) / len(ious), 4) if ious else None,
+        "iou_min": round(min(ious), 4) if ious else None,
+        "score_delta_max": round(max(deltas), 4) if deltas else None,
+        "flips": flips,
+    }
+    report["passed"] = bool(deltas) and (not ious or min(ious) >= args.min_iou) \
+        and max(deltas) <= args.max_score_delta
+    return report
+
+
+def run(args):
+    images = load_images(args.images)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "images": [name for name, _ in images],
+            "labels": args.labels,
+            "iterations": args.iterations,
+            "threshold": args.threshold,
+            "min_iou": args.min_iou,
+            "max_score_delta": args.max_score_delta,
+        },
+        "backends": {},
+    }
+
+    baseline = None
+    for backend in args.backends:
+        result = run_backend(backend, args)
+        boxes = result.pop("boxes", None)
+        if backend == 'eager':
+            baseline = boxes
+        elif baseline is not None and boxes is not None:
+            result["accuracy"] = compare_boxes(baseline, boxes, args)
+        report["backends"][backend] = result
+
+    eager_p50 = report["backends"].get('eager', {}).get("wall_ms", {}).get("p50")
+    for result in report["backends"].values():
+        p50 = result.get("wall_ms", {}).get("p50")
+        if eager_p50 and p50:
+            result["speedup_p50"] = round(eager_p50 / p50, 2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark and accuracy-check the detector inference backends')
+    parser.add_argument('--backends', default=','.join(BACKENDS),
+                        help=f'Comma-separated backends to run (default: all of {",".join(BACKENDS)})')
+    parser.add_argument('--iterations', type=int, default=3, help='Timed passes over the image set per backend')
+    parser.add_argument('--images', help='Directory of images to use instead of the bundled set')
+    parser.add_argument('--labels', default=','.join(DEFAULT_LABELS), help='Comma-separated labels to detect')
+    parser.add_argument('--threshold', type=float, default=0.4, help='Score at which a label counts as found')
+    parser.add_argument('--min-iou', type=float, default=0.9, help='Lowest IoU with eager a backend may have')
+    parser.add_argument('--max-score-delta', type=float, default=0.05,
+                        help='Largest score difference from eager a backend may have')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    args.labels = [label.strip() for label in args.labels.split(',') if label.strip()]
+    if args.worker:
+        print(json.dumps(run_worker(args)))
+        return 0
+
+    args.backends = [b for b in args.backends.split(',') if b]
+    unknown = set(args.backends) - set(BACKENDS)
+    if unknown:
+        parser.error(f"Unknown backend(s): {', '.join(sorted(unknown))}")
+    # Eager is the accuracy baseline, so it always runs first
+    args.backends = ['eager'] + [b for b in args.backends if b != 'eager']
+
+    report = run(args)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    failed = [name for name, result in report["backends"].items()
+              if "error" in result or not result.get("accuracy", {}).get("passed", True)]
+    if failed:
+        print(f"Failed: {', '.join(failed)}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+The benchmark image set.
+
+The set always includes the small JPEG fixture at api/test_base64.txt. It adds
+a few deterministic synthetic photos covering the cases preprocessing handles
+differently: a within-budget JPEG that passes through untouched, a 12 MP
+phone-sized JPEG with EXIF rotation, a PNG with transparency and a WebP. The
+synthetic photos are generated into benchmark/images/ on first use, so the
+repo doesn't carry binary files. Any other image dropped into that directory
+(.jpg, .jpeg, .png, .webp, .heic) is picked up as well.
+"""
+
+import os
+import random
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGES_DIR = os.path.join(BENCHMARK_DIR, 'images')
+FIXTURE_BASE64 = os.path.join(BENCHMARK_DIR, '..', 'api', 'test_base64.txt')
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.heic')
+
+# name -> (size, format, save options)
+SYNTHETIC_IMAGES = {
+    'desk_640.jpg': ((640, 480), 'JPEG', {'quality': 90}),
+    'phone_4032x3024_rotated.jpg': ((4032, 3024), 'JPEG', {'quality': 92, 'orientation': 6}),
+    'sticker_1024_alpha.png': ((1024, 1024), 'PNG', {}),
+    'street_1600x1200.webp': ((1600, 1200), 'WEBP', {'quality': 85}),
+}
+
+
+def _draw_scene(size, seed, alpha=False):
+    """A cluttered scene of coloured shapes and noise, so codecs do real work."""
+    from PIL import Image, ImageDraw, ImageFilter
+
+    rng = random.Random(seed)
+    width, height = size
+    image = Image.new('RGBA' if alpha else 'RGB', size, (0, 0, 0, 0) if alpha else (rng.randrange(256),) * 3)
+    draw = ImageDraw.Draw(image)
+    for _ in range(60):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1, y1 = x0 + rng.randrange(width // 8, width // 2), y0 + rng.randrange(height // 8, height // 2)
+        colour = tuple(rng.randrange(256) for _ in range(3)) + ((rng.randrange(128, 256),) if alpha else ())
+        shape = rng.choice([draw.rectangle, draw.ellipse])
+        shape([x0, y0, x1, y1], fill=colour)
+    noise = Image.effect_noise(size, 40).convert(image.mode)
+    image = Image.blend(image, noise, 0.15)
+    return image.filter(ImageFilter.SMOOTH)
+
+
+def ensure_images():
+    """Generate any missing synthetic images. Returns the images directory."""
+    os.makedirs(IMAGES_DIR, exist_ok=True)
+    for seed, (name, (size, fmt, options)) in enumerate(sorted(SYNTHETIC_IMAGES.items())):
+        path = os.path.join(IMAGES_DIR, name)
+        if os.path.exists(path):
+            continue
+        options = dict(options)
+        orientation = options.pop('orientation', None)
+        image = _draw_scene(size, seed, alpha=fmt == 'PNG')
+        if orientation:
+            exif = image.getexif()
+            exif[0x0112] = orientation
+            options['exif'] = exif.tobytes()
+        image.save(path, format=fmt, **options)
+    return IMAGES_DIR
+
+
+def load_images(directory=None):
+    """
+    Return [(name, bytes)] for the benchmark set, sorted by name.
+
+    Args:
+        directory (str): Use the images in this directory instead of the bundled set
+    """
+    import base64
+
+    images = []
+    if directory is None:
+        directory = ensure_images()
+        with open(FIXTURE_BASE64) as f:
+            images.append(('fixture_test_base64.jpg', base64.b64decode(f.read().strip())))
+
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(directory, name), 'rb') as f:
+                images.append((name, f.read()))
+    if not images:
+        raise ValueError(f"No images found in {directory}")
+    return sorted(images)
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the image -> Q&A -> evaluation pipeline.
+
+Starts the local API stub (stub_server.py) in a separate process, points the
+Anthropic SDK at it and runs pic_process.image_to_json, process_image_to_qa
+and evaluate_student_answers over the bundled image set. For each stage it
+reports wall time per call (mean and percentiles), process CPU time,
+throughput at the chosen concurrency and, in a separate tracemalloc pass so
+tracing doesn't skew the timings, Python allocation peak and net growth per
+call. The report is JSON, so two commits can be compared with --compare.
+
+The detector is the real Grounding DINO model. The model has to be in the
+local Hugging Face cache (run the pipeline once with network access); the
+benchmark runs with HF_HUB_OFFLINE=1. tracemalloc only sees Python-level
+allocations, not torch's tensor memory; max_rss_mb covers both.
+
+Usage:
+    python3 run_benchmark.py                                # defaults, report on stdout
+    python3 run_benchmark.py --iterations 5 --concurrency 4 --output after.json
+    python3 run_benchmark.py --latency fixed:0 --stages image_to_json
+    python3 run_benchmark.py --error-rate 0.1               # exercise retries
+    python3 run_benchmark.py --output after.json --compare before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARK_DIR)
+PIC_PROCESS_DIR = os.path.join(BACKEND_DIR, 'pic_process')
+QUESTION_DIR = os.path.join(BACKEND_DIR, 'question')
+
+sys.path.insert(0, BENCHMARK_DIR)
+from images import load_images
+from stub_server import add_stub_arguments
+
+STAGES = ['image_to_json', 'process_image_to_qa', 'evaluate_student_answers']
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(values):
+    """Mean and percentiles (in ms) of a list of durations in seconds."""
+    if not values:
+        return {}
+    ms = [v * 1000 for v in values]
+    return {
+        "mean": round(sum(ms) / len(ms), 2),
+        "p50": round(percentile(ms, 50), 2),
+        "p90": round(percentile(ms, 90), 2),
+        "p99": round(percentile(ms, 99), 2),
+        "max": round(max(ms), 2),
+    }
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def max_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 2**20 if sys.platform == 'darwin' else peak / 2**10, 1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=BACKEND_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_stub(args):
+    """Run stub_server.py on a free port; returns (process, base_url)."""
+    command = [sys.executable, os.path.join(BENCHMARK_DIR, 'stub_server.py'), '--port', '0',
+               '--error-rate', str(args.error_rate), '--error-status', str(args.error_status),
+               '--stream-chunks', str(args.stream_chunks)]
+    for spec in args.latency:
+        command += ['--latency', spec]
+    if args.seed is not None:
+        command += ['--seed', str(args.seed)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline().strip()
+    if not line.startswith('listening on '):
+        process.kill()
+        raise RuntimeError(f"API stub failed to start: {line!r}")
+    return process, line[len('listening on '):]
+
+
+def configure_environment(base_url, warm_cache):
+    """Settings that must be in place before the pipeline modules are imported."""
+    os.environ['ANTHROPIC_BASE_URL'] = base_url
+    os.environ.setdefault('ANTHROPIC_API_KEY', 'benchmark-stub-key')
+    os.environ.setdefault('HF_HUB_OFFLINE', '1')
+    os.environ.setdefault('TRANSFORMERS_OFFLINE', '1')
+    # Stub calls aren't real spend; keep them out of the usage log
+    os.environ['USAGE_LOG'] = ''
+    if not warm_cache:
+        # Measure the work itself, not cache lookups
+        os.environ['RESULT_CACHE_ENTRIES'] = '0'
+        os.environ['QA_CACHE_ENTRIES'] = '0'
+    for path in (PIC_PROCESS_DIR, QUESTION_DIR):
+        if path not in sys.path:
+            sys.path.append(path)
+
+
+class Pipeline:
+    """The three benchmarked stages, with the inputs each needs from the one before."""
+
+    def __init__(self, language, level):
+        from interface import pic_process
+        from utils import process_image_to_qa, evaluate_student_answers
+        self.processor = pic_process()
+        self.process_image_to_qa = process_image_to_qa
+        self.evaluate_student_answers = evaluate_student_answers
+        self.language = language
+        self.level = level
+
+    def image_to_json(self, image):
+        from image_input import ImageInput
+        result = self.processor.image_to_json(ImageInput(image))
+        if not result.get("success"):
+            raise RuntimeError(result.get("message"))
+        return {
+            "description": result["description"],
+            "primary_object": result.get("primary_object"),
+            "objects": result.get("objects", []),
+        }
+
+    def qa(self, pic_output):
+        result = self.process_image_to_qa(pic_output, self.language, self.level)
+        if result.get("error"):
+            raise RuntimeError(result.get("message"))
+        return result
+
+    def evaluate(self, qa_result):
+        qa_sets = qa_result["questions"]
+        answers = [qa["expected_answer"] for qa in qa_sets]
+        result = self.evaluate_student_answers(
+            {"description": qa_result["image_context"]["description"]},
+            {"language": self.language, "level": self.level},
+            qa_sets, answers)
+        failed = sum(1 for evaluation in result["evaluations"] if evaluation.get("error"))
+        if failed:
+            raise RuntimeError(f"{failed} evaluations failed")
+        return result
+
+
+def run_stage(fn, inputs, concurrency):
+    """
+    Call fn on every input with `concurrency` threads.
+
+    Returns:
+        tuple: (outputs, stage report) where outputs holds None for failed calls
+    """
+    latencies, errors = [], []
+
+    def timed(item):
+        started = time.perf_counter()
+        try:
+            return fn(item)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+            return None
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    cpu_before = cpu_seconds()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outputs = list(executor.map(timed, inputs))
+    wall = time.perf_counter() - started
+    cpu = cpu_seconds() - cpu_before
+
+    return outputs, {
+        "calls": len(inputs),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "concurrency": concurrency,
+        "wall_ms": summarize(latencies),
+        "batch_wall_s": round(wall, 3),
+        "cpu_s": round(cpu, 3),
+        "cpu_ms_per_call": round(cpu / len(inputs) * 1000, 2) if inputs else None,
+        "throughput_per_s": round(len(inputs) / wall, 3) if wall else None,
+    }
+
+
+def measure_allocations(fn, inputs):
+    """Peak and net Python allocations per call, traced one call at a time."""
+    peaks, nets = [], []
+    tracemalloc.start()
+    try:
+        for item in inputs:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            try:
+                fn(item)
+            except Exception:
+                continue
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            nets.append(current - before)
+    finally:
+        tracemalloc.stop()
+    if not peaks:
+        return {}
+    return {
+        "peak_kib_mean": round(sum(peaks) / len(peaks) / 1024, 1),
+        "peak_kib_max": round(max(peaks) / 1024, 1),
+        "net_kib_mean": round(sum(nets) / len(nets) / 1024, 1),
+    }
+
+
+def run(args):
+    images = load_images(args.images)
+    stub = None
+    if args.base_url:
+        base_url = args.base_url
+    else:
+        stub, base_url = start_stub(args)
+    configure_environment(base_url, args.warm_cache)
+
+    try:
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "images": [name for name, _ in images],
+                "iterations": args.iterations,
+                "concurrency": args.concurrency,
+                "latency": args.latency or ["lognormal:0.8,0.35"],
+                "error_rate": args.error_rate,
+                "warm_cache": args.warm_cache,
+                "api": "stub" if stub else base_url,
+            },
+            "stages": {},
+        }
+
+        # Import and warm-up (detector load, first connections) are reported separately
+        started = time.perf_counter()
+        pipeline = Pipeline(args.language, args.level)
+        report["import_s"] = round(time.perf_counter() - started, 3)
+        started = time.perf_counter()
+        warm = pipeline.image_to_json(images[0][1])
+        warm_qa = pipeline.qa(warm)
+        pipeline.evaluate(warm_qa)
+        report["warmup_s"] = round(time.perf_counter() - started, 3)
+
+        stage_fns = {
+            'image_to_json': pipeline.image_to_json,
+            'process_image_to_qa': pipeline.qa,
+            'evaluate_student_answers': pipeline.evaluate,
+        }
+        inputs = [data for _, data in images] * args.iterations
+        for stage in STAGES:
+            outputs, stage_report = run_stage(stage_fns[stage], inputs, args.concurrency)
+            if stage in args.stages:
+                if not args.no_alloc:
+                    stage_report["alloc"] = measure_allocations(stage_fns[stage], inputs[:len(images)])
+                report["stages"][stage] = stage_report
+            # Later stages consume this stage's successful outputs
+            inputs = [output for output in outputs if output is not None]
+            if not inputs or stage == args.stages[-1]:
+                break
+
+        report["max_rss_mb"] = max_rss_mb()
+        from api_calls import api_call_stats
+        report["api_calls"] = api_call_stats()
+        return report
+    finally:
+        if stub:
+            stub.terminate()
+            stub.wait()
+
+
+def compare(report, baseline):
+    """Per-stage changes between two reports, as printable lines."""
+    lines = [f"Comparing {baseline['meta'].get('commit')} -> {report['meta'].get('commit')}"]
+    for stage, current in report["stages"].items():
+        before = baseline.get("stages", {}).get(stage)
+        if not before:
+            continue
+        lines.append(f"{stage}:")
+        for label, get in [
+            ("p50 ms", lambda r: r["wall_ms"].get("p50")),
+            ("p99 ms", lambda r: r["wall_ms"].get("p99")),
+            ("cpu ms/call", lambda r: r.get("cpu_ms_per_call")),
+            ("throughput/s", lambda r: r.get("throughput_per_s")),
+            ("alloc peak KiB", lambda r: r.get("alloc", {}).get("peak_kib_mean")),
+        ]:
+            old, new = get(before), get(current)
+            if old is None or new is None:
+                continue
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            lines.append(f"  {label:<15} {old:>10} -> {new:<10} ({change})")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline pipeline benchmark against a local API stub')
+    parser.add_argument('--iterations', type=int, default=3, help='Passes over the image set per stage')
+    parser.add_argument('--concurrency', type=int, default=1, help='Calls in flight per stage')
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help=f'Comma-separated stages to report (default: all of {",".join(STAGES)})')
+    parser.add_argument('--images', help='Directory of images to use instead of the bundled set')
+    parser.add_argument('--language', default='Spanish')
+    parser.add_argument('--level', default='A2')
+    parser.add_argument('--warm-cache', action='store_true', help='Leave the result and Q&A caches enabled')
+    parser.add_argument('--no-alloc', action='store_true', help='Skip the tracemalloc pass')
+    parser.add_argument('--base-url', help='Use an already running API (stub or real) instead of starting the stub')
+    parser.add_argument('--seed', type=int, help='Random seed for the stub')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    parser.add_argument('--compare', help='Baseline report to compare against (printed to stderr)')
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    args.stages = [s for s in args.stages.split(',') if s]
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stage(s): {', '.join(sorted(unknown))}")
+    args.stages = [s for s in STAGES if s in args.stages]
+
+    report = run(args)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print('\n'.join(compare(report, baseline)), file=sys.stderr)
+
+    return 1 if any(stage["errors"] for stage in report["stages"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
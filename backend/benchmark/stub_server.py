@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Anthropic Messages API.
+
+Answers POST /v1/messages (plain and streamed) with canned, schema-valid
+replies for every tool the pipeline forces (record_objects, record_summary,
+record_qa_sets, record_evaluation, ...), after a delay drawn from a
+configurable latency distribution. Point the SDK at it with
+ANTHROPIC_BASE_URL=http://127.0.0.1:<port>.
+
+The Message Batches endpoints are emulated too: a batch created with
+POST /v1/messages/batches stays in_progress for a --batch-latency delay, then
+ends with one canned result per request (errored at --error-rate), served
+from /v1/messages/batches/<id>/results. Cancel and list are supported.
+
+Usage:
+    python3 stub_server.py --port 8765
+    python3 stub_server.py --latency lognormal:0.8,0.4 --latency record_qa_sets=lognormal:2.5,0.3
+    python3 stub_server.py --error-rate 0.05 --error-status 529
+    python3 stub_server.py --batch-latency uniform:2,5
+
+Latency specs (seconds):
+    fixed:S               always S
+    uniform:LO,HI         uniform between LO and HI
+    normal:MEAN,SD        normal, clipped at 0
+    lognormal:MEDIAN,SIGMA  log-normal with the given median (the usual API shape)
+
+GET /stats returns request counts per tool (batch requests are counted as
+batch_<tool>).
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_OBJECTS = ["table", "chair", "book", "cup", "lamp", "window", "plant", "laptop"]
+
+CANNED_SUMMARY = (
+    "A person sits at a wooden table by a window, reading a book while a cup of "
+    "coffee cools beside a laptop. A small plant and a desk lamp complete the "
+    "quiet study corner, lit by soft afternoon light."
+)
+
+CANNED_QA = [
+    {"question": "¿Qué hay encima de la mesa?", "expected_answer": "Hay un libro, una taza y un portátil.",
+     "question_type": "vocabulary", "difficulty": 2, "points": 30},
+    {"question": "¿Qué hace la persona?", "expected_answer": "La persona lee un libro.",
+     "question_type": "comprehension", "difficulty": 2, "points": 30},
+    {"question": "¿Dónde está la planta?", "expected_answer": "La planta está cerca de la ventana.",
+     "question_type": "grammar", "difficulty": 3, "points": 40},
+]
+
+
+class Latency:
+    """A latency distribution parsed from a spec like "lognormal:0.8,0.4"."""
+
+    def __init__(self, spec):
+        self.spec = spec
+        kind, _, params = spec.partition(":")
+        values = [float(v) for v in params.split(",") if v]
+        samplers = {
+            "fixed": lambda s: s,
+            "uniform": random.uniform,
+            "normal": lambda mean, sd: max(0.0, random.gauss(mean, sd)),
+            "lognormal": lambda median, sigma: random.lognormvariate(math.log(median), sigma),
+        }
+        if kind not in samplers:
+            raise ValueError(f"Unknown latency distribution '{kind}' (expected one of {', '.join(samplers)})")
+        self._sample = lambda: samplers[kind](*values)
+
+    def sample(self):
+        return self._sample()
+
+
+def _user_text(body):
+    """All text the request sends in user messages."""
+    parts = []
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+            continue
+        for block in content or []:
+            if block.get("type") == "text":
+                parts.append(block["text"])
+    return "\n".join(parts)
+
+
+def _field(text, label, default=""):
+    match = re.search(rf"^{re.escape(label)}:\s*(.*)$", text, re.MULTILINE)
+    return match.group(1).strip() if match else default
+
+
+def canned_tool_input(tool, body):
+    """Schema-valid input for the forced tool, shaped by the request where it matters."""
+    text = _user_text(body)
+    if tool == "record_objects":
+        return {"objects": CANNED_OBJECTS}
+    if tool == "record_summary":
+        return {"summary": CANNED_SUMMARY}
+    if tool == "record_qa_sets":
+        return {
+            "level": _field(text, "Level", "A2"),
+            "language": _field(text, "Target language", "Spanish"),
+            "qa_sets": CANNED_QA,
+        }
+    if tool == "record_evaluation":
+        max_points = float(_field(text, "Max Points", "100") or 100)
+        earned = round(max_points * 0.7, 1)
+        return {
+            "question_id": int(_field(text, "Question ID", "1") or 1),
+            "question": _field(text, "Question"),
+            "expected_answer": _field(text, "Expected Answer"),
+            "student_answer": _field(text, "Student Answer"),
+            "points_earned": earned,
+            "max_points": max_points,
+            "percentage": 70,
+            "feedback": "Good answer overall; watch the article agreement.",
+            "areas_for_improvement": ["article agreement"],
+            "strengths": ["vocabulary", "sentence structure"],
+        }
+    if tool == "record_questions":
+        return {"level": "A2", "questions": [qa["question"] for qa in CANNED_QA]}
+    if tool == "record_feedback":
+        return {"question": "", "answer": "", "points": 70, "feedback": "Good answer."}
+    return {}
+
+
+def _timestamp(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class StubState:
+    def __init__(self, default_latency, tool_latency, error_rate, error_status, stream_chunks, batch_latency):
+        self.default_latency = default_latency
+        self.tool_latency = tool_latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stream_chunks = stream_chunks
+        self.batch_latency = batch_latency
+        self._seen_prefixes = set()
+        # Re-entrant: batch results are built (and counted) while it is held
+        self._lock = threading.RLock()
+        self.counts = {}
+        self.batches = {}
+
+    def latency_for(self, tool):
+        return self.tool_latency.get(tool, self.default_latency).sample()
+
+    def count(self, key):
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def usage(self, body, output):
+        """Token counts roughly proportional to payload size, with simulated prompt caching."""
+        system = json.dumps(body.get("system", ""), sort_keys=True)
+        system_tokens = len(system) // 4
+        input_tokens = max(1, len(json.dumps(body.get("messages", []))) // 4)
+        digest = hashlib.sha256(system.encode()).hexdigest()
+        with self._lock:
+            cached = digest in self._seen_prefixes
+            self._seen_prefixes.add(digest)
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": max(1, len(output) // 4),
+            "cache_creation_input_tokens": 0 if cached else system_tokens,
+            "cache_read_input_tokens": system_tokens if cached else 0,
+        }
+
+    def message(self, body):
+        """(Messages API reply, text of its output) for a request body."""
+        tool = (body.get("tool_choice") or {}).get("name") or "text"
+        if tool == "text":
+            content = {"type": "text", "text": CANNED_SUMMARY}
+            output = CANNED_SUMMARY
+        else:
+            tool_input = canned_tool_input(tool, body)
+            content = {"type": "tool_use", "id": f"toolu_stub_{uuid.uuid4().hex[:12]}", "name": tool, "input": tool_input}
+            output = json.dumps(tool_input, ensure_ascii=False)
+        message = {
+            "id": f"msg_stub_{uuid.uuid4().hex[:12]}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", "stub"),
+            "content": [content],
+            "stop_reason": "end_turn" if tool == "text" else "tool_use",
+            "stop_sequence": None,
+            "usage": self.usage(body, output),
+        }
+        return message, output
+
+    def create_batch(self, requests):
+        now = time.time()
+        batch_id = f"msgbatch_stub_{uuid.uuid4().hex[:16]}"
+        with self._lock:
+            self.batches[batch_id] = {
+                "requests": requests,
+                "created_at": now,
+                "ends_at": now + self.batch_latency.sample(),
+                "cancel_initiated_at": None,
+                "results": None,
+            }
+        for request in requests:
+            self.count(f"batch_{(request['params'].get('tool_choice') or {}).get('name') or 'text'}")
+        return batch_id
+
+    def _finish_batch(self, batch):
+        """Produce a batch's results once it is due; call with the lock held."""
+        if batch["results"] is not None or (batch["cancel_initiated_at"] is None and time.time() < batch["ends_at"]):
+            return
+        results = []
+        for request in batch["requests"]:
+            if batch["cancel_initiated_at"] is not None:
+                result = {"type": "canceled"}
+            elif self.error_rate and random.random() < self.error_rate:
+                result = {"type": "errored", "error": {"type": "error", "error": {
+                    "type": "overloaded_error", "message": "Stub error"}}}
+            else:
+                result = {"type": "succeeded", "message": self.message(request["params"])[0]}
+            results.append({"custom_id": request["custom_id"], "result": result})
+        batch["results"] = results
+        batch["ended_at"] = time.time()
+
+    def batch(self, batch_id, base_url):
+        """The MessageBatch object for batch_id, or None."""
+        with self._lock:
+            batch = self.batches.get(batch_id)
+            if batch is None:
+                return None
+            self._finish_batch(batch)
+            counts = {"processing": 0, "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+            if batch["results"] is None:
+                counts["processing"] = len(batch["requests"])
+                status = "canceling" if batch["cancel_initiated_at"] else "in_progress"
+            else:
+                for entry in batch["results"]:
+                    counts[entry["result"]["type"]] += 1
+                status = "ended"
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": status,
+            "request_counts": counts,
+            "created_at": _timestamp(batch["created_at"]),
+            "expires_at": _timestamp(batch["created_at"] + timedelta(days=1).total_seconds()),
+            "ended_at": _timestamp(batch["ended_at"]) if status == "ended" else None,
+            "cancel_initiated_at": _timestamp(batch["cancel_initiated_at"]) if batch["cancel_initiated_at"] else None,
+            "archived_at": None,
+            "results_url": f"{base_url}/v1/messages/batches/{batch_id}/results" if status == "ended" else None,
+        }
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload, headers=None):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("request-id", f"req_stub_{uuid.uuid4().hex[:12]}")
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _not_found(self):
+            self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+
+        def _base_url(self):
+            return f"http://{self.headers.get('Host') or '%s:%d' % self.server.server_address[:2]}"
+
+        def do_GET(self):
+            path = self.path.split("?", 1)[0].rstrip("/")
+            if path == "/stats":
+                with state._lock:
+                    counts = dict(state.counts)
+                self._send_json(200, counts)
+                return
+            if path == "/v1/messages/batches":
+                with state._lock:
+                    batch_ids = list(state.batches)
+                batches = [state.batch(batch_id, self._base_url()) for batch_id in reversed(batch_ids)]
+                self._send_json(200, {"data": batches, "has_more": False,
+                                      "first_id": batch_ids[-1] if batch_ids else None,
+                                      "last_id": batch_ids[0] if batch_ids else None})
+                return
+            match = re.fullmatch(r"/v1/messages/batches/([\w-]+)(/results)?", path)
+            if not match:
+                self._not_found()
+                return
+            batch = state.batch(match.group(1), self._base_url())
+            if batch is None:
+                self._not_found()
+            elif not match.group(2):
+                self._send_json(200, batch)
+            elif batch["processing_status"] != "ended":
+                self._send_json(400, {"type": "error", "error": {"type": "invalid_request_error",
+                                                                 "message": "Batch is still processing"}})
+            else:
+                with state._lock:
+                    results = state.batches[match.group(1)]["results"]
+                data = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in results).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/binary")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            path = self.path.split("?", 1)[0].rstrip("/")
+            if path == "/v1/messages/batches":
+                batch_id = state.create_batch(body.get("requests", []))
+                self._send_json(200, state.batch(batch_id, self._base_url()))
+                return
+            match = re.fullmatch(r"/v1/messages/batches/([\w-]+)/cancel", path)
+            if match:
+                with state._lock:
+                    batch = state.batches.get(match.group(1))
+                    if batch is not None and batch["results"] is None and batch["cancel_initiated_at"] is None:
+                        batch["cancel_initiated_at"] = time.time()
+                if batch is None:
+                    self._not_found()
+                else:
+                    self._send_json(200, state.batch(match.group(1), self._base_url()))
+                return
+            if path != "/v1/messages":
+                self._not_found()
+                return
+
+            tool = (body.get("tool_choice") or {}).get("name") or "text"
+            state.count(tool)
+            delay = state.latency_for(tool)
+
+            if state.error_rate and random.random() < state.error_rate:
+                time.sleep(delay * 0.2)
+                state.count(f"error_{state.error_status}")
+                error_type = "rate_limit_error" if state.error_status == 429 else "overloaded_error"
+                self._send_json(state.error_status, {"type": "error", "error": {"type": error_type, "message": "Stub error"}},
+                                headers={"retry-after": "0"} if state.error_status == 429 else None)
+                return
+
+            message, output = state.message(body)
+            if body.get("stream"):
+                self._stream(message, output, delay)
+            else:
+                time.sleep(delay)
+                self._send_json(200, message)
+
+        def _event(self, name, payload):
+            self.wfile.write(f"event: {name}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        def _stream(self, message, output, delay):
+            """Server-sent events: time to first token is a third of the delay, the rest is spread over the chunks."""
+            content = message["content"][0]
+            chunks = max(1, state.stream_chunks)
+            size = -(-len(output) // chunks)
+            pieces = [output[i:i + size] for i in range(0, len(output), size)] or [""]
+
+            time.sleep(delay / 3)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+
+            start = {**message, "content": [], "stop_reason": None,
+                     "usage": {**message["usage"], "output_tokens": 1}}
+            self._event("message_start", {"type": "message_start", "message": start})
+            if content["type"] == "tool_use":
+                block = {**content, "input": {}}
+                delta = lambda piece: {"type": "input_json_delta", "partial_json": piece}
+            else:
+                block = {"type": "text", "text": ""}
+                delta = lambda piece: {"type": "text_delta", "text": piece}
+            self._event("content_block_start", {"type": "content_block_start", "index": 0, "content_block": block})
+            for piece in pieces:
+                time.sleep(delay * 2 / 3 / len(pieces))
+                self._event("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": delta(piece)})
+            self._event("content_block_stop", {"type": "content_block_stop", "index": 0})
+            self._event("message_delta", {"type": "message_delta",
+                                          "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+                                          "usage": {"output_tokens": message["usage"]["output_tokens"]}})
+            self._event("message_stop", {"type": "message_stop"})
+            self.close_connection = True
+
+    return Handler
+
+
+def parse_latency_args(specs, default="lognormal:0.8,0.35"):
+    """Split --latency values into (default Latency, {tool: Latency})."""
+    default_latency = Latency(default)
+    per_tool = {}
+    for spec in specs or []:
+        tool, sep, dist = spec.partition("=")
+        if sep:
+            per_tool[tool] = Latency(dist)
+        else:
+            default_latency = Latency(spec)
+    return default_latency, per_tool
+
+
+def make_server(host="127.0.0.1", port=0, latency=None, error_rate=0.0, error_status=529, stream_chunks=12,
+                batch_latency="fixed:2"):
+    """Build (but don't start) a stub server. `latency` is a list of --latency specs."""
+    default_latency, per_tool = parse_latency_args(latency)
+    state = StubState(default_latency, per_tool, error_rate, error_status, stream_chunks, Latency(batch_latency))
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    server.state = state
+    return server
+
+
+def add_stub_arguments(parser):
+    parser.add_argument('--latency', action='append', default=[],
+                        help='Latency spec, optionally per tool (TOOL=SPEC); repeatable. Default: lognormal:0.8,0.35')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of calls answered with an error')
+    parser.add_argument('--error-status', type=int, default=529, choices=[429, 500, 529],
+                        help='HTTP status for injected errors')
+    parser.add_argument('--stream-chunks', type=int, default=12, help='Deltas per streamed reply')
+    parser.add_argument('--batch-latency', default='fixed:2',
+                        help='Latency spec for a whole message batch to end (default: fixed:2)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Anthropic Messages API stub for benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on (0 = pick a free one)')
+    parser.add_argument('--seed', type=int, help='Random seed for latencies and injected errors')
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    server = make_server(args.host, args.port, args.latency, args.error_rate, args.error_status, args.stream_chunks,
+                         args.batch_latency)
+    host, port = server.server_address[:2]
+    # The benchmark runner reads this line to find the port
+    print(f"listening on http://{host}:{port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
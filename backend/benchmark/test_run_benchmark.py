@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Smoke test for run_benchmark: the Q&A -> evaluation stages against stub_server.py.
+
+Needs no network, API key or detector model; the image stage is skipped and
+fed a canned scene instead. Run with: python3 -m pytest test_run_benchmark.py
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+import run_benchmark
+
+SCENE = {
+    "description": "A person reads a book at a wooden table by a window.",
+    "primary_object": "book",
+    "objects": ["table", "book", "window"],
+}
+
+
+# One stub per module: the pipeline's API client keeps the first base URL it sees
+@pytest.fixture(scope="module")
+def stub_pipeline():
+    environ, path = dict(os.environ), list(sys.path)
+    args = SimpleNamespace(error_rate=0.0, error_status=529, stream_chunks=4, latency=["fixed:0"], seed=0)
+    stub, base_url = run_benchmark.start_stub(args)
+    try:
+        run_benchmark.configure_environment(base_url, warm_cache=False)
+        yield run_benchmark.Pipeline("Spanish", "A2")
+    finally:
+        stub.terminate()
+        stub.wait()
+        os.environ.clear()
+        os.environ.update(environ)
+        sys.path[:] = path
+
+
+def test_qa_then_evaluate(stub_pipeline):
+    qa_result = stub_pipeline.qa(SCENE)
+    assert qa_result["success"] and qa_result["total_questions"] == len(qa_result["questions"]) > 0
+
+    result = stub_pipeline.evaluate(qa_result)
+    assert len(result["evaluations"]) == len(qa_result["questions"])
+    assert result["summary"]["questions_answered"] == len(qa_result["questions"])
+    assert result["summary"]["max_points"] > 0
+
+
+def test_stages_run_back_to_back(stub_pipeline):
+    # run() chains stages by feeding each stage's outputs to the next
+    outputs, report = run_benchmark.run_stage(stub_pipeline.qa, [SCENE, SCENE], concurrency=2)
+    assert report["errors"] == 0, report["first_error"]
+    _, report = run_benchmark.run_stage(stub_pipeline.evaluate, outputs, concurrency=2)
+    assert report["errors"] == 0, report["first_error"]
+    assert report["calls"] == 2
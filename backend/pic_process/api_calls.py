@@ -0,0 +1,311 @@
+"""
+Deadlines, retries and hedging for Anthropic API calls.
+
+Every messages.create call made by the pipeline goes through
+`api_calls.create(stage, client, **request)`, and every messages.stream call
+through `api_calls.stream(...)`:
+
+- Each stage (words, summary, qa, evaluation) has an overall deadline that
+  covers every attempt; each attempt's HTTP timeout is whatever remains.
+- 429 (rate limited), 529 (overloaded), 5xx and connection errors are retried
+  with full-jitter exponential backoff, honouring retry-after when the server
+  sends one. The SDK's own retries are turned off so the two don't stack.
+  A stream is only retried while it is being opened, before the caller has
+  seen any of it.
+- With hedging on, once a stage has enough latency samples, a call still
+  running after that stage's p95 gets a duplicate request and whichever
+  finishes first wins. The loser cannot be cancelled mid-flight and still
+  completes in the background, so hedging trades a few percent more API calls
+  for a shorter tail.
+- At most API_CONCURRENCY attempts are in flight per process (a hedge's
+  duplicate shares its primary's slot); waiting for a slot counts against the
+  deadline.
+
+Token usage of every successful call is recorded by usage.record_usage().
+"""
+
+import random
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager, ExitStack
+
+from config import config
+from concurrency import ConcurrencyLimit
+from usage import record_usage
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504, 529}
+
+
+class LatencyWindow:
+    """The most recent successful call latencies for one stage."""
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def quantile(self, q):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def is_retryable(error):
+    """Whether an API error is worth another attempt."""
+    import anthropic
+    if isinstance(error, (anthropic.APIConnectionError, anthropic.APITimeoutError)):
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS
+
+
+def _retry_after(error):
+    """Seconds from the error response's retry-after header, if any."""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class ApiCaller:
+    """
+    Runs model calls under a per-stage deadline with retries and optional hedging.
+
+    Args:
+        settings: Config providing the api_* settings
+        max_hedge_threads (int): Threads available for hedged attempts
+    """
+
+    def __init__(self, settings, max_hedge_threads=16):
+        self._settings = settings
+        self._latency = {}
+        self._lock = threading.Lock()
+        self._hedge_executor = None
+        self._max_hedge_threads = max_hedge_threads
+        self.limit = ConcurrencyLimit(lambda: settings.api_concurrency)
+        self.counters = {
+            "calls": 0, "retries": 0, "failures": 0, "deadline_exceeded": 0,
+            "hedges_fired": 0, "hedges_won": 0,
+        }
+
+    def _count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def _window(self, stage):
+        with self._lock:
+            return self._latency.setdefault(stage, LatencyWindow())
+
+    def _executor(self):
+        if self._hedge_executor is None:
+            with self._lock:
+                if self._hedge_executor is None:
+                    self._hedge_executor = ThreadPoolExecutor(
+                        max_workers=self._max_hedge_threads, thread_name_prefix="api-hedge")
+        return self._hedge_executor
+
+    def hedge_delay(self, stage):
+        """Seconds to wait before hedging a call for this stage, or None if it isn't hedged."""
+        s = self._settings
+        window = self._window(stage)
+        if not s.api_hedge or len(window) < s.api_hedge_min_samples:
+            return None
+        return max(s.api_hedge_min_delay, window.quantile(s.api_hedge_quantile))
+
+    def _deadline(self, stage, deadline, request):
+        deadlines = self._settings.api_deadlines
+        return deadline or request.pop("timeout", None) or deadlines.get(stage, deadlines["default"])
+
+    def _backoff(self, stage, attempt, error, give_up_at):
+        """
+        Seconds to wait before retrying after `error`, or None if the deadline leaves no time.
+
+        Re-raises error when it isn't retryable or the retries are used up.
+        """
+        s = self._settings
+        if isinstance(error, TimeoutError) or not is_retryable(error) or attempt == s.api_max_retries:
+            self._count("failures")
+            raise error
+        backoff = random.uniform(0, min(s.api_backoff_max, s.api_backoff_base * 2 ** attempt))
+        backoff = max(backoff, _retry_after(error) or 0)
+        if time.monotonic() + backoff >= give_up_at:
+            return None
+        self._count("retries")
+        print(f"{stage}: attempt {attempt + 1} failed ({type(error).__name__}), "
+              f"retrying in {backoff:.2f}s", file=sys.stderr)
+        return backoff
+
+    def create(self, stage, client, deadline=None, **request):
+        """
+        messages.create with this stage's deadline, retries and hedging.
+
+        Args:
+            stage (str): Key into config.api_deadlines (unknown stages use "default")
+            client: Anthropic client
+            deadline (float): Overrides the stage deadline, in seconds
+            **request: messages.create arguments (a `timeout` is treated as the deadline)
+
+        Raises:
+            TimeoutError: if the deadline passes before a call succeeds
+        """
+        deadline = self._deadline(stage, deadline, request)
+        started = time.monotonic()
+        give_up_at = started + deadline
+        # Retries are handled here; SDK retries would stack on top of them
+        if hasattr(client, "with_options"):
+            client = client.with_options(max_retries=0)
+        self._count("calls")
+
+        for attempt in range(self._settings.api_max_retries + 1):
+            remaining = give_up_at - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                with self.limit.slot(timeout=remaining):
+                    message = self._attempt(stage, client, request, give_up_at - time.monotonic())
+                record_usage(stage, request.get("model"), message, time.monotonic() - started)
+                return message
+            except Exception as e:
+                backoff = self._backoff(stage, attempt, e, give_up_at)
+                if backoff is None:
+                    break
+                time.sleep(backoff)
+
+        self._count("deadline_exceeded")
+        raise TimeoutError(f"{stage} call did not complete within {deadline}s")
+
+    @contextmanager
+    def stream(self, stage, client, deadline=None, **request):
+        """
+        messages.stream with this stage's deadline, retries and concurrency slot.
+
+        Opening the stream (where rate-limit, overload, server and connection
+        errors surface) is retried like create(). Once the stream is handed
+        to the block, errors propagate: part of the reply may already have
+        been used. The slot is held until the block exits, and usage and
+        latency are recorded if it exits normally. Streams are never hedged.
+
+        Usage:
+            with api_calls.stream("qa", client, **request) as stream:
+                for event in stream:
+                    ...
+
+        Raises:
+            TimeoutError: if the deadline passes before the stream opens
+        """
+        deadline = self._deadline(stage, deadline, request)
+        started = time.monotonic()
+        give_up_at = started + deadline
+        if hasattr(client, "with_options"):
+            client = client.with_options(max_retries=0)
+        self._count("calls")
+
+        with ExitStack() as held:
+            stream = None
+            for attempt in range(self._settings.api_max_retries + 1):
+                remaining = give_up_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                opening = ExitStack()
+                try:
+                    opening.enter_context(self.limit.slot(timeout=remaining))
+                    stream = opening.enter_context(
+                        client.messages.stream(**request, timeout=give_up_at - time.monotonic()))
+                except Exception as e:
+                    opening.close()
+                    backoff = self._backoff(stage, attempt, e, give_up_at)
+                    if backoff is None:
+                        break
+                    time.sleep(backoff)
+                    continue
+                held.enter_context(opening)
+                break
+
+            if stream is None:
+                self._count("deadline_exceeded")
+                raise TimeoutError(f"{stage} stream did not open within {deadline}s")
+
+            yield stream
+            message = stream.get_final_message()
+            self._window(stage).add(time.monotonic() - started)
+            record_usage(stage, request.get("model"), message, time.monotonic() - started)
+
+    def _attempt(self, stage, client, request, remaining):
+        """One attempt, hedged if the stage has a hedge delay shorter than the time left."""
+        started = time.monotonic()
+        delay = self.hedge_delay(stage)
+        if delay is None or delay >= remaining:
+            message = client.messages.create(**request, timeout=remaining)
+        else:
+            message = self._hedged(client, request, remaining, delay)
+        self._window(stage).add(time.monotonic() - started)
+        return message
+
+    def _hedged(self, client, request, remaining, delay):
+        """Send the request, then a duplicate after `delay`; return the first success."""
+        started = time.monotonic()
+        executor = self._executor()
+        primary = executor.submit(client.messages.create, **request, timeout=remaining)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        self._count("hedges_fired")
+        hedge = executor.submit(client.messages.create, **request,
+                                timeout=remaining - (time.monotonic() - started))
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=remaining - (time.monotonic() - started),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f"Hedged call did not complete within {remaining:.1f}s")
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count("hedges_won")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stats(self):
+        """Counters, concurrency slot usage and p50/p95 latency per stage."""
+        with self._lock:
+            stats = dict(self.counters)
+            windows = dict(self._latency)
+        stats["concurrency"] = self.limit.stats()
+        stats["latency"] = {
+            stage: {
+                "samples": len(window),
+                "p50": window.quantile(0.5),
+                "p95": window.quantile(0.95),
+            }
+            for stage, window in windows.items()
+        }
+        return stats
+
+
+# Shared by every model call in the process
+api_calls = ApiCaller(config)
+
+
+def api_call_stats():
+    """
+    Get retry/hedge counters and per-stage latencies for model calls.
+
+    Returns:
+        dict: {"calls", "retries", "failures", "deadline_exceeded", "hedges_fired", "hedges_won",
+               "concurrency", "latency"}
+    """
+    return api_calls.stats()
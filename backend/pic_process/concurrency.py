@@ -0,0 +1,87 @@
+"""
+Process-wide caps on concurrent model work.
+
+Model calls and detector inference have very different limits: the API
+accepts many calls in flight (up to the account's rate limit), while each
+detector forward pass already uses every CPU core, so running several at once
+only makes each one slower. Both are capped separately:
+
+    api_calls.limit      API_CONCURRENCY calls in flight (api_calls.py)
+    detector_limit       DETECTOR_CONCURRENCY forward passes (generate_bounding_box.py)
+
+0 (the default for both) means unlimited. Batch runs (process_image.py --dir)
+set them from the command line with set_limit().
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class ConcurrencyLimit:
+    """
+    A resizable cap on how many callers may be inside slot() at once.
+
+    Args:
+        limit (int | callable): Maximum concurrent holders (0 means unlimited), or a
+            function returning it, called on first use so config is read lazily
+    """
+
+    def __init__(self, limit=0):
+        self._limit = limit
+        self._cond = threading.Condition()
+        self.in_use = 0
+        self.peak = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    @property
+    def limit(self):
+        with self._cond:
+            if callable(self._limit):
+                self._limit = max(0, int(self._limit()))
+            return self._limit
+
+    def set_limit(self, limit):
+        """Change the cap; 0 removes it. Waiting callers are re-checked immediately."""
+        with self._cond:
+            self._limit = max(0, int(limit))
+            self._cond.notify_all()
+
+    def _has_room(self):
+        return not self._limit or self.in_use < self._limit
+
+    @contextmanager
+    def slot(self, timeout=None):
+        """
+        Hold one slot for the duration of the block.
+
+        Raises:
+            TimeoutError: if no slot frees up within timeout seconds
+        """
+        self.limit  # resolve a lazy limit before taking the lock below
+        with self._cond:
+            if not self._has_room():
+                started = time.monotonic()
+                self.waits += 1
+                if not self._cond.wait_for(self._has_room, timeout):
+                    raise TimeoutError(f"No free slot (limit {self._limit}) within {timeout:.1f}s")
+                self.wait_seconds += time.monotonic() - started
+            self.in_use += 1
+            self.peak = max(self.peak, self.in_use)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_use -= 1
+                self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "limit": self._limit if not callable(self._limit) else None,
+                "in_use": self.in_use,
+                "peak": self.peak,
+                "waits": self.waits,
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
@@ -1,22 +1,37 @@
 """
 Configuration management for pic_process module.
 Handles loading environment variables from .env file and system environment.
+
+Importing this module has no side effects: the .env file is read the first
+time a setting is accessed, and the API key is only validated when a client
+or key is actually requested.
 """
 
 import os
 import sys
+import threading
 from pathlib import Path
-from dotenv import load_dotenv
 
 class Config:
     """Configuration manager that loads from .env file and environment variables."""
     
     def __init__(self):
-        self._load_environment()
-        self._validate_config()
+        self._loaded = False
+        self._load_lock = threading.Lock()
+    
+    def _env(self, name, default):
+        """Read a setting, loading the .env file on first use."""
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    self._load_environment()
+                    self._loaded = True
+        return os.environ.get(name, default)
     
     def _load_environment(self):
         """Load environment variables from .env file if it exists."""
+        from dotenv import load_dotenv
+
         # Look for .env file in current directory, parent directory, or pic_process directory
         possible_env_paths = [
             Path.cwd() / '.env',
@@ -46,29 +61,347 @@ class Config:
     @property
     def anthropic_api_key(self) -> str:
         """Get Anthropic API key from environment."""
-        api_key = os.environ.get("ANTHROPIC_API_KEY", "")
+        api_key = self._env("ANTHROPIC_API_KEY", "")
         return api_key.strip()  # Strip whitespace and newlines
     
     @property
     def upload_path(self) -> str:
         """Get upload path for processed images."""
-        path = os.environ.get("UPLOAD_PATH", "./uploads")
+        path = self._env("UPLOAD_PATH", "./uploads")
         return path.strip()
     
     @property
     def environment(self) -> str:
         """Get environment type (development/production)."""
-        env = os.environ.get("ENVIRONMENT", "development")
+        env = self._env("ENVIRONMENT", "development")
         return env.strip()
     
+    @property
+    def stage_timeouts(self) -> dict:
+        """Get per-stage timeouts (seconds) for the image_to_json pipeline."""
+        defaults = {"words": 60.0, "summary": 60.0, "decode": 30.0, "detect": 120.0}
+        return {
+            stage: float(self._env(f"{stage.upper()}_TIMEOUT", default))
+            for stage, default in defaults.items()
+        }
+    
+    @property
+    def evaluation_concurrency(self) -> int:
+        """Get the maximum number of answers graded in parallel."""
+        return int(self._env("EVALUATION_CONCURRENCY", "4"))
+    
+    @property
+    def evaluation_timeout(self) -> float:
+        """Get the per-answer grading timeout in seconds."""
+        return float(self._env("EVALUATION_TIMEOUT", "60"))
+    
+    @property
+    def api_concurrency(self) -> int:
+        """Get the maximum number of model calls in flight per process (0 means unlimited)."""
+        return int(self._env("API_CONCURRENCY", "0"))
+    
+    @property
+    def detector_concurrency(self) -> int:
+        """Get the maximum number of detector forward passes run at once (0 means unlimited)."""
+        return int(self._env("DETECTOR_CONCURRENCY", "0"))
+    
+    @property
+    def detector_backend(self) -> str:
+        """Get the detector inference path: eager, inference, int8, compile or onnx."""
+        return self._env("DETECTOR_BACKEND", "eager").strip().lower()
+    
+    @property
+    def detector_onnx_dir(self) -> str:
+        """Get the directory exported ONNX detector models are cached in (defaults under upload_path)."""
+        path = self._env("DETECTOR_ONNX_DIR", "").strip()
+        return path or os.path.join(self.upload_path, "onnx")
+    
+    @property
+    def qa_target_concurrency(self) -> int:
+        """Get the maximum number of Q&A generation calls in flight for one multi-target request."""
+        return int(self._env("QA_TARGET_CONCURRENCY", "6"))
+    
+    @property
+    def structured_output_attempts(self) -> int:
+        """Get how many times a model call is made before a schema-invalid reply is an error."""
+        return max(1, int(self._env("STRUCTURED_OUTPUT_ATTEMPTS", "2")))
+    
+    @property
+    def api_deadlines(self) -> dict:
+        """Get the overall deadline (seconds, retries included) for each kind of model call."""
+        timeouts = self.stage_timeouts
+        return {
+            "words": timeouts["words"],
+            "summary": timeouts["summary"],
+            "qa": float(self._env("QA_TIMEOUT", "90")),
+            "evaluation": self.evaluation_timeout,
+            "default": float(self._env("API_DEADLINE", "120")),
+        }
+    
+    @property
+    def api_max_retries(self) -> int:
+        """Get how many times a rate-limited, overloaded or failed model call is retried."""
+        return int(self._env("API_MAX_RETRIES", "3"))
+    
+    @property
+    def api_backoff_base(self) -> float:
+        """Get the first retry's maximum backoff in seconds (doubles each retry)."""
+        return float(self._env("API_BACKOFF_BASE", "0.5"))
+    
+    @property
+    def api_backoff_max(self) -> float:
+        """Get the cap on a single retry backoff in seconds."""
+        return float(self._env("API_BACKOFF_MAX", "8"))
+    
+    @property
+    def api_hedge(self) -> bool:
+        """Whether slow model calls are hedged with a duplicate request."""
+        return self._env("API_HEDGE", "false").strip().lower() in ("1", "true", "yes")
+    
+    @property
+    def api_hedge_quantile(self) -> float:
+        """Get the latency quantile after which a hedge request is sent."""
+        return float(self._env("API_HEDGE_QUANTILE", "0.95"))
+    
+    @property
+    def api_hedge_min_samples(self) -> int:
+        """Get how many latencies a stage needs before its calls are hedged."""
+        return int(self._env("API_HEDGE_MIN_SAMPLES", "20"))
+    
+    @property
+    def api_hedge_min_delay(self) -> float:
+        """Get the shortest delay in seconds before a hedge request is sent."""
+        return float(self._env("API_HEDGE_MIN_DELAY", "1"))
+    
+    @property
+    def timing_sink(self) -> str:
+        """Get where span timings are exported: prometheus:<path>, statsd:<host>:<port> or empty for none."""
+        return self._env("TIMING_SINK", "").strip()
+    
+    @property
+    def timing_prefix(self) -> str:
+        """Get the metric name prefix used by the timing sink."""
+        return self._env("TIMING_PREFIX", "lexipic").strip()
+    
+    @property
+    def usage_log(self) -> str:
+        """Get the append-only token usage log path (USAGE_LOG="" disables it)."""
+        path = self._env("USAGE_LOG", None)
+        if path is None:
+            return os.path.join(self.upload_path, "usage.jsonl")
+        return path.strip()
+    
+    @property
+    def model_prices_json(self) -> str:
+        """Get per-model price overrides as JSON: {"model": {"input", "output", "cache_write", "cache_read"}} in USD per million tokens."""
+        return self._env("MODEL_PRICES_JSON", "").strip()
+    
+    @property
+    def result_cache_entries(self) -> int:
+        """Get the number of image_to_json results kept in memory (0 disables caching)."""
+        return int(self._env("RESULT_CACHE_ENTRIES", "256"))
+    
+    @property
+    def result_cache_ttl(self) -> float:
+        """Get how long cached image results stay valid, in seconds (0 = forever)."""
+        return float(self._env("RESULT_CACHE_TTL", "86400"))
+    
+    @property
+    def result_cache_disk(self) -> bool:
+        """Whether cached image results are also written under upload_path."""
+        return self._env("RESULT_CACHE_DISK", "false").strip().lower() in ("1", "true", "yes")
+    
+    @property
+    def result_cache_disk_mb(self) -> int:
+        """Get the size limit of the on-disk result cache in MiB."""
+        return int(self._env("RESULT_CACHE_DISK_MB", "256"))
+    
+    @property
+    def qa_cache_entries(self) -> int:
+        """Get the number of (description, language, level) Q&A keys cached (0 disables caching)."""
+        return int(self._env("QA_CACHE_ENTRIES", "512"))
+    
+    @property
+    def qa_cache_variants(self) -> int:
+        """Get how many different Q&A sets are kept and rotated per key."""
+        return int(self._env("QA_CACHE_VARIANTS", "1"))
+    
+    @property
+    def qa_cache_ttl(self) -> float:
+        """Get how long cached Q&A sets stay valid, in seconds (0 = forever)."""
+        return float(self._env("QA_CACHE_TTL", "86400"))
+    
+    @property
+    def image_max_edge(self) -> int:
+        """Get the longest image edge (pixels) sent to the models."""
+        return int(self._env("IMAGE_MAX_EDGE", "1568"))
+    
+    @property
+    def image_max_pixels(self) -> int:
+        """Get the pixel budget for images sent to the models."""
+        return int(self._env("IMAGE_MAX_PIXELS", "1150000"))
+    
+    @property
+    def image_jpeg_quality(self) -> int:
+        """Get the JPEG quality used when re-encoding uploads."""
+        return int(self._env("IMAGE_JPEG_QUALITY", "85"))
+    
+    @property
+    def anthropic_max_connections(self) -> int:
+        """Get the maximum number of open connections to the Anthropic API."""
+        return int(self._env("ANTHROPIC_MAX_CONNECTIONS", "20"))
+    
+    @property
+    def anthropic_keepalive_connections(self) -> int:
+        """Get the number of idle connections kept alive for reuse."""
+        return int(self._env("ANTHROPIC_KEEPALIVE_CONNECTIONS", "10"))
+    
+    @property
+    def anthropic_keepalive_expiry(self) -> float:
+        """Get how long (seconds) an idle connection is kept before closing."""
+        return float(self._env("ANTHROPIC_KEEPALIVE_EXPIRY", "60"))
+    
+    @property
+    def anthropic_connect_timeout(self) -> float:
+        """Get the connection timeout in seconds."""
+        return float(self._env("ANTHROPIC_CONNECT_TIMEOUT", "5"))
+    
+    @property
+    def anthropic_read_timeout(self) -> float:
+        """Get the read timeout in seconds."""
+        return float(self._env("ANTHROPIC_READ_TIMEOUT", "120"))
+    
+    @property
+    def anthropic_http2(self) -> bool:
+        """Whether to use HTTP/2 (default: when the h2 package is installed)."""
+        value = self._env("ANTHROPIC_HTTP2", "auto").strip().lower()
+        if value == "auto":
+            try:
+                import h2  # noqa: F401
+                return True
+            except ImportError:
+                return False
+        return value in ("1", "true", "yes")
+    
     def get_anthropic_client(self):
-        """Get configured Anthropic client."""
-        from anthropic import Anthropic
-        return Anthropic(api_key=self.anthropic_api_key)
+        """Get the shared, connection-pooled Anthropic client."""
+        self._validate_config()
+        return client_manager.sync_client()
+    
+    def get_async_anthropic_client(self):
+        """Get the shared AsyncAnthropic client for the running event loop."""
+        self._validate_config()
+        return client_manager.async_client()
+
+
+class ClientManager:
+    """
+    Process-wide Anthropic clients backed by tuned httpx connection pools.
+
+    Every call site shares one sync client (and one async client per event
+    loop), so the several API calls made for a request reuse warm TLS
+    connections instead of opening new ones.
+    """
+    
+    def __init__(self, settings):
+        self._settings = settings
+        self._lock = threading.Lock()
+        self._sync = None
+        self._async = {}
+        self._counters = {"requests": 0, "responses": 0, "http2_responses": 0, "errors": 0}
+    
+    def _httpx_options(self):
+        import httpx
+        s = self._settings
+        return {
+            "limits": httpx.Limits(
+                max_connections=s.anthropic_max_connections,
+                max_keepalive_connections=s.anthropic_keepalive_connections,
+                keepalive_expiry=s.anthropic_keepalive_expiry,
+            ),
+            "timeout": httpx.Timeout(s.anthropic_read_timeout, connect=s.anthropic_connect_timeout),
+            "http2": s.anthropic_http2,
+        }
+    
+    def _count(self, key):
+        with self._lock:
+            self._counters[key] += 1
+    
+    def _on_request(self, request):
+        self._count("requests")
+    
+    def _on_response(self, response):
+        self._count("responses")
+        if response.http_version == "HTTP/2":
+            self._count("http2_responses")
+        if response.status_code >= 400:
+            self._count("errors")
+    
+    def sync_client(self):
+        if self._sync is None:
+            with self._lock:
+                if self._sync is None:
+                    from anthropic import Anthropic, DefaultHttpxClient
+                    http_client = DefaultHttpxClient(
+                        **self._httpx_options(),
+                        event_hooks={"request": [self._on_request], "response": [self._on_response]},
+                    )
+                    self._sync = Anthropic(api_key=self._settings.anthropic_api_key, http_client=http_client)
+        return self._sync
+    
+    def async_client(self):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async.get(loop)
+            if client is None:
+                from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
+                
+                async def on_request(request):
+                    self._on_request(request)
+                
+                async def on_response(response):
+                    self._on_response(response)
+                
+                http_client = DefaultAsyncHttpxClient(
+                    **self._httpx_options(),
+                    event_hooks={"request": [on_request], "response": [on_response]},
+                )
+                client = AsyncAnthropic(api_key=self._settings.anthropic_api_key, http_client=http_client)
+                # Connection pools are bound to the loop that created them
+                self._async = {
+                    other: c for other, c in self._async.items() if not other.is_closed()
+                }
+                self._async[loop] = client
+        return client
+    
+    def stats(self):
+        """Request counters plus the current state of each connection pool."""
+        with self._lock:
+            stats = dict(self._counters)
+            clients = ([("sync", self._sync)] if self._sync else []) + \
+                [(f"async-{i}", c) for i, c in enumerate(self._async.values())]
+        stats["pools"] = {name: _pool_state(client) for name, client in clients}
+        return stats
+
+
+def _pool_state(client):
+    """Open/idle connection counts from the httpcore pool behind an Anthropic client."""
+    # httpx does not expose pool state publicly; read it defensively
+    pool = getattr(getattr(getattr(client, "_client", None), "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", []))
+    return {
+        "open": len(connections),
+        "idle": sum(1 for c in connections if c.is_idle()),
+        "http2": sum(1 for c in connections if "HTTP/2" in repr(c)),
+    }
 
 # Global configuration instance
 config = Config()
 
+# Shared Anthropic clients (created on first use)
+client_manager = ClientManager(config)
+
 def get_anthropic_key():
     """
     Get Anthropic API key with proper error handling.
@@ -80,6 +413,7 @@ def get_anthropic_key():
         SystemExit: If API key is not available
     """
     try:
+        config._validate_config()
         return config.anthropic_api_key
     except EnvironmentError as e:
         print(f"Configuration Error: {e}", file=sys.stderr)
@@ -89,7 +423,28 @@ def get_anthropic_client():
     """
     Get configured Anthropic client instance.
     
+    The client is shared across the process; reuse it freely rather than
+    holding on to your own.
+    
     Returns:
         Anthropic: Configured client
     """
     return config.get_anthropic_client()
+
+def get_async_anthropic_client():
+    """
+    Get the shared AsyncAnthropic client for the running event loop.
+    
+    Returns:
+        AsyncAnthropic: Configured client
+    """
+    return config.get_async_anthropic_client()
+
+def anthropic_pool_stats():
+    """
+    Get request counters and connection pool state for the shared clients.
+    
+    Returns:
+        dict: {"requests", "responses", "http2_responses", "errors", "pools"}
+    """
+    return client_manager.stats()
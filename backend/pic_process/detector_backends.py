@@ -0,0 +1,239 @@
+"""
+CPU inference paths for the zero-shot detector.
+
+DETECTOR_BACKEND picks how generate_bounding_box runs Grounding DINO:
+
+    eager       the model as loaded, under torch.no_grad() (default)
+    inference   the same model under torch.inference_mode(), which also skips
+                autograd's version counters and view tracking
+    int8        a copy with every nn.Linear dynamically quantized to int8,
+                under inference_mode; smaller and faster, slightly less exact
+    compile     torch.compile(model) under inference_mode; the first passes
+                for each new input shape are slow while it compiles
+    onnx        exported once to ONNX (cached under DETECTOR_ONNX_DIR) and run
+                by onnxruntime; needs the onnx and onnxruntime packages
+
+Every backend is called like the model (keyword tensors in, an object with
+.logits and .pred_boxes out) and exposes .config and .device, so make_box()
+and make_boxes() don't care which one is loaded. Check a backend's boxes
+against eager with benchmark/detector_benchmark.py before switching
+production to it.
+"""
+
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+BACKENDS = ("eager", "inference", "int8", "compile", "onnx")
+
+
+class EagerBackend:
+    """The model as loaded, run under torch.no_grad()."""
+
+    name = "eager"
+    # The Swin backbone can be swapped for a cached output (_reuse_backbone)
+    reuses_backbone = True
+
+    def __init__(self, model):
+        self.model = model
+        self.config = model.config
+        self.device = model.device
+
+    def inference(self):
+        """Context manager every forward pass runs under."""
+        import torch
+        return torch.no_grad()
+
+    def __call__(self, **inputs):
+        return self.model(**inputs)
+
+
+class InferenceModeBackend(EagerBackend):
+    name = "inference"
+
+    def inference(self):
+        import torch
+        return torch.inference_mode()
+
+
+class Int8Backend(InferenceModeBackend):
+    """Dynamic int8 quantization: weights stored as int8, activations quantized per batch."""
+
+    name = "int8"
+
+    def __init__(self, model):
+        import torch
+        from torch.ao.quantization import quantize_dynamic
+
+        # Quantized kernels are CPU-only. Returns a copy; the float model can be freed.
+        super().__init__(quantize_dynamic(model.cpu(), {torch.nn.Linear}, dtype=torch.qint8))
+
+
+class CompiledBackend(InferenceModeBackend):
+    name = "compile"
+    # Patching the backbone's forward would invalidate the compiled graph
+    reuses_backbone = False
+
+    def __init__(self, model):
+        import torch
+        super().__init__(model)
+        self.compiled = torch.compile(model)
+
+    def __call__(self, **inputs):
+        return self.compiled(**inputs)
+
+
+def _export_module(model, modeling):
+    """
+    The torch.nn.Module traced for ONNX export.
+
+    Grounding DINO derives its text self-attention masks and position ids from
+    input_ids with ops the exporter can't lower (isin, cummax). This module
+    takes them as extra inputs instead: while tracing, the modeling module's
+    mask function is replaced by one that returns those inputs, and at run
+    time OnnxBackend computes them with the original function.
+    """
+    import torch
+
+    class ExportModule(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values, pixel_mask, input_ids, attention_mask, token_type_ids,
+                    text_self_attention_masks, position_ids):
+            original = modeling.generate_masks_with_special_tokens_and_transfer_map
+            modeling.generate_masks_with_special_tokens_and_transfer_map = \
+                lambda _input_ids: (text_self_attention_masks, position_ids)
+            try:
+                outputs = self.model(pixel_values=pixel_values, pixel_mask=pixel_mask, input_ids=input_ids,
+                                     attention_mask=attention_mask, token_type_ids=token_type_ids)
+            finally:
+                modeling.generate_masks_with_special_tokens_and_transfer_map = original
+            return outputs.logits, outputs.pred_boxes
+
+    return ExportModule()
+
+
+class OnnxBackend:
+    """
+    The model exported to ONNX and run by onnxruntime on CPU.
+
+    The traced Swin backbone only accepts the image size it was exported at,
+    so images are padded onto a fixed canvas (pixel_mask marks the padding,
+    as the processor does when it batches images of different sizes). There
+    is one canvas per orientation, sized from the processor's resize limits,
+    e.g. 800x1333 and 1333x800. Both are exported on first load and reused
+    from DETECTOR_ONNX_DIR afterwards; the torch model is dropped once they
+    exist. Text length stays dynamic.
+    """
+
+    name = "onnx"
+    reuses_backbone = False
+    INPUT_NAMES = ["pixel_values", "pixel_mask", "input_ids", "attention_mask", "token_type_ids",
+                   "text_self_attention_masks", "position_ids"]
+    TEXT_AXES = {"input_ids": {1: "text"}, "attention_mask": {1: "text"}, "token_type_ids": {1: "text"},
+                 "text_self_attention_masks": {1: "text", 2: "text"}, "position_ids": {1: "text"}}
+
+    def __init__(self, model, model_id, processor, cache_dir):
+        import torch
+        import transformers
+
+        self.modeling = sys.modules[type(model).__module__]
+        if not hasattr(self.modeling, "generate_masks_with_special_tokens_and_transfer_map"):
+            raise ValueError(f"The onnx detector backend supports Grounding DINO models, not {type(model).__name__}")
+
+        self.config = model.config
+        self.device = torch.device("cpu")
+        self._sessions = {}
+
+        size = processor.image_processor.size
+        short, long = size["shortest_edge"], size["longest_edge"]
+        stem = f"{model_id.replace('/', '--')}-transformers{transformers.__version__}"
+        self.paths = {
+            canvas: os.path.join(cache_dir, f"{stem}-{canvas[0]}x{canvas[1]}.onnx")
+            for canvas in ((short, long), (long, short))
+        }
+        for canvas, path in self.paths.items():
+            if not os.path.exists(path):
+                self._export(model, canvas, path)
+
+    def _export(self, model, canvas, path):
+        import torch
+
+        height, width = canvas
+        input_ids = torch.tensor([[101, 4937, 1012, 102]])  # "[CLS] cat. [SEP]"
+        masks, position_ids = self.modeling.generate_masks_with_special_tokens_and_transfer_map(input_ids)
+        args = (torch.zeros(1, 3, height, width), torch.ones(1, height, width, dtype=torch.long), input_ids,
+                torch.ones_like(input_ids), torch.zeros_like(input_ids), masks, position_ids)
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        start = time.perf_counter()
+        with torch.no_grad():
+            torch.onnx.export(_export_module(model.cpu(), self.modeling), args, tmp_path,
+                              input_names=self.INPUT_NAMES, output_names=["logits", "pred_boxes"],
+                              dynamic_axes=self.TEXT_AXES, opset_version=17, dynamo=False)
+        os.replace(tmp_path, path)
+        print(f"Exported detector to {path} in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    def _session(self, canvas):
+        session = self._sessions.get(canvas)
+        if session is None:
+            import onnxruntime
+
+            options = onnxruntime.SessionOptions()
+            options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            session = onnxruntime.InferenceSession(self.paths[canvas], options, providers=["CPUExecutionProvider"])
+            # Two threads may race here; the loser's session is simply dropped
+            session = self._sessions.setdefault(canvas, session)
+        return session
+
+    def inference(self):
+        import torch
+        return torch.inference_mode()
+
+    def __call__(self, pixel_values, input_ids, attention_mask=None, token_type_ids=None, pixel_mask=None):
+        import torch
+
+        height, width = pixel_values.shape[-2:]
+        canvas = next((c for c in self.paths if c[0] >= height and c[1] >= width), None)
+        if canvas is None:
+            raise ValueError(f"Image of {height}x{width} doesn't fit the exported canvases {sorted(self.paths)}")
+
+        padded = torch.zeros((1, 3) + canvas, dtype=torch.float32)
+        padded[..., :height, :width] = pixel_values
+        mask = torch.zeros((1,) + canvas, dtype=torch.long)
+        mask[..., :height, :width] = 1 if pixel_mask is None else pixel_mask
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        if token_type_ids is None:
+            token_type_ids = torch.zeros_like(input_ids)
+        masks, position_ids = self.modeling.generate_masks_with_special_tokens_and_transfer_map(input_ids)
+
+        feed = dict(zip(self.INPUT_NAMES, (padded, mask, input_ids, attention_mask, token_type_ids,
+                                           masks, position_ids)))
+        logits, pred_boxes = self._session(canvas).run(None, {k: v.cpu().numpy() for k, v in feed.items()})
+        # Boxes are normalized to the unpadded image (pixel_mask sets the valid ratio)
+        return SimpleNamespace(logits=torch.from_numpy(logits), pred_boxes=torch.from_numpy(pred_boxes))
+
+
+def load_backend(name, model, model_id, processor, onnx_dir):
+    """
+    Wrap a loaded detector model in the named backend.
+
+    Raises:
+        ValueError: if name isn't one of BACKENDS
+    """
+    if name == "eager":
+        return EagerBackend(model)
+    if name == "inference":
+        return InferenceModeBackend(model)
+    if name == "int8":
+        return Int8Backend(model)
+    if name == "compile":
+        return CompiledBackend(model)
+    if name == "onnx":
+        return OnnxBackend(model, model_id, processor, onnx_dir)
+    raise ValueError(f"Unknown DETECTOR_BACKEND {name!r}; expected one of {', '.join(BACKENDS)}")
@@ -1,15 +1,26 @@
-import requests
+import contextvars
 import sys
+import threading
+import time
+from contextlib import contextmanager
 
-import torch
-from PIL import Image
-from transformers import AutoProcessor, AutoModelForZeroShotObjectDetection, infer_device
+import numpy as np
 
-#these imports take a bajillion seconds to load
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
+from config import config
+from concurrency import ConcurrencyLimit
+from detector_backends import load_backend
+from timing import span
+
+# torch, transformers and matplotlib take a bajillion seconds to load, so they
+# are imported inside the functions that need them. Importing this module (and
+# interface.py) stays cheap until detection or plotting actually runs.
 
 def test():
+    import requests
+    from PIL import Image
+    import matplotlib.pyplot as plt
+    import matplotlib.patches as patches
+
     image_url = "http://images.cocodataset.org/val2017/000000039769.jpg"
     image = Image.open(requests.get(image_url, stream=True).raw)
     print(image)
@@ -38,18 +49,140 @@ def test():
     plt.axis('off')
     plt.show()
 
+MODEL_ID = "IDEA-Research/grounding-dino-tiny"
+
+# Forward passes allowed at once; each already uses every core on CPU
+detector_limit = ConcurrencyLimit(lambda: config.detector_concurrency)
+
+
+class DetectorRegistry:
+    """
+    Process-wide cache of loaded detector processors and models.
+
+    The first call for a model id pays the from_pretrained cost; every later
+    call reuses the same processor and model. preload() starts that load on a
+    background thread so it can overlap with other work (e.g. the Anthropic
+    calls in image_to_json). Models are wrapped in the DETECTOR_BACKEND
+    inference path (detector_backends.py) as they load.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._model_locks = {}
+        self._entries = {}
+
+    def _model_lock(self, model_id):
+        with self._lock:
+            if model_id not in self._model_locks:
+                self._model_locks[model_id] = threading.Lock()
+            return self._model_locks[model_id]
+
+    def _load(self, model_id):
+        from transformers import AutoProcessor, AutoModelForZeroShotObjectDetection, infer_device
+
+        start = time.perf_counter()
+        with span("detector_load", model=model_id):
+            device = infer_device()
+            processor = AutoProcessor.from_pretrained(model_id)
+            model = AutoModelForZeroShotObjectDetection.from_pretrained(model_id).to(device)
+            model.eval()
+
+            resident_bytes = sum(p.numel() * p.element_size() for p in model.parameters())
+            resident_bytes += sum(b.numel() * b.element_size() for b in model.buffers())
+
+            backend = config.detector_backend
+            detector = load_backend(backend, model, model_id, processor, config.detector_onnx_dir)
+        load_seconds = time.perf_counter() - start
+
+        print(f"Loaded detector {model_id} ({backend}) on {detector.device} in {load_seconds:.2f}s "
+              f"({resident_bytes / 2**20:.1f} MiB float weights)", file=sys.stderr)
+        return {
+            "processor": processor,
+            "model": detector,
+            "backend": backend,
+            "device": str(detector.device),
+            "load_seconds": load_seconds,
+            "resident_bytes": resident_bytes,
+        }
+
+    def get(self, model_id=MODEL_ID):
+        """
+        Return (processor, model) for model_id, loading it on first use.
+        model is a detector_backends backend wrapping the loaded model.
+
+        If a background preload is in progress this waits for it instead of
+        starting a second load.
+        """
+        entry = self._entries.get(model_id)
+        if entry is None:
+            with self._model_lock(model_id):
+                entry = self._entries.get(model_id)
+                if entry is None:
+                    entry = self._load(model_id)
+                    self._entries[model_id] = entry
+        return entry["processor"], entry["model"]
+
+    def preload(self, model_id=MODEL_ID):
+        """
+        Start loading model_id on a daemon thread.
+
+        Returns the thread, or None if the model is already resident. Errors
+        are logged here and raised again by the next get() call.
+        """
+        if model_id in self._entries:
+            return None
+
+        def _run():
+            try:
+                self.get(model_id)
+            except Exception as e:
+                print(f"Detector preload failed: {e}", file=sys.stderr)
+
+        # Carry the caller's context so the load shows up in its request timings
+        context = contextvars.copy_context()
+        thread = threading.Thread(target=context.run, args=(_run,), name=f"preload-{model_id}", daemon=True)
+        thread.start()
+        return thread
+
+    def is_loaded(self, model_id=MODEL_ID):
+        return model_id in self._entries
+
+    def stats(self):
+        """Backend, load time, device and resident size for every loaded model."""
+        return {
+            model_id: {
+                "backend": entry["backend"],
+                "device": entry["device"],
+                "load_seconds": round(entry["load_seconds"], 3),
+                "resident_bytes": entry["resident_bytes"],
+            }
+            for model_id, entry in self._entries.items()
+        }
+
+
+# Global detector registry
+detector_registry = DetectorRegistry()
+
+
+def preload_detector(model_id=MODEL_ID):
+    """Begin loading the detector in the background (no-op if already loaded)."""
+    return detector_registry.preload(model_id)
+
+
+def detector_stats():
+    """Return load statistics for all resident detector models."""
+    return detector_registry.stats()
+
+
 #input is a 3d array image, string object 
 # output: [x0,y0,x1,y1] top left, bottom right points of the bounding box for the object
 def make_box(image,object):
-    model_id = "IDEA-Research/grounding-dino-tiny"
-    device = infer_device() 
-    processor = AutoProcessor.from_pretrained(model_id)
-    model = AutoModelForZeroShotObjectDetection.from_pretrained(model_id).to(device)
+    processor, model = detector_registry.get()
     # Check for cats and remote controls
     text_labels = [[object]]
 
     inputs = processor(images=image, text=text_labels, return_tensors="pt").to(model.device)
-    with torch.no_grad():
+    with detector_limit.slot(), model.inference(), span("detector_inference", labels=1):
         outputs = model(**inputs)
 
     results = processor.post_process_grounded_object_detection(
@@ -71,6 +204,154 @@ def make_box(image,object):
     print(f"best box is {best_box}", file=sys.stderr)
     return best_box
 
+# Backbone output of the make_boxes call running in this context, or None
+# outside one. The backbone's forward is wrapped once and consults this, so
+# concurrent calls on the shared model each replay only their own image.
+_backbone_outputs = contextvars.ContextVar("backbone_outputs", default=None)
+_backbone_patch_lock = threading.Lock()
+
+
+def _install_backbone_replay(backbone):
+    """Wrap backbone.forward (once per model) to replay the output cached in _backbone_outputs."""
+    with _backbone_patch_lock:
+        if getattr(backbone, "_replays_output", False):
+            return
+        original_forward = backbone.forward
+
+        def forward(*args, **kwargs):
+            cached = _backbone_outputs.get()
+            if cached is None:
+                return original_forward(*args, **kwargs)
+            if "output" not in cached:
+                cached["output"] = original_forward(*args, **kwargs)
+            return cached["output"]
+
+        backbone.forward = forward
+        backbone._replays_output = True
+
+
+@contextmanager
+def _reuse_backbone(model):
+    """
+    Run the image backbone once and replay its output for later forward passes.
+
+    Grounding DINO's text encoder, fusion layers and decoder depend on the
+    prompt, but the Swin backbone only sees the image. When one image is
+    scored against several prompt chunks, this keeps the backbone out of every
+    pass after the first. The cache lives in a context variable, so other
+    threads using the same model inside their own block never see it.
+    """
+    backbone = getattr(getattr(model, "model", None), "backbone", None)
+    if backbone is None:
+        yield
+        return
+
+    _install_backbone_replay(backbone)
+    token = _backbone_outputs.set({})
+    try:
+        yield
+    finally:
+        _backbone_outputs.reset(token)
+
+
+def _chunk_labels(tokenizer, labels, max_tokens):
+    """
+    Split labels into prompts of the form "a. b. c." that each fit max_tokens.
+
+    Returns a list of (prompt, [(label_index, char_start, char_end), ...]).
+    """
+    chunks = []
+    prompt, spans, used = "", [], 2  # [CLS] and [SEP]
+    for index, label in enumerate(labels):
+        piece = f"{label}."
+        cost = len(tokenizer(piece, add_special_tokens=False)["input_ids"])
+        if spans and used + cost > max_tokens:
+            chunks.append((prompt, spans))
+            prompt, spans, used = "", [], 2
+        if prompt:
+            prompt += " "
+        spans.append((index, len(prompt), len(prompt) + len(label)))
+        prompt += piece
+        used += cost
+    if spans:
+        chunks.append((prompt, spans))
+    return chunks
+
+
+#input: PIL image, list of object names
+#output: float32 array of shape (len(labels), 5), one row per label:
+#        [x0, y0, x1, y1, score]; rows are NaN where the label was not found
+def make_boxes(image, labels, threshold=0.4):
+    import torch
+
+    processor, model = detector_registry.get()
+    tokenizer = processor.tokenizer
+    max_tokens = getattr(model.config, "max_text_len", 256)
+
+    # Grounding DINO expects lowercase, period-separated phrases
+    normalized = [str(label).strip().lower().replace(".", " ") for label in labels]
+    unique = list(dict.fromkeys(normalized))
+    result = np.full((len(unique), 5), np.nan, dtype=np.float32)
+    if not unique:
+        return result
+
+    width, height = image.size
+    scale = torch.tensor([width, height, width, height], dtype=torch.float32)
+    pixel_inputs = processor.image_processor(images=image, return_tensors="pt").to(model.device)
+
+    # Backends that can't swap the backbone out (compile, onnx) run it per chunk
+    reusable = model.model if model.reuses_backbone else None
+    with detector_limit.slot(), model.inference(), _reuse_backbone(reusable), \
+            span("detector_inference", labels=len(unique)):
+        for prompt, spans in _chunk_labels(tokenizer, unique, max_tokens):
+            text_inputs = tokenizer(prompt, return_tensors="pt", return_offsets_mapping=True)
+            offsets = text_inputs.pop("offset_mapping")[0]
+            text_inputs = text_inputs.to(model.device)
+
+            outputs = model(**pixel_inputs, **text_inputs)
+            probs = outputs.logits[0].sigmoid().float().cpu()   # (queries, text_len)
+            pred_boxes = outputs.pred_boxes[0].float().cpu()     # (queries, 4) cxcywh, normalized
+
+            # label_mask[j, t] is True when token t belongs to label j
+            token_start = offsets[:, 0]
+            token_end = offsets[:, 1]
+            starts = torch.tensor([start for _, start, _ in spans])
+            ends = torch.tensor([end for _, _, end in spans])
+            in_label = (token_start[None, :] >= starts[:, None]) & (token_end[None, :] <= ends[:, None])
+            in_label &= token_end[None, :] > token_start[None, :]  # drop special tokens
+            label_mask = torch.zeros((len(spans), probs.shape[-1]), dtype=torch.bool)
+            label_mask[:, :in_label.shape[1]] = in_label
+
+            # Score every (query, label) pair, then keep the best query per label
+            scores = (probs[:, None, :] * label_mask[None, :, :]).amax(dim=-1)  # (queries, labels)
+            best_scores, best_queries = scores.max(dim=0)
+            cx, cy, w, h = pred_boxes[best_queries].unbind(-1)
+            xyxy = torch.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], dim=-1) * scale
+
+            rows = np.array([index for index, _, _ in spans])
+            found = (best_scores >= threshold).numpy()
+            result[rows[found], :4] = xyxy.numpy()[found]
+            result[rows[found], 4] = best_scores.numpy()[found]
+
+    print(f"Detected {int(np.sum(~np.isnan(result[:, 4])))}/{len(unique)} labels", file=sys.stderr)
+    return result[[unique.index(label) for label in normalized]]
+
+
+def boxes_to_dict(labels, boxes):
+    """
+    Convert make_boxes output into JSON-friendly dicts.
+
+    Returns ({label: [x0, y0, x1, y1] or None}, {label: score or None}).
+    """
+    box_map, score_map = {}, {}
+    for label, row in zip(labels, boxes):
+        if np.isnan(row[4]):
+            box_map[label], score_map[label] = None, None
+        else:
+            box_map[label] = [round(float(x), 2) for x in row[:4]]
+            score_map[label] = round(float(row[4]), 3)
+    return box_map, score_map
+
 def main():
     test()
 
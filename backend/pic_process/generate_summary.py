@@ -1,16 +1,15 @@
 import os, sys
-import anthropic
-from anthropic import Anthropic
-
-import base64
-import httpx
-from IPython.display import HTML, display
 
 # Import configuration management
 from config import get_anthropic_key, get_anthropic_client
+from image_input import ImageInput
+from structured_output import ImageSummary, create_structured
 
 
 def test():
+    import base64
+    import httpx
+
     # Use configuration management for API key
     client = get_anthropic_client()
 
@@ -21,11 +20,16 @@ def test():
 
     return get_image_summary(image1_data)
 
-#input: picture. NEED TO MAKE SURE 
+#input: ImageInput, or a base64 string
 def get_image_summary(image_data):
-    image_media_type = "image/jpeg"
+    image = ImageInput.coerce(image_data)
+    image_data = image.base64
+    image_media_type = image.media_type or "image/jpeg"
     client = get_anthropic_client()
-    message = client.messages.create(
+    summary, _ = create_structured(
+        client,
+        ImageSummary,
+        stage="summary",
         model="claude-sonnet-4-20250514",
         max_tokens=1024,
         messages=[
@@ -42,14 +46,13 @@ def get_image_summary(image_data):
                     },
                     {
                         "type": "text",
-                        "text": "Generate a 50 word summary of this image. Extract key actions, objects, and relationships."
+                        "text": "Generate a 50 word summary of this image. Extract key actions, objects, and relationships. Record it with the record_summary tool."
                     }
                 ],
             }
         ],
     )
-    #print(message.content[0].text) #.content
-    return message.content[0].text
+    return summary.summary
 
 def main():
     test()
@@ -1,63 +1,37 @@
 import os, sys
-import anthropic
-from anthropic import Anthropic
-
-import base64
-import httpx
-from IPython.display import HTML, display
 import random
-import ast
 
 # Import configuration management
 from config import get_anthropic_key, get_anthropic_client
+from image_input import ImageInput
+from structured_output import WordList, create_structured
+
+WORD_LIST_PROMPT = "List up to 30 discrete, tangible objects in this image. Only include things that are actual objects; do not include abstract concepts, textures, lighting, shadows, blur, background, or vague body parts. Keep each object name generic and concise (1-3 words). Record them with the record_objects tool."
 
 
 def test():
-    # Use configuration management for API key
-    client = get_anthropic_client()
+    import base64
+    import httpx
 
     image1_url = "https://upload.wikimedia.org/wikipedia/commons/a/a7/Camponotus_flavomarginatus_ant.jpg"
     image1_url= "https://upload.wikimedia.org/wikipedia/commons/thumb/7/77/Wrexham_Village_student_accommodation%2C_Wrexham_-_geograph.org.uk_-_5666878.jpg/640px-Wrexham_Village_student_accommodation%2C_Wrexham_-_geograph.org.uk_-_5666878.jpg"
-    image1_media_type = "image/jpeg"
     image1_data = base64.standard_b64encode(httpx.get(image1_url).content).decode("utf-8")
 
-    # Display inline using HTML --> this is not working properly :(
-    #display(HTML(f'<img src="data:{image1_media_type};base64,{image1_data}" width="400">'))
-
-    message = client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=1024,
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": image1_media_type,
-                            "data": image1_data,
-                        },
-                    },
-                    {
-                        "type": "text",
-                        "text": "List up to 30 discrete, tangible objects in this image. Only include things that are actual objects; do not include abstract concepts, textures, lighting, shadows, blur, background, or vague body parts. Keep each object name generic and concise (1-3 words). Format your answer as a Python-style list, like: [\"object1\", \"object2\", ...]."
-                    }
-                ],
-            }
-        ],
-    )
-    list_of_words=message.content[0].text
-    list_of_words= ast.literal_eval(list_of_words)
+    list_of_words = get_image_words(image1_data)
     print(list_of_words) #.content
     print(random.choice(list_of_words))
 
 
-#input: picture. NEED TO MAKE SURE 
+#input: ImageInput, or a base64 string
 def get_image_words(image_data):
-    image_media_type = "image/jpeg"
+    image = ImageInput.coerce(image_data)
+    image_data = image.base64
+    image_media_type = image.media_type or "image/jpeg"
     client = get_anthropic_client()
-    message = client.messages.create(
+    word_list, _ = create_structured(
+        client,
+        WordList,
+        stage="words",
         model="claude-sonnet-4-20250514",
         max_tokens=1024,
         messages=[
@@ -74,14 +48,13 @@ def get_image_words(image_data):
                     },
                     {
                         "type": "text",
-                        "text": "List up to 30 discrete, tangible objects in this image. Only include things that are actual objects; do not include abstract concepts, textures, lighting, shadows, blur, background, or vague body parts. Keep each object name generic and concise (1-3 words). Format your answer as a Python-style list, like: [\"object1\", \"object2\", ...]."
+                        "text": WORD_LIST_PROMPT
                     }
                 ],
             }
         ],
     )
-    list_of_words=message.content[0].text
-    return ast.literal_eval(list_of_words)
+    return word_list.objects
 
 def main():
     test()
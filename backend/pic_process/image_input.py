@@ -0,0 +1,144 @@
+"""
+A single uploaded image shared by every pipeline stage.
+
+ImageInput holds the raw bytes and builds each other representation (base64
+text, PIL image, NumPy array, content hash) on first use, so a request decodes
+and encodes its image at most once no matter how many stages look at it.
+"""
+
+import base64
+import hashlib
+from functools import cached_property
+from io import BytesIO
+
+from PIL import Image
+
+
+# Formats the vision API accepts as-is
+SUPPORTED_MEDIA_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
+
+# ISO-BMFF brands found after "ftyp" in HEIF/AVIF files
+_HEIF_BRANDS = {b"heic", b"heix", b"hevc", b"hevx", b"heim", b"heis", b"mif1", b"msf1"}
+_AVIF_BRANDS = {b"avif", b"avis"}
+
+
+def sniff_media_type(data):
+    """Media type from the file's magic bytes, or None if unrecognized."""
+    if data[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[4:8] == b"ftyp":
+        if data[8:12] in _HEIF_BRANDS:
+            return "image/heic"
+        if data[8:12] in _AVIF_BRANDS:
+            return "image/avif"
+    if data[:2] == b"BM":
+        return "image/bmp"
+    if data[:4] in (b"II*\x00", b"MM\x00*"):
+        return "image/tiff"
+    return None
+
+
+def register_heif_opener():
+    """Let PIL open HEIC/AVIF files if the optional pillow-heif plugin is installed."""
+    try:
+        import pillow_heif
+    except ImportError:
+        raise ValueError("HEIC/AVIF images need the pillow-heif package installed")
+    pillow_heif.register_heif_opener()
+
+
+class ImageInput:
+    """
+    Raw image bytes plus lazily built views of them.
+
+    Args:
+        data (bytes): Encoded image file contents
+        media_type (str): Known media type; sniffed from `data` if omitted
+        base64_data (str): Base64 form of `data` if the caller already has it
+        pil (PIL.Image): Decoded RGB image if the caller already has it
+        original_size (tuple): (width, height) of the image this one was derived from
+        scale (float): Factor mapping this image's coordinates to `original_size`
+    """
+
+    def __init__(self, data, media_type=None, base64_data=None, pil=None, original_size=None, scale=1.0):
+        self.data = data
+        self._media_type = media_type
+        self.original_size = original_size
+        self.scale = scale
+        if base64_data is not None:
+            self.__dict__["base64"] = base64_data
+        if pil is not None:
+            self.__dict__["pil"] = pil
+
+    @classmethod
+    def from_base64(cls, image_data):
+        """Build from a base64 string, with or without a data URL prefix."""
+        if image_data.startswith("data:"):
+            image_data = image_data.split(",", 1)[1]
+        return cls(base64.b64decode(image_data), base64_data=image_data)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, "rb") as f:
+            return cls(f.read())
+
+    @classmethod
+    def coerce(cls, image):
+        """Accept an ImageInput, a base64 string or raw bytes."""
+        if isinstance(image, cls):
+            return image
+        if isinstance(image, (bytes, bytearray)):
+            return cls(bytes(image))
+        return cls.from_base64(image)
+
+    @property
+    def media_type(self):
+        if self._media_type is None:
+            self._media_type = sniff_media_type(self.data)
+        return self._media_type
+
+    @cached_property
+    def base64(self):
+        return base64.standard_b64encode(self.data).decode("utf-8")
+
+    @property
+    def is_supported(self):
+        """Whether the vision API accepts this image without transcoding."""
+        return self.media_type in SUPPORTED_MEDIA_TYPES
+
+    def open(self):
+        """Open the raw bytes with PIL (not yet decoded or converted)."""
+        if self.media_type in ("image/heic", "image/avif"):
+            register_heif_opener()
+        return Image.open(BytesIO(self.data))
+
+    @cached_property
+    def pil(self):
+        """Decoded image converted to RGB."""
+        return self.open().convert("RGB")
+
+    @cached_property
+    def array(self):
+        """HxWx3 uint8 view of the decoded image."""
+        import numpy as np
+        return np.asarray(self.pil)
+
+    @cached_property
+    def sha256(self):
+        return hashlib.sha256(self.data).hexdigest()
+
+    @property
+    def size(self):
+        return self.pil.size
+
+    def to_original(self, box):
+        """Map an [x0, y0, x1, y1] box from this image to original-image coordinates."""
+        if box is None:
+            return None
+        return [round(float(x) * self.scale, 2) for x in box]
@@ -1,59 +1,145 @@
-from generate_bounding_box import make_box
+from generate_bounding_box import make_box, make_boxes, boxes_to_dict, preload_detector
 from generate_summary import get_image_summary
 from generate_word_list import get_image_words
 
 import random
 import json
-import base64
-import httpx
-import io
+import time
 import sys
-from PIL import Image
-from io import BytesIO
-import numpy as np
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from config import config
+from result_cache import get_result_cache
+from preprocess import preprocess_image
+from image_input import ImageInput
+from single_flight import SingleFlight
+from timing import submit
+
+# Shared by all pic_process instances; stages are mostly waiting on the network
+# or on torch, which release the GIL
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="pic_process")
+
+# Concurrent requests for the same image share one analysis (keyed like the result cache)
+image_flight = SingleFlight()
+
+def set_pipeline_workers(max_workers):
+    """Resize the shared stage pool; batch runs need about three threads per image in flight."""
+    global _executor
+    previous, _executor = _executor, ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pic_process")
+    previous.shutdown(wait=False)
 
 class pic_process():
     image_index=0
-    def image_to_json(self, image):
+
+    def __init__(self, stage_timeouts=None):
+        """
+        Args:
+            stage_timeouts (dict): Optional per-stage timeouts in seconds
+                ("words", "summary", "decode", "detect"). Defaults come from config.
+        """
+        self.stage_timeouts = {**config.stage_timeouts, **(stage_timeouts or {})}
+        self._index_lock = threading.Lock()
+
+    def _next_request_id(self):
+        """Number the next request; one instance serves concurrent worker threads."""
+        with self._index_lock:
+            self.image_index = self.image_index + 1
+            return self.image_index
+
+    def _wait(self, stage, future, started):
+        """Wait for a stage's future, failing once its timeout has elapsed since it started."""
+        remaining = self.stage_timeouts[stage] - (time.monotonic() - started)
+        try:
+            return future.result(timeout=max(remaining, 0))
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError(f"{stage} stage timed out after {self.stage_timeouts[stage]}s")
+
+    def _detect(self, prepared, object_list, random_object, detect_all):
+        # Detection runs on the downscaled image; boxes are reported in original coordinates
+        if detect_all:
+            boxes = make_boxes(prepared.pil, object_list)
+            boxes[:, :4] *= prepared.scale
+            return boxes_to_dict(object_list, boxes)
+        return {random_object: prepared.to_original(make_box(prepared.pil, random_object))}, {}
+
+    def _analyze(self, image, detect_all, cache_key):
+        """Run every model stage on an image and store the result in the result cache."""
+        # Start loading the detector while we wait on the Anthropic calls
+        preload_detector()
+
+        # Orient, downscale and re-encode once; every stage uses the result
+        started = time.monotonic()
+        prepared = self._wait("decode", submit(_executor, "decode", preprocess_image, image), started)
+
+        # The word list and summary are independent, so they run together.
+        # Detection only needs the word list.
+        started = time.monotonic()
+        words_future = submit(_executor, "words", get_image_words, prepared)
+        summary_future = submit(_executor, "summary", get_image_summary, prepared)
+
+        object_list = self._wait("words", words_future, started)
+        if not object_list:
+            raise ValueError("No objects detected in image")
+        
+        random_object = random.choice(object_list)
+
+        detect_started = time.monotonic()
+        detect_future = submit(_executor, "detect", self._detect, prepared, object_list, random_object, detect_all)
+
+        summary = self._wait("summary", summary_future, started)
+        boxes, box_scores = self._wait("detect", detect_future, detect_started)
+
+        result = {
+            "description": summary,  # This is what question.py needs
+            "primary_object": random_object,
+            "objects": object_list,
+            "boxes": boxes,
+            "box_scores": box_scores,
+        }
+        if config.result_cache_entries:
+            get_result_cache().put(cache_key, result)
+        return result
+
+    def image_to_json(self, image, detect_all=True):
         """
         Process base64 image and return data compatible with question.py
         
         Args:
-            image (str): Base64 encoded image string
+            image (str | ImageInput): Base64 encoded image string, or an ImageInput
+            detect_all (bool): Locate every listed object in one detector pass.
+                If False, only the randomly chosen primary object is boxed.
             
         Returns:
             dict: Image analysis data compatible with question system
         """
         try:
-            # Image preprocessing
-            object_list = get_image_words(image)
-            if not object_list:
-                raise ValueError("No objects detected in image")
-            
-            random_object = random.choice(object_list)
-            summary = get_image_summary(image)
-            
-            # Convert base64 to PIL for bounding box detection
-            pil_image = self.base64_to_PIL(image)
-            box = make_box(pil_image, random_object)
+            image = ImageInput.coerce(image)
+
+            # Identical images (e.g. retries and re-uploads) skip every model call
+            cache_key = f"{image.sha256}:{'all' if detect_all else 'primary'}"
+            cached = get_result_cache().get(cache_key) if config.result_cache_entries else None
+            if cached is not None:
+                request_id = self._next_request_id()
+                print(f"Result cache hit for image #{request_id}", file=sys.stderr)
+                return {"request_id": request_id, **cached, "cached": True, "success": True}
+
+            # Identical images already being analyzed: wait for that result instead
+            result, shared = image_flight.do(cache_key, self._analyze, image, detect_all, cache_key)
             
-            self.image_index = self.image_index + 1
+            request_id = self._next_request_id()
 
             # Format compatible with question.py expectations
-            response = {
-                "request_id": self.image_index,
-                "description": summary,  # This is what question.py needs
-                "primary_object": random_object,
-                "objects": object_list,
-                "boxes": {random_object: box},
-                "success": True
-            }
+            response = {"request_id": request_id, **result, "success": True}
+            if shared:
+                response["coalesced"] = True
             
             # Debug prints (optional, can be removed in production)
-            print(f"Processed image #{self.image_index}", file=sys.stderr)
-            print(f"Objects found: {object_list}", file=sys.stderr)
-            print(f"Primary object: {random_object}", file=sys.stderr)
-            print(f"Description: {summary[:100]}...", file=sys.stderr)
+            print(f"Processed image #{request_id}{' (coalesced)' if shared else ''}", file=sys.stderr)
+            print(f"Objects found: {result['objects']}", file=sys.stderr)
+            print(f"Primary object: {result['primary_object']}", file=sys.stderr)
+            print(f"Description: {result['description'][:100]}...", file=sys.stderr)
 
             return response
             
@@ -71,7 +157,7 @@ class pic_process():
         Simplified interface that returns data ready for question.py
         
         Args:
-            base64_image (str): Base64 encoded image
+            base64_image (str | ImageInput): Base64 encoded image, or an ImageInput
             
         Returns:
             dict: Image data compatible with question system
@@ -94,18 +180,13 @@ class pic_process():
 
     #input: base64 str: "iVBORw0KGgoAAAANSUhEUgAA..." 
     def base64_to_PIL(self,base64_str):
-        # If the string contains the data URL prefix, remove it
-        if base64_str.startswith("data:image"):
-            base64_str = base64_str.split(",")[1]
-
-        # Decode Base64 to bytes
-        image_bytes = base64.b64decode(base64_str)
-
-        # Load bytes into a PIL Image
-        image = Image.open(BytesIO(image_bytes)).convert("RGB")
-        return image
+        # Handles the data URL prefix, decodes to bytes and loads as RGB
+        return ImageInput.from_base64(base64_str).pil
 
     def test(self):
+        import base64
+        import httpx
+
         image1_url= "https://upload.wikimedia.org/wikipedia/commons/thumb/7/77/Wrexham_Village_student_accommodation%2C_Wrexham_-_geograph.org.uk_-_5666878.jpg/640px-Wrexham_Village_student_accommodation%2C_Wrexham_-_geograph.org.uk_-_5666878.jpg"
         image1_media_type = "image/jpeg"
         image1_data = base64.standard_b64encode(httpx.get(image1_url).content).decode("utf-8")
@@ -0,0 +1,175 @@
+"""
+Image preprocessing applied before any model sees an upload.
+
+Phone photos arrive at full camera resolution, but the vision API downsizes
+anything above roughly 1.15 megapixels / 1568px on the long edge before
+counting image tokens, and Grounding DINO resizes to an 800px short edge
+anyway. Sending the full image only costs upload and decode time. This stage
+applies the EXIF orientation, drops metadata (EXIF including GPS, XMP,
+comments), downsizes to a pixel budget and re-encodes once; the resulting
+ImageInput is shared by every later stage.
+
+Images the API already accepts (JPEG, PNG, WebP, GIF) that are upright and
+within budget are not re-encoded. JPEG and PNG uploads carrying metadata have
+those segments cut out of the file losslessly; WebP and GIF uploads with
+metadata are transcoded like everything else, once, to JPEG.
+"""
+
+import math
+import struct
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+from config import config
+from image_input import ImageInput
+
+EXIF_ORIENTATION = 0x0112
+
+# APP1 (EXIF, XMP), APP13 (IPTC) and comments. JFIF, ICC (APP2) and Adobe
+# (APP14) segments affect how the image decodes and are kept.
+JPEG_METADATA_MARKERS = {0xE1, 0xED, 0xFE}
+PNG_METADATA_CHUNKS = {b"eXIf", b"tEXt", b"zTXt", b"iTXt", b"tIME"}
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def fit_to_budget(size, max_edge, max_pixels):
+    """Largest (width, height) with the same aspect ratio that fits both limits."""
+    width, height = size
+    factor = min(1.0, max_edge / max(width, height), math.sqrt(max_pixels / (width * height)))
+    return max(1, round(width * factor)), max(1, round(height * factor))
+
+
+def _strip_jpeg_metadata(data):
+    """JPEG bytes without metadata segments; the compressed image data is copied as-is."""
+    out = [data[:2]]  # SOI
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            raise ValueError("Malformed JPEG segment")
+        marker = data[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1
+            continue
+        if marker == 0xDA:  # start of scan: entropy-coded data runs to the end
+            out.append(data[pos:])
+            return b"".join(out)
+        length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+        if marker not in JPEG_METADATA_MARKERS:
+            out.append(data[pos:pos + 2 + length])
+        pos += 2 + length
+    raise ValueError("JPEG has no image data")
+
+
+def _strip_png_metadata(data):
+    """PNG bytes without text, time and EXIF chunks."""
+    out = [PNG_SIGNATURE]
+    pos = len(PNG_SIGNATURE)
+    while pos + 8 <= len(data):
+        length = struct.unpack(">I", data[pos:pos + 4])[0]
+        chunk_type = data[pos + 4:pos + 8]
+        end = pos + 12 + length  # length, type, data, CRC
+        if chunk_type not in PNG_METADATA_CHUNKS:
+            out.append(data[pos:end])
+        pos = end
+    return b"".join(out)
+
+
+def strip_metadata(data, media_type):
+    """
+    Remove metadata from JPEG or PNG bytes without re-encoding.
+
+    Returns:
+        bytes | None: The stripped file, or None for other formats
+    """
+    if media_type == "image/jpeg":
+        return _strip_jpeg_metadata(data)
+    if media_type == "image/png":
+        return _strip_png_metadata(data)
+    return None
+
+
+def _has_metadata(decoded):
+    """Whether PIL reports metadata; used for the formats strip_metadata doesn't parse."""
+    return bool(decoded.getexif()) or any(
+        key in decoded.info for key in ("exif", "xmp", "XML:com.adobe.xmp", "comment", "photoshop"))
+
+
+def preprocess_image(image, max_edge=None, max_pixels=None, quality=None):
+    """
+    Orient, downscale and re-encode an uploaded image.
+
+    Args:
+        image (ImageInput | str): Upload, or a base64 string with or without a data URL prefix
+        max_edge (int): Longest edge in pixels (default: config.image_max_edge)
+        max_pixels (int): Pixel budget (default: config.image_max_pixels)
+        quality (int): JPEG quality (default: config.image_jpeg_quality)
+
+    Returns:
+        ImageInput: JPEG at the processed size, with its decoded image already
+        attached and `scale` / `original_size` set for mapping boxes back
+    """
+    max_edge = max_edge or config.image_max_edge
+    max_pixels = max_pixels or config.image_max_pixels
+    quality = quality or config.image_jpeg_quality
+
+    source = ImageInput.coerce(image)
+    if source.media_type is None:
+        raise ValueError("Unrecognized image format")
+    decoded = source.open()
+
+    # Size as the user sees it: EXIF orientations 5-8 swap width and height
+    width, height = decoded.size
+    orientation = decoded.getexif().get(EXIF_ORIENTATION, 1)
+    if orientation in (5, 6, 7, 8):
+        width, height = height, width
+    original_size = (width, height)
+    target_size = fit_to_budget(original_size, max_edge, max_pixels)
+
+    # Nothing to fix: send the upload as-is and skip the decode-encode cycle
+    if source.is_supported and orientation == 1 and target_size == original_size:
+        # JPEG and PNG are always scanned: PIL files PNG text chunks under
+        # arbitrary .info keys ("Software", "Author", ...), so it can't tell us
+        try:
+            stripped = strip_metadata(source.data, source.media_type)
+        except (ValueError, struct.error):
+            stripped = None  # unparseable; the transcode below drops any metadata instead
+        if stripped is None:
+            clean = source.media_type not in ("image/jpeg", "image/png") and not _has_metadata(decoded)
+        else:
+            clean = len(stripped) == len(source.data)
+        if clean:
+            source.original_size = original_size
+            source.scale = 1.0
+            return source
+        if stripped is not None:
+            return ImageInput(stripped, media_type=source.media_type, pil=decoded.convert("RGB"),
+                              original_size=original_size, scale=1.0)
+
+    # draft() lets the JPEG decoder skip straight to a reduced scale (never below the target)
+    if decoded.format == "JPEG" and target_size != original_size:
+        raw_target = target_size if original_size == decoded.size else target_size[::-1]
+        decoded.draft("RGB", raw_target)
+    decoded = ImageOps.exif_transpose(decoded)
+    if decoded.mode in ("RGBA", "LA") or (decoded.mode == "P" and "transparency" in decoded.info):
+        # Flatten transparency onto white rather than letting it turn black
+        decoded = decoded.convert("RGBA")
+        background = Image.new("RGB", decoded.size, (255, 255, 255))
+        background.paste(decoded, mask=decoded.getchannel("A"))
+        decoded = background
+    else:
+        decoded = decoded.convert("RGB")
+    if decoded.size != target_size:
+        decoded = decoded.resize(target_size, Image.LANCZOS)
+
+    # Re-encoding without exif= drops all metadata
+    buffer = BytesIO()
+    decoded.save(buffer, format="JPEG", quality=quality, optimize=True)
+
+    return ImageInput(
+        buffer.getvalue(),
+        media_type="image/jpeg",
+        pil=decoded,
+        original_size=original_size,
+        scale=original_size[0] / target_size[0],
+    )
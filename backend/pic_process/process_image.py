@@ -6,46 +6,230 @@ Accepts base64 image data and returns JSON output compatible with question.py.
 Usage:
     python3 process_image.py --base64 <base64_image_data>
     python3 process_image.py --file <path_to_image_file>
+    python3 process_image.py --dir <image_directory> --output results.jsonl
+    python3 process_image.py --manifest <manifest_file> --output results.jsonl --concurrency 16
 
 Output:
     JSON object with image analysis data compatible with question.py
+
+Batch mode (--dir or --manifest):
+    Processes many images in one process, --concurrency at a time, with model
+    calls capped at --api-concurrency and detector passes at
+    --detector-concurrency. Appends one JSON line per image to --output:
+        {"path", "sha256", "success", ...analysis}
+    Images whose content hash already has a successful record in the output
+    are skipped, so an interrupted run resumes where it stopped and duplicate
+    files are processed once. Throughput and ETA are printed to stderr.
+
+    A manifest lists one image per line, either as a path or as JSON with a
+    "path" key (plus any fields to copy into the record); relative paths are
+    resolved against the manifest's directory.
 """
 
+import os
 import sys
 import json
+import time
 import argparse
-import base64
-from interface import pic_process
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from interface import pic_process, set_pipeline_workers
+from image_input import ImageInput
+from api_calls import api_calls
+from generate_bounding_box import detector_limit
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.heif', '.avif', '.bmp', '.tiff')
+
+def iter_directory(directory):
+    """Yield ({"path"}, path) for every image under directory, in sorted order."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                path = os.path.join(root, name)
+                yield {"path": path}, path
+
+def iter_manifest(manifest):
+    """Yield (entry, resolved path) for every manifest line; entries keep their extra fields."""
+    base_dir = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            entry = json.loads(line) if line.startswith("{") else {"path": line}
+            yield entry, os.path.join(base_dir, os.path.expanduser(entry["path"]))
+
+def completed_hashes(output_path):
+    """Content hashes that already have a successful record in the output file."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("success") and record.get("sha256"):
+                done.add(record["sha256"])
+    return done
+
+class Progress:
+    """Counts outcomes and prints throughput and ETA at most every `interval` seconds."""
+
+    def __init__(self, total, interval=5.0):
+        self.total = total
+        self.interval = interval
+        self.started = time.monotonic()
+        self.counts = {"processed": 0, "failed": 0, "skipped": 0}
+        self._last_report = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+            due = time.monotonic() - self._last_report >= self.interval
+            if due:
+                self._last_report = time.monotonic()
+        if due:
+            self.report()
+
+    def report(self, final=False):
+        with self._lock:
+            counts = dict(self.counts)
+        elapsed = time.monotonic() - self.started
+        finished = sum(counts.values())
+        worked = counts["processed"] + counts["failed"]
+        rate = worked / elapsed if elapsed > 0 else 0.0
+        line = (f"[{finished}/{self.total if self.total is not None else '?'}] "
+                f"{counts['processed']} ok, {counts['failed']} failed, {counts['skipped']} skipped; "
+                f"{rate:.2f} images/s")
+        if not final and self.total is not None and rate > 0:
+            eta = (self.total - finished) / rate
+            line += f", ETA {int(eta // 3600)}:{int(eta % 3600 // 60):02d}:{int(eta % 60):02d}"
+        elif final:
+            line += f" in {elapsed:.1f}s"
+        print(line, file=sys.stderr, flush=True)
+
+def run_batch(images, output_path, output_format='question', concurrency=8,
+              api_concurrency=None, detector_concurrency=1, total=None, progress_interval=5.0):
+    """
+    Process (entry, path) pairs concurrently, appending one JSON line per image.
+
+    Args:
+        images: Iterable of (entry dict, image path)
+        output_path (str): JSON-lines file to append to (and read for hashes to skip)
+        output_format (str): 'question' (process_base64_image) or 'json' (image_to_json)
+        concurrency (int): Images in flight
+        api_concurrency (int): Model calls in flight (default: two per image in flight)
+        detector_concurrency (int): Detector forward passes at once (0 means unlimited)
+        total (int): Number of images, for the ETA
+
+    Returns:
+        dict: {"processed", "failed", "skipped"} counts
+    """
+    api_calls.limit.set_limit(api_concurrency if api_concurrency is not None else 2 * concurrency)
+    detector_limit.set_limit(detector_concurrency)
+    # Each image holds up to three stage threads (words, summary, then detect)
+    set_pipeline_workers(3 * concurrency)
+
+    processor = pic_process()
+    done = completed_hashes(output_path)
+    claimed = set(done)
+    claim_lock = threading.Lock()
+    write_lock = threading.Lock()
+    progress = Progress(total, progress_interval)
+
+    def process(entry, path):
+        record = {**entry, "path": path}
+        try:
+            image = ImageInput.from_file(path)
+            record["sha256"] = image.sha256
+            with claim_lock:
+                if image.sha256 in claimed:
+                    return "skipped", None
+                claimed.add(image.sha256)
+            if output_format == 'question':
+                result = processor.process_base64_image(image)
+            else:
+                result = processor.image_to_json(image)
+            error = result.get("message") if result.get("success") is False else result.get("error")
+            record.update(result)
+            record["success"] = not error
+            if error:
+                record["error"] = error
+        except Exception as e:
+            record.update(success=False, error=f"{type(e).__name__}: {e}")
+        return ("processed" if record["success"] else "failed"), record
+
+    with open(output_path, "a", encoding="utf-8") as output, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as executor:
+        pending = set()
+        # Keep a bounded window of submitted images so huge corpora aren't queued up front
+        for entry, path in images:
+            if len(pending) >= 2 * concurrency:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                _write_results(finished, output, write_lock, progress)
+            pending.add(executor.submit(process, entry, path))
+        _write_results(pending, output, write_lock, progress)
+
+    progress.report(final=True)
+    return progress.counts
+
+def _write_results(futures, output, write_lock, progress):
+    for future in futures:
+        outcome, record = future.result()
+        if record is not None:
+            with write_lock:
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+        progress.add(outcome)
 
 def main():
     parser = argparse.ArgumentParser(description='Process image and return analysis data')
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument('--base64', type=str, help='Base64 encoded image data')
     group.add_argument('--file', type=str, help='Path to image file')
+    group.add_argument('--dir', type=str, help='Process every image under this directory (batch mode)')
+    group.add_argument('--manifest', type=str, help='Process the images listed in this file (batch mode)')
     parser.add_argument('--format', choices=['json', 'question'], default='question', 
                        help='Output format: json (full data) or question (question.py compatible)')
+    parser.add_argument('--output', type=str, help='Batch mode: JSON-lines file results are appended to')
+    parser.add_argument('--concurrency', type=int, default=8, help='Batch mode: images in flight')
+    parser.add_argument('--api-concurrency', type=int,
+                        help='Batch mode: model calls in flight (default: 2 x --concurrency)')
+    parser.add_argument('--detector-concurrency', type=int, default=1,
+                        help='Batch mode: detector forward passes at once (0 = unlimited)')
+    parser.add_argument('--progress-interval', type=float, default=5.0,
+                        help='Batch mode: seconds between progress lines')
+    
+    args = parser.parse_args()
+    if args.dir or args.manifest:
+        if not args.output:
+            parser.error("--dir and --manifest need --output")
+        if args.concurrency < 1:
+            parser.error("--concurrency must be at least 1")
+        sys.exit(batch_main(args))
     
     try:
-        args = parser.parse_args()
-        
         # Initialize pic_process
         processor = pic_process()
         
         if args.base64:
             # Process base64 data
-            base64_data = args.base64
+            image = ImageInput.from_base64(args.base64)
         else:
-            # Read file and convert to base64
-            with open(args.file, 'rb') as f:
-                image_bytes = f.read()
-                base64_data = base64.standard_b64encode(image_bytes).decode('utf-8')
+            # Read file bytes directly; base64 is only built if a stage needs it
+            image = ImageInput.from_file(args.file)
         
         if args.format == 'question':
             # Return format compatible with question.py
-            result = processor.process_base64_image(base64_data)
+            result = processor.process_base64_image(image)
         else:
             # Return full analysis data
-            result = processor.image_to_json(base64_data)
+            result = processor.image_to_json(image)
         
         # Output the result (for consumption by other systems)
         print(json.dumps(result, indent=2))
@@ -68,5 +252,17 @@ def main():
         sys.stderr.write(f"Error processing image: {str(e)}\n")
         sys.exit(1)
 
+def batch_main(args):
+    source = iter_directory(args.dir) if args.dir else iter_manifest(args.manifest)
+    # Listing is cheap next to processing; knowing the total gives an ETA
+    images = list(source)
+    print(f"{len(images)} images, {args.concurrency} at a time", file=sys.stderr)
+
+    counts = run_batch(images, args.output, args.format, args.concurrency, args.api_concurrency,
+                       args.detector_concurrency, total=len(images), progress_interval=args.progress_interval)
+    print(json.dumps({**counts, "api_calls": api_calls.stats()["concurrency"],
+                      "detector": detector_limit.stats()}), file=sys.stderr)
+    return 1 if counts["failed"] else 0
+
 if __name__ == "__main__":
     main()
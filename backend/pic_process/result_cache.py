@@ -0,0 +1,166 @@
+"""
+Content-addressed cache for image_to_json results.
+
+Keys are a SHA-256 of the decoded image bytes, so the same photo maps to the
+same entry whether or not it arrived with a data:image/...;base64, prefix.
+Entries live in a bounded in-memory LRU and, optionally, as JSON files on disk
+under config.upload_path so they survive process restarts. Values are copied
+on the way in and out, so callers can't change what later hits see.
+"""
+
+import copy
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from config import config
+from image_input import ImageInput
+
+
+def image_key(image):
+    """SHA-256 hex digest of the decoded image bytes (ImageInput or base64 string)."""
+    return ImageInput.coerce(image).sha256
+
+
+class ResultCache:
+    """
+    Two-tier (memory LRU + optional disk) cache with a TTL.
+
+    Args:
+        max_entries (int): Entries kept in memory before the least recently used is evicted
+        ttl (float): Seconds an entry stays valid (0 means no expiry)
+        disk_dir (str): Directory for the disk tier, or None to keep results in memory only
+        max_disk_bytes (int): Disk tier size limit; oldest files are removed first
+    """
+
+    def __init__(self, max_entries=256, ttl=86400, disk_dir=None, max_disk_bytes=256 * 2**20):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    def _expired(self, stored_at):
+        return self.ttl > 0 and time.time() - stored_at > self.ttl
+
+    def _disk_path(self, key):
+        return self.disk_dir / f"{key}.json"
+
+    def get(self, key):
+        """Return the cached value for key, or None."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if not self._expired(stored_at):
+                    self._memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return copy.deepcopy(value)
+                del self._memory[key]
+                self.counters["expired"] += 1
+
+        value = self._disk_get(key)
+        with self._lock:
+            if value is None:
+                self.counters["misses"] += 1
+            else:
+                self.counters["disk_hits"] += 1
+        return value
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._expired(entry["stored_at"]):
+            path.unlink(missing_ok=True)
+            with self._lock:
+                self.counters["expired"] += 1
+            return None
+        # Promote into the memory tier
+        self._memory_put(key, entry["stored_at"], copy.deepcopy(entry["value"]))
+        return entry["value"]
+
+    def put(self, key, value):
+        """Store a JSON-serializable value under key in every enabled tier."""
+        stored_at = time.time()
+        self._memory_put(key, stored_at, copy.deepcopy(value))
+        if self.disk_dir:
+            try:
+                tmp_path = self._disk_path(key).with_suffix(".tmp")
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"stored_at": stored_at, "value": value}, f, ensure_ascii=False)
+                os.replace(tmp_path, self._disk_path(key))
+                self._evict_disk()
+            except OSError as e:
+                print(f"Result cache write failed: {e}", file=sys.stderr)
+
+    def _memory_put(self, key, stored_at, value):
+        with self._lock:
+            self._memory[key] = (stored_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def _evict_disk(self):
+        files = sorted(self.disk_dir.glob("*.json"), key=lambda p: p.stat().st_mtime)
+        total = sum(p.stat().st_size for p in files)
+        for path in files:
+            if total <= self.max_disk_bytes:
+                break
+            total -= path.stat().st_size
+            path.unlink(missing_ok=True)
+            with self._lock:
+                self.counters["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.disk_dir:
+            for path in self.disk_dir.glob("*.json"):
+                path.unlink(missing_ok=True)
+
+    def stats(self):
+        """Hit/miss counters plus current memory-tier size."""
+        with self._lock:
+            lookups = sum(self.counters[k] for k in ("memory_hits", "disk_hits", "misses"))
+            hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+            return {
+                **self.counters,
+                "memory_entries": len(self._memory),
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+# Process-wide result cache, built on first use so importing this module
+# doesn't read .env or create the disk directory
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Return the process-wide ResultCache, configured from config on first call."""
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = ResultCache(
+                    max_entries=config.result_cache_entries,
+                    ttl=config.result_cache_ttl,
+                    disk_dir=os.path.join(config.upload_path, "result_cache") if config.result_cache_disk else None,
+                    max_disk_bytes=config.result_cache_disk_mb * 2**20,
+                )
+    return _result_cache
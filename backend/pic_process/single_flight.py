@@ -0,0 +1,89 @@
+"""
+Single-flight coalescing of identical in-flight work.
+
+When a phone double-submits, or a class uploads the same shared photo at the
+same moment, the requests arrive before any of them has filled the result
+cache. SingleFlight lets the first request for a key (the leader) do the work
+while later requests for the same key wait for it and get a copy of its result
+(or its exception) instead of starting their own computation.
+"""
+
+import copy
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one computation per key at a time.
+
+    Usage:
+        flight = SingleFlight()
+        result, shared = flight.do(key, compute, arg1, arg2)
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.counters = {"leaders": 0, "coalesced": 0, "errors": 0}
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) unless a call for key is already in flight.
+
+        Returns:
+            tuple: (result, shared) where shared is True if the result came from
+            another caller's computation. Waiters get their own deep copy, so they
+            may modify it freely.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.counters["leaders"] += 1
+            else:
+                call.waiters += 1
+                self.counters["coalesced"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result), True
+
+        result = None
+        try:
+            result = fn(*args, **kwargs)
+            return result, False
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self.counters["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                waiters = call.waiters
+            # Runs before the leader's caller sees (and can modify) the result
+            if waiters and call.error is None:
+                call.result = copy.deepcopy(result)
+            call.done.set()
+
+    def stats(self):
+        """Leader/coalesced counters plus the number of keys currently in flight."""
+        with self._lock:
+            lookups = self.counters["leaders"] + self.counters["coalesced"]
+            return {
+                **self.counters,
+                "in_flight": len(self._calls),
+                "coalesced_rate": round(self.counters["coalesced"] / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,306 @@
+"""
+Schema-enforced structured output for model calls.
+
+Every call that needs machine-readable output (word lists, summaries, Q&A
+sets, evaluations) declares a single tool whose input_schema is the shape we
+want and forces the model to call it with tool_choice. The tool input arrives
+as already-parsed JSON, so there are no ```json fences to strip and nothing to
+literal_eval. The input is then checked against the schema and turned into a
+typed object; a reply that doesn't conform is retried as that one call, never
+as the whole request.
+"""
+
+import sys
+from dataclasses import dataclass, asdict, fields
+from typing import ClassVar
+
+from config import config
+from api_calls import api_calls
+
+
+class StructuredOutputError(ValueError):
+    """The model's reply did not match the requested schema."""
+
+
+_JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+}
+
+
+def validate(data, schema, path="$"):
+    """
+    Check `data` against the subset of JSON Schema used in this module.
+
+    Supports type, properties, required, items, enum, minimum, maximum,
+    minItems and maxItems. Raises StructuredOutputError naming the first
+    offending path.
+    """
+    expected = schema.get("type")
+    if expected:
+        python_type = _JSON_TYPES[expected]
+        # bool is an int subclass, but true/false is never a valid number here
+        if not isinstance(data, python_type) or (expected != "boolean" and isinstance(data, bool)):
+            raise StructuredOutputError(f"{path}: expected {expected}, got {type(data).__name__}")
+
+    if "enum" in schema and data not in schema["enum"]:
+        raise StructuredOutputError(f"{path}: {data!r} is not one of {schema['enum']}")
+    if "minimum" in schema and data < schema["minimum"]:
+        raise StructuredOutputError(f"{path}: {data} is below the minimum {schema['minimum']}")
+    if "maximum" in schema and data > schema["maximum"]:
+        raise StructuredOutputError(f"{path}: {data} is above the maximum {schema['maximum']}")
+
+    if expected == "object":
+        for name in schema.get("required", []):
+            if name not in data:
+                raise StructuredOutputError(f"{path}: missing required field '{name}'")
+        for name, subschema in schema.get("properties", {}).items():
+            if name in data:
+                validate(data[name], subschema, f"{path}.{name}")
+    elif expected == "array":
+        if "minItems" in schema and len(data) < schema["minItems"]:
+            raise StructuredOutputError(f"{path}: expected at least {schema['minItems']} items, got {len(data)}")
+        if "maxItems" in schema and len(data) > schema["maxItems"]:
+            raise StructuredOutputError(f"{path}: expected at most {schema['maxItems']} items, got {len(data)}")
+        if "items" in schema:
+            for i, item in enumerate(data):
+                validate(item, schema["items"], f"{path}[{i}]")
+
+
+class StructuredOutput:
+    """
+    Base for typed model outputs.
+
+    Subclasses are dataclasses that set TOOL_NAME, DESCRIPTION and SCHEMA.
+    """
+
+    TOOL_NAME: ClassVar[str]
+    DESCRIPTION: ClassVar[str]
+    SCHEMA: ClassVar[dict]
+
+    @classmethod
+    def tool(cls):
+        """Tool definition that makes the model answer in this shape."""
+        return {"name": cls.TOOL_NAME, "description": cls.DESCRIPTION, "input_schema": cls.SCHEMA}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Validate a parsed tool input and build the typed object."""
+        validate(data, cls.SCHEMA)
+        return cls(**{f.name: data[f.name] for f in fields(cls) if f.name in data})
+
+    @classmethod
+    def from_message(cls, message):
+        """Typed object from the forced tool call in a Messages API response."""
+        for block in message.content:
+            if getattr(block, "type", None) == "tool_use" and block.name == cls.TOOL_NAME:
+                return cls.from_dict(block.input)
+        if getattr(message, "stop_reason", None) == "max_tokens":
+            raise StructuredOutputError(f"{cls.TOOL_NAME}: reply was cut off at max_tokens")
+        raise StructuredOutputError(f"{cls.TOOL_NAME}: reply contained no tool call")
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def _string_list(max_items=None):
+    schema = {"type": "array", "items": {"type": "string"}}
+    if max_items:
+        schema["maxItems"] = max_items
+    return schema
+
+
+@dataclass
+class WordList(StructuredOutput):
+    objects: list
+
+    TOOL_NAME: ClassVar[str] = "record_objects"
+    DESCRIPTION: ClassVar[str] = "Record the objects visible in the image."
+    SCHEMA: ClassVar[dict] = {
+        "type": "object",
+        "properties": {
+            "objects": {
+                **_string_list(max_items=30),
+                "minItems": 1,
+                "description": "Generic, concise (1-3 word) names of discrete, tangible objects",
+            },
+        },
+        "required": ["objects"],
+    }
+
+
+@dataclass
+class ImageSummary(StructuredOutput):
+    summary: str
+
+    TOOL_NAME: ClassVar[str] = "record_summary"
+    DESCRIPTION: ClassVar[str] = "Record the summary of the image."
+    SCHEMA: ClassVar[dict] = {
+        "type": "object",
+        "properties": {
+            "summary": {"type": "string", "description": "About 50 words: key actions, objects and relationships"},
+        },
+        "required": ["summary"],
+    }
+
+
+QA_ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "question": {"type": "string", "description": "Question in the target language"},
+        "expected_answer": {"type": "string", "description": "Expected answer in the target language"},
+        "question_type": {"type": "string", "enum": ["comprehension", "vocabulary", "grammar", "cultural"]},
+        "difficulty": {"type": "integer", "minimum": 1, "maximum": 5},
+        "points": {"type": "integer", "minimum": 0, "maximum": 100},
+    },
+    "required": ["question", "expected_answer", "question_type", "difficulty", "points"],
+}
+
+
+@dataclass
+class QAItem(StructuredOutput):
+    question: str
+    expected_answer: str
+    question_type: str
+    difficulty: int
+    points: int
+
+    TOOL_NAME: ClassVar[str] = "record_qa_item"
+    DESCRIPTION: ClassVar[str] = "Record one question-answer set."
+    SCHEMA: ClassVar[dict] = QA_ITEM_SCHEMA
+
+
+@dataclass
+class QASetResponse(StructuredOutput):
+    level: str
+    language: str
+    qa_sets: list
+
+    TOOL_NAME: ClassVar[str] = "record_qa_sets"
+    DESCRIPTION: ClassVar[str] = "Record the question-answer sets for the learner."
+    SCHEMA: ClassVar[dict] = {
+        "type": "object",
+        "properties": {
+            "level": {"type": "string", "description": "The learner's CEFR level"},
+            "language": {"type": "string", "description": "The target language"},
+            "qa_sets": {"type": "array", "items": QA_ITEM_SCHEMA, "minItems": 3, "maxItems": 3},
+        },
+        "required": ["level", "language", "qa_sets"],
+    }
+
+    @classmethod
+    def from_dict(cls, data):
+        response = super().from_dict(data)
+        response.qa_sets = [QAItem(**item) for item in response.qa_sets]
+        return response
+
+
+@dataclass
+class Evaluation(StructuredOutput):
+    question_id: int
+    question: str
+    expected_answer: str
+    student_answer: str
+    points_earned: float
+    max_points: float
+    percentage: float
+    feedback: str
+    areas_for_improvement: list
+    strengths: list
+
+    TOOL_NAME: ClassVar[str] = "record_evaluation"
+    DESCRIPTION: ClassVar[str] = "Record the evaluation of the student's answer."
+    SCHEMA: ClassVar[dict] = {
+        "type": "object",
+        "properties": {
+            "question_id": {"type": "integer"},
+            "question": {"type": "string"},
+            "expected_answer": {"type": "string"},
+            "student_answer": {"type": "string"},
+            "points_earned": {"type": "number", "minimum": 0},
+            "max_points": {"type": "number", "minimum": 0},
+            "percentage": {"type": "number", "minimum": 0, "maximum": 100},
+            "feedback": {"type": "string", "description": "Detailed constructive feedback in English"},
+            "areas_for_improvement": _string_list(),
+            "strengths": _string_list(),
+        },
+        "required": ["question_id", "question", "expected_answer", "student_answer", "points_earned",
+                     "max_points", "percentage", "feedback", "areas_for_improvement", "strengths"],
+    }
+
+
+@dataclass
+class QuestionList(StructuredOutput):
+    level: str
+    questions: list
+
+    TOOL_NAME: ClassVar[str] = "record_questions"
+    DESCRIPTION: ClassVar[str] = "Record the questions for the learner."
+    SCHEMA: ClassVar[dict] = {
+        "type": "object",
+        "properties": {
+            "level": {"type": "string"},
+            "questions": {**_string_list(max_items=3), "minItems": 3},
+        },
+        "required": ["level", "questions"],
+    }
+
+
+@dataclass
+class Feedback(StructuredOutput):
+    question: str
+    answer: str
+    points: int
+    feedback: str
+
+    TOOL_NAME: ClassVar[str] = "record_feedback"
+    DESCRIPTION: ClassVar[str] = "Record the feedback for the student's answer."
+    SCHEMA: ClassVar[dict] = {
+        "type": "object",
+        "properties": {
+            "question": {"type": "string"},
+            "answer": {"type": "string"},
+            "points": {"type": "integer", "minimum": 0, "maximum": 100},
+            "feedback": {"type": "string"},
+        },
+        "required": ["question", "answer", "points", "feedback"],
+    }
+
+
+def structured_request(output_type, **request):
+    """Messages API keyword arguments that force a reply through output_type's tool."""
+    return dict(
+        request,
+        tools=[output_type.tool()],
+        tool_choice={"type": "tool", "name": output_type.TOOL_NAME},
+    )
+
+
+def create_structured(client, output_type, stage="default", max_attempts=None, **request):
+    """
+    Make a messages.create call whose reply must match output_type.
+
+    The call runs under `stage`'s deadline, retry and hedging policy (see
+    api_calls). A reply that fails validation is retried as the same call, up
+    to max_attempts (default: config.structured_output_attempts).
+
+    Returns:
+        tuple: (output_type instance, the Messages API response it came from)
+
+    Raises:
+        StructuredOutputError: if no attempt produced a valid reply
+    """
+    max_attempts = max_attempts or config.structured_output_attempts
+    request = structured_request(output_type, **request)
+    for attempt in range(1, max_attempts + 1):
+        message = api_calls.create(stage, client, **request)
+        try:
+            return output_type.from_message(message), message
+        except StructuredOutputError as e:
+            error = e
+            print(f"{output_type.TOOL_NAME}: attempt {attempt}/{max_attempts} invalid ({e})", file=sys.stderr)
+    raise error
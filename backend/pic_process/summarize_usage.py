@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Summarize the usage log written by usage.py.
+
+Groups model calls by any of the logged fields (stage, language, level,
+model, request_type) and reports calls, tokens, cache hit ratio, cost and
+latency percentiles per group.
+
+Usage:
+    python3 summarize_usage.py                                  # default log, grouped by stage
+    python3 summarize_usage.py uploads/usage.jsonl --by stage,language,level
+    python3 summarize_usage.py --since 2026-10-01 --json
+"""
+
+import argparse
+import json
+import sys
+from collections import defaultdict
+
+from config import config
+from usage import TOKEN_FIELDS
+
+
+def read_log(path, since=None):
+    """Yield usage records from a JSON-lines log, skipping malformed lines."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if since and record.get("ts", "") < since:
+                continue
+            yield record
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(q / 100 * (len(ordered) - 1)))]
+
+
+def summarize(records, by):
+    """Aggregate records into {group tuple: summary dict}."""
+    groups = defaultdict(list)
+    for record in records:
+        groups[tuple(record.get(key) or "-" for key in by)].append(record)
+
+    summary = {}
+    for key, items in sorted(groups.items(), key=lambda kv: tuple(str(k) for k in kv[0])):
+        totals = {field: sum(r.get(field, 0) for r in items) for field in TOKEN_FIELDS}
+        costs = [r["cost_usd"] for r in items if r.get("cost_usd") is not None]
+        latencies = [r["latency_ms"] for r in items if "latency_ms" in r]
+        prompt_tokens = totals["input_tokens"] + totals["cache_creation_input_tokens"] + totals["cache_read_input_tokens"]
+        summary[key] = {
+            "calls": len(items),
+            "requests": len({r["request_id"] for r in items if r.get("request_id")}),
+            **totals,
+            "cache_read_ratio": round(totals["cache_read_input_tokens"] / prompt_tokens, 3) if prompt_tokens else 0.0,
+            "cost_usd": round(sum(costs), 4),
+            "cost_per_call_usd": round(sum(costs) / len(costs), 5) if costs else None,
+            "latency_p50_ms": percentile(latencies, 50) if latencies else None,
+            "latency_p95_ms": percentile(latencies, 95) if latencies else None,
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize model token usage and cost')
+    parser.add_argument('log', nargs='?', help='Usage log (default: USAGE_LOG or UPLOAD_PATH/usage.jsonl)')
+    parser.add_argument('--by', default='stage',
+                        help='Comma-separated fields to group by: stage, language, level, model, request_type')
+    parser.add_argument('--since', help='Only records at or after this ISO timestamp/date')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    path = args.log or config.usage_log
+    if not path:
+        parser.error("No usage log given and USAGE_LOG is disabled")
+    by = [field for field in args.by.split(',') if field]
+
+    try:
+        summary = summarize(read_log(path, args.since), by)
+    except FileNotFoundError:
+        print(f"Usage log not found: {path}", file=sys.stderr)
+        return 1
+
+    if args.json:
+        print(json.dumps([{**dict(zip(by, key)), **values} for key, values in summary.items()], indent=2))
+        return 0
+
+    header = f"{' / '.join(by):<36} {'calls':>6} {'input':>9} {'output':>9} {'cache rd':>9} {'cost $':>9} {'p50 ms':>8} {'p95 ms':>8}"
+    print(header)
+    print("-" * len(header))
+    for key, s in summary.items():
+        print(f"{' / '.join(str(k) for k in key):<36} {s['calls']:>6} {s['input_tokens']:>9} {s['output_tokens']:>9} "
+              f"{s['cache_read_input_tokens']:>9} {s['cost_usd']:>9.4f} "
+              f"{s['latency_p50_ms'] or 0:>8.0f} {s['latency_p95_ms'] or 0:>8.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Tests for api_calls.ApiCaller: retries, retry-after, deadlines, hedging and streams.
+
+A fake client stands in for the Anthropic SDK and sleeps are recorded rather
+than taken, so the tests are deterministic and need no network or API key.
+Run with: python3 -m pytest test_api_calls.py
+"""
+
+import threading
+from types import SimpleNamespace
+
+import anthropic
+import httpx
+import pytest
+
+import api_calls as api_calls_module
+from api_calls import ApiCaller
+
+
+@pytest.fixture(autouse=True)
+def no_usage_log(monkeypatch):
+    monkeypatch.setenv("USAGE_LOG", "")
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Backoff sleeps, recorded instead of slept."""
+    recorded = []
+    monkeypatch.setattr(api_calls_module.time, "sleep", recorded.append)
+    return recorded
+
+
+def make_caller(**overrides):
+    settings = dict(
+        api_deadlines={"default": 10.0}, api_max_retries=3, api_backoff_base=0.01, api_backoff_max=0.01,
+        api_hedge=False, api_hedge_quantile=0.95, api_hedge_min_samples=1, api_hedge_min_delay=0.05,
+        api_concurrency=0,
+    )
+    settings.update(overrides)
+    return ApiCaller(SimpleNamespace(**settings), max_hedge_threads=2)
+
+
+def status_error(status, headers=None):
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return anthropic.APIStatusError(f"HTTP {status}", response=response, body=None)
+
+
+def message(text="ok"):
+    return SimpleNamespace(
+        content=[SimpleNamespace(type="text", text=text)],
+        model="claude-sonnet-4-20250514",
+        usage=SimpleNamespace(input_tokens=10, output_tokens=5,
+                              cache_creation_input_tokens=0, cache_read_input_tokens=0),
+    )
+
+
+class FakeClient:
+    """
+    Plays back `outcomes` in order: an exception is raised, a callable is
+    called with the request, anything else is returned.
+    """
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.requests = []
+        self.options = []
+        self.messages = self
+        self._lock = threading.Lock()
+
+    def with_options(self, **options):
+        self.options.append(options)
+        return self
+
+    def _next(self, request):
+        with self._lock:
+            self.requests.append(request)
+            outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome(request) if callable(outcome) else outcome
+
+    def create(self, **request):
+        return self._next(request)
+
+    def stream(self, **request):
+        return FakeStreamManager(self, request)
+
+
+class FakeStreamManager:
+    def __init__(self, client, request):
+        self.client = client
+        self.request = request
+
+    def __enter__(self):
+        return self.client._next(self.request)
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeStream:
+    def __init__(self, events, final):
+        self.events = events
+        self.final = final
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def get_final_message(self):
+        return self.final
+
+
+def test_overloaded_then_success(sleeps):
+    reply = message()
+    client = FakeClient(status_error(529), reply)
+    caller = make_caller()
+
+    assert caller.create("words", client, model="m", max_tokens=10, messages=[]) is reply
+    assert client.options == [{"max_retries": 0}]
+    assert len(client.requests) == 2
+    assert all(0 < request["timeout"] <= 10.0 for request in client.requests)
+    assert len(sleeps) == 1
+    stats = caller.stats()
+    assert (stats["calls"], stats["retries"], stats["failures"]) == (1, 1, 0)
+    assert stats["latency"]["words"]["samples"] == 1
+
+
+def test_retry_after_header_sets_the_backoff(sleeps):
+    client = FakeClient(status_error(429, {"retry-after": "2"}), message())
+    make_caller().create("words", client, model="m", max_tokens=10, messages=[])
+    assert sleeps == [2.0]
+
+
+def test_non_retryable_error_is_raised_at_once(sleeps):
+    client = FakeClient(status_error(400), message())
+    caller = make_caller()
+    with pytest.raises(anthropic.APIStatusError):
+        caller.create("words", client, model="m", max_tokens=10, messages=[])
+    assert len(client.requests) == 1
+    assert not sleeps
+    assert caller.stats()["failures"] == 1
+
+
+def test_deadline_overrun(sleeps):
+    # The server asks for a wait longer than the time left: give up instead of sleeping
+    client = FakeClient(status_error(529, {"retry-after": "30"}), message())
+    caller = make_caller()
+    with pytest.raises(TimeoutError, match="within 5"):
+        caller.create("words", client, deadline=5, model="m", max_tokens=10, messages=[])
+    assert len(client.requests) == 1
+    assert not sleeps
+    assert caller.stats()["deadline_exceeded"] == 1
+
+
+def test_retries_are_capped(sleeps):
+    client = FakeClient(*[status_error(503) for _ in range(3)])
+    caller = make_caller(api_max_retries=2)
+    with pytest.raises(anthropic.APIStatusError):
+        caller.create("words", client, model="m", max_tokens=10, messages=[])
+    assert len(client.requests) == 3
+    stats = caller.stats()
+    assert (stats["retries"], stats["failures"]) == (2, 1)
+
+
+def test_hedge_wins_over_a_slow_primary():
+    release = threading.Event()
+    slow, fast = message("slow"), message("fast")
+    client = FakeClient(lambda request: release.wait(5) and slow, fast)
+    caller = make_caller(api_hedge=True)
+    caller._window("words").add(0.05)  # p95 of one sample: hedge after 50ms
+
+    try:
+        assert caller.create("words", client, model="m", max_tokens=10, messages=[]) is fast
+    finally:
+        release.set()
+    stats = caller.stats()
+    assert (stats["hedges_fired"], stats["hedges_won"]) == (1, 1)
+    assert len(client.requests) == 2
+
+
+def test_fast_primary_is_not_hedged():
+    reply = message()
+    client = FakeClient(reply)
+    caller = make_caller(api_hedge=True, api_hedge_min_delay=1.0)
+    caller._window("words").add(1.0)
+    assert caller.create("words", client, model="m", max_tokens=10, messages=[]) is reply
+    assert caller.stats()["hedges_fired"] == 0
+
+
+def test_stream_retries_opening_and_holds_a_slot(sleeps):
+    final = message()
+    client = FakeClient(status_error(529), FakeStream(["a", "b"], final))
+    caller = make_caller(api_concurrency=1)
+
+    with caller.stream("qa", client, model="m", max_tokens=10, messages=[]) as stream:
+        assert list(stream) == ["a", "b"]
+        assert caller.limit.in_use == 1
+    assert caller.limit.in_use == 0
+    assert len(client.requests) == 2
+    stats = caller.stats()
+    assert (stats["calls"], stats["retries"]) == (1, 1)
+    assert stats["latency"]["qa"]["samples"] == 1
+
+
+def test_stream_errors_inside_the_block_are_not_retried(sleeps):
+    client = FakeClient(FakeStream(["a"], message()), FakeStream(["a"], message()))
+    caller = make_caller(api_concurrency=1)
+    with pytest.raises(anthropic.APIConnectionError):
+        with caller.stream("qa", client, model="m", max_tokens=10, messages=[]):
+            raise anthropic.APIConnectionError(request=httpx.Request("POST", "https://api.anthropic.com"))
+    assert len(client.requests) == 1
+    assert caller.limit.in_use == 0
+    assert caller.stats()["latency"] == {}
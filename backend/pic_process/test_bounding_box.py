@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Tests for the backbone replay in generate_bounding_box.
+
+Uses a stand-in model whose backbone just echoes its input, so no weights or
+torch are needed. Run with: python3 -m pytest test_bounding_box.py
+"""
+
+import threading
+from types import SimpleNamespace
+
+from generate_bounding_box import _reuse_backbone
+
+
+class EchoBackbone:
+    """Returns (image, call number) so replayed outputs can be told apart from fresh ones."""
+
+    def __init__(self):
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def forward(self, image):
+        with self._lock:
+            self.calls += 1
+            return image, self.calls
+
+    def __call__(self, image):
+        return self.forward(image)
+
+
+def make_model():
+    backbone = EchoBackbone()
+    return SimpleNamespace(model=SimpleNamespace(backbone=backbone)), backbone
+
+
+def test_backbone_runs_once_per_block():
+    model, backbone = make_model()
+    with _reuse_backbone(model):
+        first = backbone("cat.jpg")
+        assert backbone("cat.jpg") is first
+    assert backbone.calls == 1
+
+    # Outside the block the backbone runs normally again
+    assert backbone("dog.jpg") == ("dog.jpg", 2)
+
+
+def test_concurrent_blocks_replay_their_own_image():
+    model, backbone = make_model()
+    barrier = threading.Barrier(2)
+    results, errors = {}, []
+
+    def detect(image):
+        try:
+            with _reuse_backbone(model):
+                outputs = [backbone(image)]
+                # Both threads are inside their blocks before either replays
+                barrier.wait(timeout=5)
+                outputs += [backbone(image), backbone(image)]
+                barrier.wait(timeout=5)
+            results[image] = outputs
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=detect, args=(image,)) for image in ("cat.jpg", "dog.jpg")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    for image, outputs in results.items():
+        assert all(output[0] == image for output in outputs)
+        assert outputs[0] is outputs[1] is outputs[2]
+    assert backbone.calls == 2
+    assert backbone("bird.jpg") == ("bird.jpg", 3)
+
+
+def test_model_without_backbone_is_left_alone():
+    with _reuse_backbone(None):
+        pass
+    with _reuse_backbone(SimpleNamespace(model=SimpleNamespace())):
+        pass
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Import-time budget check for the Python entry points.
+
+Runs each import in a fresh interpreter with `python -X importtime`, adds up
+the time spent importing everything that statement pulled in, and fails if a
+path goes over its budget or loads a heavy dependency it shouldn't (torch,
+transformers, matplotlib, ...). The heavy modules must only load once a
+detection or plotting path actually runs.
+
+Usage:
+    python3 test_import_time.py                # check budgets, exit 1 on regression
+    python3 test_import_time.py --scale 2      # loosen every budget (slow machines)
+    python3 test_import_time.py --json         # machine-readable output
+"""
+
+import sys
+import os
+import json
+import argparse
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PIC_PROCESS_DIR = os.path.join(BACKEND_DIR, 'pic_process')
+QUESTION_DIR = os.path.join(BACKEND_DIR, 'question')
+API_DIR = os.path.join(BACKEND_DIR, 'api')
+
+HEAVY_MODULES = {'torch', 'transformers', 'matplotlib', 'IPython', 'anthropic'}
+
+# (name, module, sys.path entries, budget in ms, modules that must not be imported)
+IMPORT_PATHS = [
+    ('config', 'config', [PIC_PROCESS_DIR], 50, HEAVY_MODULES | {'dotenv'}),
+    ('pic_process interface', 'interface', [PIC_PROCESS_DIR], 400, HEAVY_MODULES | {'dotenv'}),
+    ('question utils (what-is-this)', 'utils', [QUESTION_DIR, PIC_PROCESS_DIR], 100,
+     HEAVY_MODULES | {'PIL', 'numpy', 'dotenv'}),
+    ('evaluate_answers.py', 'evaluate_answers', [API_DIR], 100, HEAVY_MODULES | {'PIL', 'numpy', 'dotenv'}),
+]
+
+
+def parse_importtime(stderr):
+    """Return [(depth, module, cumulative_us)] from -X importtime output."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        # "import time: <self us> | <cumulative us> | <two spaces per level><module>"
+        _, cumulative_us, name = line.split('|', 2)
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        entries.append((depth, name.strip(), int(cumulative_us)))
+    return entries
+
+
+def run_importtime(code, paths):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(paths))
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True, env=env, cwd=paths[0],
+    )
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith('import time:')]
+        raise RuntimeError((errors[-1] if errors else result.stdout).strip())
+    return parse_importtime(result.stderr)
+
+
+def measure(module, paths, repeats=3):
+    """
+    Import `module` in fresh interpreters and return (best_ms, imported_modules).
+
+    Modules the bare interpreter imports at startup are excluded from the total.
+    """
+    baseline = {name for _, name, _ in run_importtime('pass', paths)}
+    best_us, imported = None, set()
+    for _ in range(repeats):
+        entries = run_importtime(f'import {module}', paths)
+        total = sum(us for depth, name, us in entries if depth == 0 and name not in baseline)
+        imported = {name for _, name, _ in entries}
+        best_us = total if best_us is None else min(best_us, total)
+    return best_us / 1000, imported
+
+
+def check_budgets(scale=1.0, repeats=3):
+    """Measure every import path. Returns a list of result dicts."""
+    results = []
+    for label, module, paths, budget_ms, forbidden in IMPORT_PATHS:
+        try:
+            elapsed_ms, imported = measure(module, paths, repeats)
+        except RuntimeError as e:
+            results.append({"path": label, "error": str(e), "passed": False})
+            continue
+        heavy = sorted(name for name in forbidden if name in imported)
+        allowed_ms = budget_ms * scale
+        results.append({
+            "path": label,
+            "import_ms": round(elapsed_ms, 1),
+            "budget_ms": allowed_ms,
+            "heavy_imports": heavy,
+            "passed": elapsed_ms <= allowed_ms and not heavy,
+        })
+    return results
+
+
+def test_import_budgets():
+    results = check_budgets(scale=float(os.environ.get('IMPORT_BUDGET_SCALE', '1')))
+    failures = [r for r in results if not r["passed"]]
+    assert not failures, json.dumps(failures, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check import-time budgets for the pipeline entry points')
+    parser.add_argument('--scale', type=float, default=float(os.environ.get('IMPORT_BUDGET_SCALE', '1')),
+                        help='Multiply every budget by this factor')
+    parser.add_argument('--repeats', type=int, default=3, help='Runs per import; the fastest is kept')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    results = check_budgets(args.scale, args.repeats)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print("⏱️  Import-time budgets")
+        print("=" * 50)
+        for r in results:
+            status = '✅' if r["passed"] else '❌'
+            if "error" in r:
+                print(f"{status} {r['path']}: import failed ({r['error']})")
+                continue
+            print(f"{status} {r['path']}: {r['import_ms']} ms (budget {r['budget_ms']} ms)")
+            if r["heavy_imports"]:
+                print(f"   loaded at import: {', '.join(r['heavy_imports'])}")
+
+    return 0 if all(r["passed"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
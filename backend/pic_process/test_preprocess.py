@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Tests for preprocess.preprocess_image: metadata stripping on the pass-through path.
+
+Images are generated in memory, so no fixtures or network are needed.
+Run with: python3 -m pytest test_preprocess.py
+"""
+
+from io import BytesIO
+
+import pytest
+from PIL import Image
+from PIL.PngImagePlugin import PngInfo
+
+from image_input import ImageInput
+from preprocess import preprocess_image
+
+EXIF_ARTIST = 0x013B
+
+
+def encode(image, format, **params):
+    buffer = BytesIO()
+    image.save(buffer, format=format, **params)
+    return buffer.getvalue()
+
+
+def exif_bytes():
+    exif = Image.Exif()
+    exif[EXIF_ARTIST] = "A. Student"
+    return exif.tobytes()
+
+
+@pytest.mark.parametrize("mode, format", [("RGBA", "PNG"), ("P", "PNG"), ("L", "JPEG"), ("L", "PNG")])
+def test_stripped_upload_is_decoded_as_rgb(mode, format):
+    image = Image.new(mode, (64, 48), 128)
+    data = encode(image, format, exif=exif_bytes())
+
+    result = preprocess_image(ImageInput(data), max_edge=1568, max_pixels=10**7)
+
+    assert result.media_type == ImageInput(data).media_type  # passed through, not transcoded
+    assert result.data != data
+    assert Image.open(BytesIO(result.data)).getexif().get(EXIF_ARTIST) is None
+    assert result.pil.mode == "RGB"
+    assert result.pil.size == (64, 48)
+    assert result.array.shape == (48, 64, 3)
+
+
+def test_upload_without_metadata_is_passed_through_untouched():
+    data = encode(Image.new("RGB", (64, 48), "white"), "PNG")
+    result = preprocess_image(ImageInput(data), max_edge=1568, max_pixels=10**7)
+    assert result.data == data
+    assert result.pil.mode == "RGB"
+
+
+def test_png_text_chunks_are_stripped():
+    info = PngInfo()
+    info.add_text("Software", "PhoneCam 3.1")
+    info.add_text("Author", "A. Student", zip=True)  # zTXt
+    info.add_itxt("Description", "Aula 4, colegio San José")
+    image = Image.new("RGB", (64, 48), "teal")
+    data = encode(image, "PNG", pnginfo=info)
+    assert {"Software", "Author", "Description"} <= set(Image.open(BytesIO(data)).info)
+
+    result = preprocess_image(ImageInput(data), max_edge=1568, max_pixels=10**7)
+
+    assert result.media_type == "image/png"
+    for chunk in (b"tEXt", b"zTXt", b"iTXt"):
+        assert chunk not in result.data
+    stripped = Image.open(BytesIO(result.data))
+    assert not {"Software", "Author", "Description"} & set(stripped.info)
+    assert stripped.convert("RGB").tobytes() == image.tobytes()
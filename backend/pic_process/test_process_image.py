@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Tests for process_image.run_batch: resuming by content hash and the bounded
+submission window.
+
+A stub analyzer replaces pic_process, so no model, network or API key is
+needed. Run with: python3 -m pytest test_process_image.py
+"""
+
+import json
+import threading
+import time
+
+import pytest
+
+import process_image
+from api_calls import api_calls
+from generate_bounding_box import detector_limit
+
+CONCURRENCY = 2
+
+
+class StubAnalyzer:
+    """Stands in for pic_process; records which images it was asked to analyze."""
+
+    calls = []
+    finished = 0
+    lock = threading.Lock()
+
+    def process_base64_image(self, image):
+        time.sleep(0.01)  # long enough that an unbounded loop would run far ahead
+        with self.lock:
+            StubAnalyzer.calls.append(image.data)
+            StubAnalyzer.finished += 1
+        return {"success": True, "objects": [image.data.decode()]}
+
+
+@pytest.fixture
+def stub_analyzer(monkeypatch):
+    monkeypatch.setattr(process_image, "pic_process", StubAnalyzer)
+    monkeypatch.setattr(process_image, "set_pipeline_workers", lambda max_workers: None)
+    monkeypatch.setattr(StubAnalyzer, "calls", [])
+    monkeypatch.setattr(StubAnalyzer, "finished", 0)
+    limits = api_calls.limit.limit, detector_limit.limit
+    yield StubAnalyzer
+    api_calls.limit.set_limit(limits[0])
+    detector_limit.set_limit(limits[1])
+
+
+@pytest.fixture
+def image_dir(tmp_path):
+    images = tmp_path / "images"
+    (images / "sub").mkdir(parents=True)
+    for i in range(10):
+        (images / f"img{i:02d}.jpg").write_bytes(f"image {i}".encode())
+    # Same bytes as img00 under another name: analyzed once
+    (images / "sub" / "copy.png").write_bytes(b"image 0")
+    (images / "notes.txt").write_text("not an image")
+    return images
+
+
+def run(image_dir, output, images=None):
+    images = images if images is not None else process_image.iter_directory(str(image_dir))
+    return process_image.run_batch(images, str(output), concurrency=CONCURRENCY, progress_interval=60)
+
+
+def test_second_run_does_no_work(stub_analyzer, image_dir, tmp_path):
+    output = tmp_path / "results.jsonl"
+
+    assert run(image_dir, output) == {"processed": 10, "failed": 0, "skipped": 1}
+    assert len(stub_analyzer.calls) == 10
+    records = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert len(records) == 10
+    assert all(record["success"] and len(record["sha256"]) == 64 for record in records)
+    assert not any(record["path"].endswith("copy.png") for record in records)
+
+    assert run(image_dir, output) == {"processed": 0, "failed": 0, "skipped": 11}
+    assert len(stub_analyzer.calls) == 10
+    assert len(output.read_text(encoding="utf-8").splitlines()) == 10
+
+
+def test_failed_images_are_retried(stub_analyzer, image_dir, tmp_path, monkeypatch):
+    output = tmp_path / "results.jsonl"
+    analyze = StubAnalyzer.process_base64_image
+
+    def flaky(self, image):
+        if image.data == b"image 3":
+            raise RuntimeError("detector crashed")
+        return analyze(self, image)
+
+    monkeypatch.setattr(StubAnalyzer, "process_base64_image", flaky)
+    assert run(image_dir, output) == {"processed": 9, "failed": 1, "skipped": 1}
+
+    monkeypatch.setattr(StubAnalyzer, "process_base64_image", analyze)
+    assert run(image_dir, output) == {"processed": 1, "failed": 0, "skipped": 10}
+    assert stub_analyzer.calls[-1] == b"image 3"
+
+
+def test_submission_window_is_bounded(stub_analyzer, image_dir, tmp_path):
+    window = []
+
+    def listing():
+        for pulled, pair in enumerate(process_image.iter_directory(str(image_dir)), 1):
+            # Images taken from the listing but not yet analyzed
+            window.append(pulled - stub_analyzer.finished)
+            yield pair
+
+    run(image_dir, tmp_path / "results.jsonl", images=listing())
+    assert len(window) == 11
+    assert max(window) <= 2 * CONCURRENCY + 1
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Tests for single_flight.SingleFlight.
+
+Run with: python3 -m pytest test_single_flight.py
+"""
+
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def wait_for_waiters(flight, count):
+    """Block until `count` callers are waiting on an in-flight computation."""
+    deadline = time.monotonic() + 5
+    while flight.stats()["coalesced"] < count:
+        assert time.monotonic() < deadline, "waiters never arrived"
+        time.sleep(0.001)
+
+
+class Blocking:
+    """A computation that runs until released and counts how often it was started."""
+
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, *args):
+        self.calls += 1
+        self.started.set()
+        assert self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.result if self.result is not None else args
+
+
+def run_concurrently(flight, key, compute, waiters):
+    """Start a leader and `waiters` callers for key; return each caller's (result, shared) or error."""
+    outcomes = [None] * (waiters + 1)
+
+    def call(i):
+        try:
+            outcomes[i] = flight.do(key, compute, "arg")
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=call, args=(0,))]
+    threads[0].start()
+    assert compute.started.wait(5)
+    threads += [threading.Thread(target=call, args=(i,)) for i in range(1, waiters + 1)]
+    for thread in threads[1:]:
+        thread.start()
+    wait_for_waiters(flight, waiters)
+    compute.release.set()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def test_waiters_share_the_leaders_computation():
+    flight = SingleFlight()
+    compute = Blocking(result={"objects": ["cat"]})
+    outcomes = run_concurrently(flight, "img", compute, waiters=3)
+
+    assert compute.calls == 1
+    assert outcomes[0] == ({"objects": ["cat"]}, False)
+    assert all(outcome == ({"objects": ["cat"]}, True) for outcome in outcomes[1:])
+    stats = flight.stats()
+    assert (stats["leaders"], stats["coalesced"], stats["in_flight"]) == (1, 3, 0)
+    assert stats["coalesced_rate"] == 0.75
+
+
+def test_later_call_after_completion_runs_again():
+    flight = SingleFlight()
+    assert flight.do("img", lambda: ["first"]) == (["first"], False)
+    assert flight.do("img", lambda: ["second"]) == (["second"], False)
+    assert flight.stats()["coalesced"] == 0
+
+
+def test_different_keys_do_not_coalesce():
+    flight = SingleFlight()
+    compute = Blocking()
+    leader = threading.Thread(target=flight.do, args=("a", compute))
+    leader.start()
+    assert compute.started.wait(5)
+    assert flight.do("b", lambda: "b") == ("b", False)
+    compute.release.set()
+    leader.join()
+    assert flight.stats()["coalesced"] == 0
+
+
+def test_leader_error_reaches_every_waiter():
+    flight = SingleFlight()
+    error = ValueError("model unavailable")
+    outcomes = run_concurrently(flight, "img", Blocking(error=error), waiters=2)
+
+    assert all(outcome is error for outcome in outcomes)
+    assert flight.stats()["errors"] == 1
+    assert flight.stats()["in_flight"] == 0
+    # The failure isn't remembered: the next call computes afresh
+    assert flight.do("img", lambda: "ok") == ("ok", False)
+
+
+def test_waiters_get_independent_copies():
+    flight = SingleFlight()
+    result = {"objects": ["cat"], "boxes": [[1, 2, 3, 4]]}
+    outcomes = run_concurrently(flight, "img", Blocking(result=result), waiters=2)
+
+    leader_result, _ = outcomes[0]
+    first, second = outcomes[1][0], outcomes[2][0]
+    assert leader_result is result
+    assert first is not result and second is not result and first is not second
+    assert first["boxes"][0] is not result["boxes"][0]
+
+    # Changes made by any caller stay with that caller
+    leader_result["objects"].append("dog")
+    first["boxes"][0][0] = 99
+    assert second == {"objects": ["cat"], "boxes": [[1, 2, 3, 4]]}
+    assert result["boxes"] == [[1, 2, 3, 4]]
+
+
+def test_keyboard_interrupt_in_leader_is_propagated():
+    flight = SingleFlight()
+
+    def interrupted():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        flight.do("img", interrupted)
+    assert flight.stats()["in_flight"] == 0
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Tests for structured_output: the schema validator and the invalid-reply retry.
+
+A fake client stands in for the Anthropic SDK, so no network or API key is
+needed. Run with: python3 -m pytest test_structured_output.py
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from structured_output import (
+    StructuredOutputError, WordList, QASetResponse, Evaluation, validate, create_structured
+)
+
+QA_ITEM = {"question": "¿Qué es?", "expected_answer": "Un gato.", "question_type": "vocabulary",
+           "difficulty": 2, "points": 30}
+
+
+@pytest.fixture(autouse=True)
+def no_usage_log(monkeypatch):
+    monkeypatch.setenv("USAGE_LOG", "")
+
+
+def tool_message(name, tool_input, stop_reason="tool_use"):
+    return SimpleNamespace(
+        content=[SimpleNamespace(type="tool_use", name=name, input=tool_input)],
+        stop_reason=stop_reason,
+        model="claude-sonnet-4-20250514",
+        usage=SimpleNamespace(input_tokens=10, output_tokens=5,
+                              cache_creation_input_tokens=0, cache_read_input_tokens=0),
+    )
+
+
+class FakeClient:
+    """Returns the queued replies in order and records every request."""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.requests = []
+        self.messages = self
+
+    def create(self, **request):
+        self.requests.append(request)
+        return self.replies.pop(0)
+
+
+def test_valid_reply():
+    data = {"level": "A2", "language": "Spanish", "qa_sets": [QA_ITEM] * 3}
+    response = QASetResponse.from_dict(data)
+    assert response.level == "A2"
+    assert response.qa_sets[0].question_type == "vocabulary"
+    assert response.to_dict()["qa_sets"] == [QA_ITEM] * 3
+
+
+def test_missing_field():
+    with pytest.raises(StructuredOutputError, match=r"\$\.qa_sets\[1\]: missing required field 'points'"):
+        validate({"level": "A2", "language": "Spanish",
+                  "qa_sets": [QA_ITEM, {k: v for k, v in QA_ITEM.items() if k != "points"}, QA_ITEM]},
+                 QASetResponse.SCHEMA)
+
+
+@pytest.mark.parametrize("field, value, message", [
+    ("difficulty", "2", "expected integer, got str"),
+    ("difficulty", True, "expected integer, got bool"),
+    ("difficulty", 7, "above the maximum 5"),
+    ("question_type", "trivia", "is not one of"),
+])
+def test_wrong_type_or_value(field, value, message):
+    with pytest.raises(StructuredOutputError, match=message):
+        validate({**QA_ITEM, field: value}, QASetResponse.SCHEMA["properties"]["qa_sets"]["items"])
+
+
+def test_array_bounds_and_number_types():
+    with pytest.raises(StructuredOutputError, match="at least 1 items"):
+        WordList.from_dict({"objects": []})
+    with pytest.raises(StructuredOutputError, match=r"\$\.objects\[1\]: expected string"):
+        WordList.from_dict({"objects": ["cat", 3]})
+    # Integers are valid numbers
+    evaluation = {"question_id": 1, "question": "q", "expected_answer": "a", "student_answer": "a",
+                  "points_earned": 30, "max_points": 30.0, "percentage": 100, "feedback": "ok",
+                  "areas_for_improvement": [], "strengths": ["accuracy"]}
+    assert Evaluation.from_dict(evaluation).points_earned == 30
+
+
+def test_reply_without_tool_call():
+    cut_off = SimpleNamespace(content=[SimpleNamespace(type="text", text="{")], stop_reason="max_tokens")
+    with pytest.raises(StructuredOutputError, match="cut off at max_tokens"):
+        WordList.from_message(cut_off)
+
+
+def test_create_structured_forces_the_tool():
+    reply = tool_message("record_objects", {"objects": ["cat"]})
+    client = FakeClient(reply)
+    words, message = create_structured(client, WordList, stage="words", model="claude-sonnet-4-20250514",
+                                       max_tokens=100, messages=[])
+    assert words.objects == ["cat"]
+    assert message is reply
+    request = client.requests[0]
+    assert request["tools"] == [WordList.tool()]
+    assert request["tool_choice"] == {"type": "tool", "name": "record_objects"}
+
+
+def test_create_structured_retries_an_invalid_reply():
+    client = FakeClient(
+        tool_message("record_objects", {"objects": "cat, dog"}),
+        tool_message("record_objects", {"objects": ["cat", "dog"]}),
+    )
+    words, _ = create_structured(client, WordList, stage="words", max_attempts=2,
+                                 model="claude-sonnet-4-20250514", max_tokens=100, messages=[])
+    assert words.objects == ["cat", "dog"]
+    assert len(client.requests) == 2
+
+
+def test_create_structured_gives_up_after_max_attempts():
+    client = FakeClient(*[tool_message("record_objects", {}) for _ in range(3)])
+    with pytest.raises(StructuredOutputError, match="missing required field 'objects'"):
+        create_structured(client, WordList, stage="words", max_attempts=3,
+                          model="claude-sonnet-4-20250514", max_tokens=100, messages=[])
+    assert len(client.requests) == 3
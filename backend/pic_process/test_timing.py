@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Tests for timing: span recording and the TIMING_SINK exporters.
+
+Run with: python3 -m pytest test_timing.py
+"""
+
+import os
+
+import pytest
+
+import timing
+from timing import PrometheusSink, make_sink, span, trace
+
+
+@pytest.fixture
+def sink_from_env(monkeypatch):
+    """Make the next span build its sink from TIMING_SINK again."""
+    monkeypatch.setattr(timing, "_sink", None)
+    monkeypatch.setattr(timing, "_sink_configured", False)
+    return lambda spec: monkeypatch.setenv("TIMING_SINK", spec)
+
+
+@pytest.fixture
+def registered_at_exit(monkeypatch):
+    calls = []
+    monkeypatch.setattr(timing.atexit, "register", calls.append)
+    return calls
+
+
+def test_spans_are_recorded_in_the_trace(sink_from_env):
+    sink_from_env("")
+    with trace() as t:
+        with span("words", question_id=2):
+            pass
+        with pytest.raises(RuntimeError):
+            with span("summary"):
+                raise RuntimeError("boom")
+    spans = t.to_dict()["spans"]
+    assert [s["name"] for s in spans] == ["words", "summary"]
+    assert spans[0]["question_id"] == 2 and spans[1]["error"] is True
+
+
+@pytest.mark.parametrize("spec", ["prometheus", "statsd:localhost", "statsd:host:port", "influx:x"])
+def test_invalid_sink_is_rejected(spec):
+    with pytest.raises(ValueError, match="Unsupported TIMING_SINK"):
+        make_sink(spec)
+
+
+def test_invalid_sink_disables_export_instead_of_failing_requests(sink_from_env, capsys):
+    sink_from_env("prometheus")
+    with pytest.raises(KeyError):
+        # The block's own error comes through, not one from the sink
+        with span("words"):
+            raise KeyError("original")
+    with span("summary"):
+        pass
+    assert timing.get_sink() is None
+    assert capsys.readouterr().err.count("Timing sink disabled") == 1
+
+
+def test_statsd_port_only_defaults_to_localhost():
+    assert make_sink("statsd:8125").address == ("127.0.0.1", 8125)
+
+
+def test_prometheus_file_per_process(tmp_path, registered_at_exit):
+    sink = PrometheusSink(str(tmp_path / "lexipic.prom"))
+    sink.record("words", 0.2)
+    sink.record("words", 3.0, error=True)
+    sink.write()
+
+    pid = os.getpid()
+    assert not (tmp_path / "lexipic.prom").exists()
+    text = (tmp_path / f"lexipic.{pid}.prom").read_text()
+    assert f'lexipic_span_seconds_count{{span="words",pid="{pid}"}} 2' in text
+    assert f'lexipic_span_seconds_bucket{{span="words",pid="{pid}",le="0.25"}} 1' in text
+    assert f'lexipic_span_errors_total{{span="words",pid="{pid}"}} 1' in text
+    assert registered_at_exit == [sink.write]
+
+
+def test_throttled_spans_are_flushed_at_exit(tmp_path, registered_at_exit):
+    sink = PrometheusSink(str(tmp_path / "lexipic.prom"), interval=3600)
+    sink.record("words", 0.2)  # first record writes
+    sink.record("summary", 0.4)  # throttled
+    path = tmp_path / f"lexipic.{os.getpid()}.prom"
+    assert 'span="summary"' not in path.read_text()
+
+    for flush in registered_at_exit:
+        flush()
+    assert 'span="summary"' in path.read_text()
+
+
+def test_files_of_exited_processes_are_removed(tmp_path, registered_at_exit):
+    stale = tmp_path / "lexipic.999999999.prom"
+    live = tmp_path / f"lexipic.{os.getppid()}.prom"
+    other = tmp_path / "other.prom"
+    for path in (stale, live, other):
+        path.write_text("")
+
+    PrometheusSink(str(tmp_path / "lexipic.prom"))
+
+    assert not stale.exists()
+    assert live.exists() and other.exists()
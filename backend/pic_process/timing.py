@@ -0,0 +1,279 @@
+"""
+Lightweight per-request span timing.
+
+A request opens a trace; any code running on its behalf records spans into it:
+
+    with trace() as t:
+        with span("decode"):
+            ...
+        future = submit(executor, "words", get_image_words, image)
+    metadata["timings"] = t.to_dict()
+
+The current trace lives in a contextvar, so spans from helper code need no
+extra arguments. Work handed to a thread pool must go through submit() (or
+copy the context itself) to stay attached to the request. Every finished span
+is also passed to the optional sink configured by TIMING_SINK:
+
+    prometheus:/path/to/lexipic.prom   text exposition, one file per process
+                                       (lexipic.<pid>.prom), rewritten at most
+                                       once a second and at exit
+    statsd:host:port                   one UDP timer metric per span
+
+Spans recorded outside a trace (e.g. a background detector preload) still go
+to the sink. A TIMING_SINK that can't be parsed is reported once on stderr and
+timing export is turned off; it never fails a request.
+"""
+
+import atexit
+import contextvars
+import glob
+import os
+import socket
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from config import config
+
+_current_trace = contextvars.ContextVar("lexipic_trace", default=None)
+
+
+class Trace:
+    """Spans recorded for one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, name, started, duration, attrs):
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "start_ms": round((started - self.started) * 1000, 1),
+                "ms": round(duration * 1000, 1),
+                **attrs,
+            })
+
+    def to_dict(self):
+        """{"total_ms", "spans": [...]} with spans in start order."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start_ms"])
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "spans": spans,
+        }
+
+
+@contextmanager
+def trace():
+    """Start a trace for the current request (nested traces replace the outer one until they end)."""
+    current = Trace()
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Time a block as a span of the current trace.
+
+    Attributes (e.g. question_id=2) are copied into the span. A block that
+    raises is recorded with error=True.
+    """
+    started = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        if error:
+            attrs["error"] = True
+        current = _current_trace.get()
+        if current is not None:
+            current.add(name, started, duration, attrs)
+        sink = get_sink()
+        if sink is not None:
+            sink.record(name, duration, error)
+
+
+def submit(executor, name, fn, *args, **kwargs):
+    """
+    executor.submit(fn, ...) attached to the caller's trace.
+
+    The call is timed as span `name`; pass None when fn records its own spans.
+    """
+    context = contextvars.copy_context()
+    if name is None:
+        return executor.submit(context.run, fn, *args, **kwargs)
+
+    def run():
+        with span(name):
+            return fn(*args, **kwargs)
+
+    return executor.submit(context.run, run)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # exists, owned by someone else
+    return True
+
+
+class PrometheusSink:
+    """
+    Per-span-name histograms in Prometheus text format, written to a file.
+
+    Meant for node_exporter's textfile collector. Several processes (the API's
+    workers) export at once, so each writes its own file next to `path`
+    (lexipic.prom -> lexipic.<pid>.prom) with a pid label on every series;
+    sum by span to aggregate them. Files left by processes that have exited
+    are removed when a sink is created. render() returns the same text for
+    serving it some other way.
+    """
+
+    BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+
+    def __init__(self, path, prefix="lexipic", interval=1.0):
+        self.path = path
+        self.prefix = prefix
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._last_write = 0.0
+        self._remove_stale_files()
+        # Spans finished since the last throttled write would otherwise be lost
+        atexit.register(self.write)
+
+    def file_path(self, pid=None):
+        """This process's file: `path` with the pid before the extension."""
+        root, ext = os.path.splitext(self.path)
+        return f"{root}.{pid or os.getpid()}{ext}"
+
+    def _remove_stale_files(self):
+        root, ext = os.path.splitext(self.path)
+        for path in glob.glob(f"{glob.escape(root)}.*{ext}"):
+            pid = path[len(root) + 1:len(path) - len(ext)]
+            if pid.isdigit() and not _pid_alive(int(pid)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def record(self, name, seconds, error=False):
+        with self._lock:
+            stats = self._stats.setdefault(name, {"count": 0, "sum": 0.0, "errors": 0,
+                                                  "buckets": [0] * len(self.BUCKETS)})
+            stats["count"] += 1
+            stats["sum"] += seconds
+            stats["errors"] += int(error)
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    stats["buckets"][i] += 1
+            due = time.monotonic() - self._last_write >= self.interval
+            if due:
+                self._last_write = time.monotonic()
+        if due:
+            self.write()
+
+    def render(self):
+        metric = f"{self.prefix}_span_seconds"
+        lines = [f"# HELP {metric} Time spent in each pipeline span.", f"# TYPE {metric} histogram"]
+        errors = [f"# HELP {self.prefix}_span_errors_total Spans that raised.",
+                  f"# TYPE {self.prefix}_span_errors_total counter"]
+        pid = os.getpid()
+        with self._lock:
+            for name, stats in sorted(self._stats.items()):
+                labels = f'span="{name}",pid="{pid}"'
+                for bound, count in zip(self.BUCKETS, stats["buckets"]):
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{metric}_bucket{{{labels},le="{le}"}} {count}')
+                lines.append(f'{metric}_sum{{{labels}}} {stats["sum"]:.6f}')
+                lines.append(f'{metric}_count{{{labels}}} {stats["count"]}')
+                errors.append(f'{self.prefix}_span_errors_total{{{labels}}} {stats["errors"]}')
+        return "\n".join(lines + errors) + "\n"
+
+    def write(self):
+        path = self.file_path()
+        try:
+            # node_exporter only reads *.prom, so it never sees a half-written file
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(self.render())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Timing sink write failed: {e}", file=sys.stderr)
+
+
+class StatsdSink:
+    """Sends each span as a StatsD timer (`<prefix>.span.<name>:<ms>|ms`) over UDP."""
+
+    def __init__(self, host, port, prefix="lexipic"):
+        self.address = (host, int(port))
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+
+    def record(self, name, seconds, error=False):
+        lines = [f"{self.prefix}.span.{name}:{seconds * 1000:.3f}|ms"]
+        if error:
+            lines.append(f"{self.prefix}.span.{name}.errors:1|c")
+        try:
+            self._socket.sendto("\n".join(lines).encode("ascii"), self.address)
+        except OSError:
+            # Metrics are best effort; never fail a request over them
+            pass
+
+
+_sink = None
+_sink_configured = False
+_sink_lock = threading.Lock()
+
+
+def get_sink():
+    """
+    The sink configured by TIMING_SINK, or None (created on first use).
+
+    An invalid TIMING_SINK is logged once and leaves timing export off;
+    long-running processes call this at startup so the message shows early.
+    """
+    global _sink, _sink_configured
+    if not _sink_configured:
+        with _sink_lock:
+            if not _sink_configured:
+                try:
+                    _sink = make_sink(config.timing_sink, config.timing_prefix)
+                except (ValueError, OSError) as e:
+                    print(f"Timing sink disabled: {e}", file=sys.stderr)
+                    _sink = None
+                _sink_configured = True
+    return _sink
+
+
+def make_sink(spec, prefix="lexipic"):
+    """Build a sink from "prometheus:<path>" or "statsd:<host>:<port>"; "" means none."""
+    if not spec:
+        return None
+    kind, _, target = spec.partition(":")
+    if kind == "prometheus" and target:
+        return PrometheusSink(target, prefix)
+    if kind == "statsd" and target:
+        host, _, port = target.rpartition(":")
+        if port.isdigit():
+            return StatsdSink(host or "127.0.0.1", port, prefix)
+    raise ValueError(f"Unsupported TIMING_SINK '{spec}' (expected prometheus:<path> or statsd:<host>:<port>)")
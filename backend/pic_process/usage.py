@@ -0,0 +1,170 @@
+"""
+Token usage and cost accounting for model calls.
+
+Every successful model call is recorded once, with its stage, model, input,
+output and cache tokens, latency and estimated cost:
+
+- into the current request's ledger (a contextvar, opened with usage_scope()),
+  which process_image_qa.py and evaluate_answers.py return as metadata.usage
+- as one JSON line appended to the usage log (USAGE_LOG, default
+  <UPLOAD_PATH>/usage.jsonl), tagged with the request's type, language and
+  level so summarize_usage.py can break spend down offline
+
+Costs use list prices in USD per million tokens; set MODEL_PRICES_JSON to
+override or add models. Message Batches calls are billed at BATCH_DISCOUNT of
+those prices. The losing request of a hedged call is billed but
+never returned, so it isn't counted here.
+"""
+
+import contextvars
+import json
+import os
+import sys
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from config import config
+
+# USD per million tokens
+MODEL_PRICES = {
+    "claude-sonnet-4-20250514": {"input": 3.00, "output": 15.00, "cache_write": 3.75, "cache_read": 0.30},
+}
+
+BATCH_DISCOUNT = 0.5
+
+TOKEN_FIELDS = ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens")
+
+_current_ledger = contextvars.ContextVar("lexipic_usage", default=None)
+_log_lock = threading.Lock()
+
+
+def _prices():
+    prices = dict(MODEL_PRICES)
+    if config.model_prices_json:
+        prices.update(json.loads(config.model_prices_json))
+    return prices
+
+
+def call_cost(model, tokens, batch=False):
+    """Estimated USD cost of one call, or None for a model without a price."""
+    price = _prices().get(model)
+    if price is None:
+        return None
+    cost = (
+        tokens["input_tokens"] * price["input"]
+        + tokens["output_tokens"] * price["output"]
+        + tokens["cache_creation_input_tokens"] * price["cache_write"]
+        + tokens["cache_read_input_tokens"] * price["cache_read"]
+    ) / 1_000_000
+    return round(cost * (BATCH_DISCOUNT if batch else 1), 6)
+
+
+def _tokens(message):
+    usage = getattr(message, "usage", None)
+    return {field: getattr(usage, field, 0) or 0 for field in TOKEN_FIELDS}
+
+
+def _add(total, record):
+    for field in TOKEN_FIELDS:
+        total[field] = total.get(field, 0) + record[field]
+    total["calls"] = total.get("calls", 0) + 1
+    total["latency_ms"] = round(total.get("latency_ms", 0) + record["latency_ms"], 1)
+    if record["cost_usd"] is not None:
+        total["cost_usd"] = round(total.get("cost_usd", 0) + record["cost_usd"], 6)
+    return total
+
+
+class UsageLedger:
+    """Model calls made for one request."""
+
+    def __init__(self, **labels):
+        self.request_id = uuid.uuid4().hex
+        self.labels = labels
+        self.records = []
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def to_dict(self):
+        """Totals over the request's calls, plus the same totals per stage."""
+        with self._lock:
+            records = list(self.records)
+        totals = {"calls": 0, **{field: 0 for field in TOKEN_FIELDS}, "cost_usd": 0.0, "latency_ms": 0}
+        by_stage = {}
+        for record in records:
+            _add(totals, record)
+            _add(by_stage.setdefault(record["stage"], {}), record)
+        return {**totals, "by_stage": by_stage}
+
+
+@contextmanager
+def usage_scope(**labels):
+    """
+    Collect usage for one request. Labels (request_type, language, level, ...)
+    are written with every usage log line recorded inside the scope.
+    """
+    ledger = UsageLedger(**labels)
+    token = _current_ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _current_ledger.reset(token)
+
+
+def record_usage(stage, model, message, latency, batch=False):
+    """
+    Record one successful model call.
+
+    Args:
+        stage (str): Pipeline stage (words, summary, qa, evaluation, ...)
+        model (str): Model the request asked for
+        message: Messages API response (its .usage is read)
+        latency (float): Seconds the call took, retries included
+        batch (bool): The call went through the Message Batches API
+    """
+    record = {
+        "stage": stage,
+        "model": getattr(message, "model", None) or model,
+        **_tokens(message),
+        "latency_ms": round(latency * 1000, 1),
+    }
+    if batch:
+        record["batch"] = True
+    record["cost_usd"] = call_cost(model, record, batch)
+
+    ledger = _current_ledger.get()
+    if ledger is not None:
+        ledger.add(record)
+    _append_log(record, ledger)
+    return record
+
+
+def _append_log(record, ledger):
+    path = config.usage_log
+    if not path:
+        return
+    line = {
+        "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "pid": os.getpid(),
+        **({"request_id": ledger.request_id, **ledger.labels} if ledger else {}),
+        **record,
+    }
+    data = (json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8")
+    try:
+        with _log_lock:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # One write() per line on an O_APPEND descriptor, so concurrent
+            # workers appending to the same file don't interleave lines
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+    except OSError as e:
+        print(f"Usage log write failed: {e}", file=sys.stderr)
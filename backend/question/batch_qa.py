@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Bulk Q&A pre-generation through the Message Batches API.
+
+Reads (description, language, level) items from a JSON-lines file, submits
+them as message batches, polls until each batch ends and appends one record
+per item to a JSON-lines output. Batch requests cost half as much as the
+synchronous calls generate_complete_qa_set makes, and finish within 24 hours,
+usually much sooner.
+
+Input, one item per line ("id" is optional and becomes the custom_id):
+    {"id": "park_017_es_a2", "description": "...", "language": "Spanish", "level": "A2"}
+
+Output, one record per item, in completion order:
+    {"custom_id", "batch_id", <input fields>, "success": true, "qa_sets": [...], "usage": {...}}
+    {"custom_id", "batch_id", <input fields>, "success": false, "error": "..."}
+
+The job is resumable. <output>.checkpoint.json records the custom_ids that
+succeeded and the batches still in flight; on restart those batches are polled
+again instead of resubmitted, finished items are skipped, and items that
+failed are submitted again. A batch whose collection was interrupted is
+collected again without repeating the records it already wrote.
+
+Usage:
+    python3 batch_qa.py items.jsonl --output decks.jsonl
+    python3 batch_qa.py items.jsonl --output decks.jsonl --batch-size 5000 --poll-max 300
+
+Point ANTHROPIC_BASE_URL at benchmark/stub_server.py to try it offline.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pic_process'))
+
+from config import get_anthropic_client
+from qa_cache import QACache
+from structured_output import StructuredOutputError
+from usage import usage_scope, record_usage
+from utils import valid_levels, qa_batch_params, qa_response_from_message
+
+CUSTOM_ID = re.compile(r"^[a-zA-Z0-9_-]{1,64}$")
+
+# Request limit per batch is 100,000 (and 256 MB)
+MAX_BATCH_SIZE = 100_000
+
+
+def custom_id(item):
+    """The item's own id if the API accepts it, else one derived from its cache key."""
+    if CUSTOM_ID.match(str(item.get("id", ""))):
+        return str(item["id"])
+    key = QACache.key(item["description"], item["language"], item["level"])
+    return "qa_" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:40]
+
+
+def load_items(path):
+    """{custom_id: item} for every valid input line; duplicates collapse to one item."""
+    items = {}
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                print(f"{path}:{line_no}: skipped, invalid JSON ({e})", file=sys.stderr)
+                continue
+            if not item.get("description") or not item.get("language") or item.get("level") not in valid_levels:
+                print(f"{path}:{line_no}: skipped, needs description, language and level (A1-C2)", file=sys.stderr)
+                continue
+            items[custom_id(item)] = item
+    return items
+
+
+class Checkpoint:
+    """Succeeded custom_ids and in-flight batches, rewritten atomically after every change."""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self.batches = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.done = set(data.get("done", []))
+            self.batches = data.get("batches", {})
+
+    def in_flight(self):
+        return {cid for ids in self.batches.values() for cid in ids}
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"done": sorted(self.done), "batches": self.batches}, f)
+        os.replace(tmp_path, self.path)
+
+
+def _records(output_path):
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def _drop_partial_line(output_path):
+    """Cut a final line left incomplete by a crash, so the next record starts on a line of its own."""
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        if not size:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        f.seek(0)
+        end = f.read().rfind(b"\n") + 1
+        f.truncate(end)
+        print(f"{output_path}: dropped an incomplete last line ({size - end} bytes)", file=sys.stderr)
+
+
+def completed_ids(output_path):
+    """custom_ids with a successful record in the output (covers a crash before the checkpoint was saved)."""
+    return {record["custom_id"] for record in _records(output_path) if record.get("success")}
+
+
+def collected_ids(output_path, batch_ids):
+    """{batch_id: custom_ids already written} for the given batches, left by a crash mid-collection."""
+    collected = {batch_id: set() for batch_id in batch_ids}
+    for record in _records(output_path):
+        if record.get("batch_id") in collected:
+            collected[record["batch_id"]].add(record["custom_id"])
+    return collected
+
+
+def submit_batches(client, items, ids, checkpoint, batch_size):
+    """Create batches for ids, recording each in the checkpoint as soon as it exists."""
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start:start + batch_size]
+        requests = [
+            {"custom_id": cid, "params": qa_batch_params(items[cid]["description"], items[cid]["language"],
+                                                          items[cid]["level"])}
+            for cid in chunk
+        ]
+        batch = client.messages.batches.create(requests=requests)
+        checkpoint.batches[batch.id] = chunk
+        checkpoint.save()
+        print(f"Submitted {batch.id} ({len(chunk)} requests)", file=sys.stderr)
+
+
+def _error_message(result):
+    if result.type == "errored":
+        error = getattr(result.error, "error", None)
+        return f"{getattr(error, 'type', 'error')}: {getattr(error, 'message', '')}".strip()
+    return f"request {result.type}"
+
+
+def collect_results(client, batch_id, items, output, skip=frozenset()):
+    """
+    Append a record per result of an ended batch; returns (succeeded ids, failed count).
+
+    Results for custom_ids in skip (already written) are passed over, so a
+    batch can be collected again after a crash without duplicate records.
+    """
+    succeeded, failed = set(), 0
+    for entry in client.messages.batches.results(batch_id):
+        if entry.custom_id in skip:
+            continue
+        item = items.get(entry.custom_id, {})
+        record = {"custom_id": entry.custom_id, "batch_id": batch_id, **item}
+        result = entry.result
+        if result.type == "succeeded":
+            message = result.message
+            with usage_scope(request_type="qa_batch", language=item.get("language"), level=item.get("level")) as usage:
+                record_usage("qa", message.model, message, 0.0, batch=True)
+            try:
+                qa_response = qa_response_from_message(message)
+                record.update(success=True, qa_sets=qa_response["qa_sets"], usage=usage.to_dict())
+            except StructuredOutputError as e:
+                record.update(success=False, error=f"invalid reply: {e}")
+        else:
+            record.update(success=False, error=_error_message(result))
+
+        output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if record["success"]:
+            succeeded.add(entry.custom_id)
+        else:
+            failed += 1
+    output.flush()
+    os.fsync(output.fileno())
+    return succeeded, failed
+
+
+def poll_batches(client, items, checkpoint, output, poll_min, poll_max, collected=None):
+    """
+    Poll in-flight batches until all have ended, collecting each as it ends.
+
+    The interval starts at poll_min and grows 1.5x per round without progress,
+    up to poll_max, with ±20% jitter so parallel jobs don't poll in lockstep.
+    collected maps batch ids to custom_ids whose records are already in the
+    output (see collected_ids).
+    """
+    interval = poll_min
+    failed_total = 0
+    collected = dict(collected or {})
+    while checkpoint.batches:
+        progressed = False
+        for batch_id in list(checkpoint.batches):
+            batch = client.messages.batches.retrieve(batch_id)
+            if batch.processing_status != "ended":
+                continue
+            skip = collected.pop(batch_id, set()) | checkpoint.done
+            succeeded, failed = collect_results(client, batch_id, items, output, skip)
+            failed_total += failed
+            checkpoint.done |= succeeded
+            del checkpoint.batches[batch_id]
+            checkpoint.save()
+            progressed = True
+            print(f"{batch_id} ended: {len(succeeded)} succeeded, {failed} failed "
+                  f"({len(checkpoint.done)}/{len(items)} done)", file=sys.stderr)
+        if not checkpoint.batches:
+            break
+        interval = poll_min if progressed else min(poll_max, interval * 1.5)
+        time.sleep(interval * random.uniform(0.8, 1.2))
+    return failed_total
+
+
+def run(input_path, output_path, batch_size=1000, poll_min=5.0, poll_max=60.0, checkpoint_path=None):
+    """
+    Run (or resume) a pre-generation job.
+
+    Returns:
+        int: Items that failed in this run (submitted again on the next run)
+    """
+    items = load_items(input_path)
+    checkpoint = Checkpoint(checkpoint_path or f"{output_path}.checkpoint.json")
+    _drop_partial_line(output_path)
+    checkpoint.done |= completed_ids(output_path) & set(items)
+    collected = collected_ids(output_path, checkpoint.batches)
+
+    in_flight = checkpoint.in_flight()
+    todo = [cid for cid in items if cid not in checkpoint.done and cid not in in_flight]
+    print(f"{len(items)} items: {len(checkpoint.done)} done, {len(in_flight)} in flight, "
+          f"{len(todo)} to submit", file=sys.stderr)
+
+    client = get_anthropic_client()
+    with open(output_path, "a", encoding="utf-8") as output:
+        submit_batches(client, items, todo, checkpoint, batch_size)
+        return poll_batches(client, items, checkpoint, output, poll_min, poll_max, collected)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-generate Q&A sets in bulk through the Message Batches API')
+    parser.add_argument('input', help='JSON-lines file of {"description", "language", "level"[, "id"]} items')
+    parser.add_argument('--output', required=True, help='JSON-lines file results are appended to')
+    parser.add_argument('--checkpoint', help='Checkpoint file (default: <output>.checkpoint.json)')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Requests per batch (max 100000)')
+    parser.add_argument('--poll-min', type=float, default=5.0, help='Initial seconds between status polls')
+    parser.add_argument('--poll-max', type=float, default=60.0, help='Maximum seconds between status polls')
+    args = parser.parse_args()
+
+    if not 1 <= args.batch_size <= MAX_BATCH_SIZE:
+        parser.error(f"--batch-size must be between 1 and {MAX_BATCH_SIZE}")
+
+    try:
+        failed = run(args.input, args.output, args.batch_size, args.poll_min, args.poll_max, args.checkpoint)
+    except KeyboardInterrupt:
+        print("Interrupted; submitted batches keep running and are collected on the next run", file=sys.stderr)
+        return 130
+    if failed:
+        print(f"{failed} items failed; run again to resubmit them", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Incremental parsing of a JSON array inside a streamed model response.
+
+The model streams a document like {"level": ..., "qa_sets": [{...}, {...}]}
+one text delta at a time. ArrayItemParser watches for the named array and
+returns each element as soon as its closing brace arrives, without waiting for
+the rest of the document (or caring about ```json fences around it).
+"""
+
+import json
+import re
+
+
+class ArrayItemParser:
+    """
+    Yield the objects of `"<key>": [ ... ]` as they complete.
+
+    Usage:
+        parser = ArrayItemParser("qa_sets")
+        for delta in stream:
+            for item in parser.feed(delta):
+                ...
+    """
+
+    def __init__(self, key):
+        self._key_pattern = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self._buffer = ""
+        self._pos = None        # scan position once the array has been found
+        self._depth = 0         # object nesting depth inside the array
+        self._in_string = False
+        self._escaped = False
+        self._item_start = None
+        self.done = False
+
+    def feed(self, text):
+        """Add streamed text and return the list of newly completed items."""
+        self._buffer += text
+        items = []
+        if self.done:
+            return items
+
+        if self._pos is None:
+            match = self._key_pattern.search(self._buffer)
+            if not match:
+                return items
+            self._pos = match.end()
+
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer):
+            char = buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0:
+                    self._item_start = i
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    # End of the array itself
+                    self.done = True
+                    i += 1
+                    break
+                self._depth -= 1
+                if self._depth == 0:
+                    items.append(json.loads(buffer[self._item_start:i + 1]))
+                    self._item_start = None
+            i += 1
+        self._pos = i
+        return items
+
+    @property
+    def text(self):
+        """Everything fed so far."""
+        return self._buffer
@@ -0,0 +1,89 @@
+"""
+Memoization for generate_complete_qa_set.
+
+Q&A sets are keyed on a hash of the normalized scene description plus the
+target language and level. Each key can hold several generated variants: until
+a key has `variants` of them every lookup is a miss (so a fresh set gets
+generated and added), after that lookups rotate through the stored variants so
+repeat learners still see different questions.
+"""
+
+import copy
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_description(description):
+    """Lowercase and collapse whitespace so trivially different descriptions share a key."""
+    return re.sub(r"\s+", " ", description).strip().lower()
+
+
+class QACache:
+    """
+    LRU cache of generated Q&A sets.
+
+    Args:
+        max_entries (int): (description, language, level) keys kept before the least recently used is evicted
+        variants (int): Q&A sets stored per key and rotated between
+        ttl (float): Seconds a key stays valid after its first variant was stored (0 means no expiry)
+    """
+
+    def __init__(self, max_entries=512, variants=1, ttl=86400):
+        self.max_entries = max_entries
+        self.variants = max(1, variants)
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    @staticmethod
+    def key(description, language, level):
+        digest = hashlib.sha256(normalize_description(description).encode("utf-8")).hexdigest()
+        return f"{digest}:{language}:{level}"
+
+    def get(self, key):
+        """Return a copy of the next variant for key, or None if a new one should be generated."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl > 0 and time.time() - entry["stored_at"] > self.ttl:
+                del self._entries[key]
+                self.counters["expired"] += 1
+                entry = None
+            if entry is None or len(entry["variants"]) < self.variants:
+                self.counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters["hits"] += 1
+            value = entry["variants"][entry["next"]]
+            entry["next"] = (entry["next"] + 1) % len(entry["variants"])
+        return copy.deepcopy(value)
+
+    def put(self, key, value):
+        """Add a generated Q&A set as another variant for key."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = {"stored_at": time.time(), "variants": [], "next": 0}
+                self._entries[key] = entry
+            if len(entry["variants"]) < self.variants:
+                entry["variants"].append(copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "entries": len(self._entries),
+                "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else 0.0,
+            }
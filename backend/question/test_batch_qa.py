@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Tests for resuming batch_qa after a crash.
+
+A fake client plays the Message Batches API, so no network or API key is
+needed. Run with: python3 -m pytest test_batch_qa.py
+"""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import batch_qa
+from structured_output import QASetResponse
+
+QA_ITEM = {"question": "¿Qué es?", "expected_answer": "Un gato.", "question_type": "vocabulary",
+           "difficulty": 2, "points": 30}
+ITEMS = [{"id": cid, "description": f"Scene {cid}", "language": "Spanish", "level": "A2"} for cid in "abc"]
+
+
+@pytest.fixture(autouse=True)
+def no_usage_log(monkeypatch):
+    monkeypatch.setenv("USAGE_LOG", "")
+
+
+def succeeded(custom_id):
+    message = SimpleNamespace(
+        content=[SimpleNamespace(type="tool_use", name=QASetResponse.tool()["name"],
+                                 input={"level": "A2", "language": "Spanish", "qa_sets": [QA_ITEM] * 3})],
+        stop_reason="tool_use",
+        model="claude-sonnet-4-20250514",
+        usage=SimpleNamespace(input_tokens=10, output_tokens=5,
+                              cache_creation_input_tokens=0, cache_read_input_tokens=0),
+    )
+    return SimpleNamespace(custom_id=custom_id, result=SimpleNamespace(type="succeeded", message=message))
+
+
+def expired(custom_id):
+    return SimpleNamespace(custom_id=custom_id, result=SimpleNamespace(type="expired"))
+
+
+class FakeBatches:
+    """Every batch has already ended; results are looked up by batch id."""
+
+    def __init__(self, results):
+        self.results_by_batch = results
+        self.created = []
+
+    def create(self, requests):
+        self.created.append([request["custom_id"] for request in requests])
+        return SimpleNamespace(id=f"new_{len(self.created)}")
+
+    def retrieve(self, batch_id):
+        return SimpleNamespace(processing_status="ended")
+
+    def results(self, batch_id):
+        return iter(self.results_by_batch[batch_id])
+
+
+@pytest.fixture
+def job(tmp_path, monkeypatch):
+    paths = SimpleNamespace(input=tmp_path / "items.jsonl", output=tmp_path / "decks.jsonl",
+                            checkpoint=tmp_path / "decks.jsonl.checkpoint.json")
+    paths.input.write_text("".join(json.dumps(item) + "\n" for item in ITEMS), encoding="utf-8")
+    client = SimpleNamespace(messages=SimpleNamespace(batches=None))
+    monkeypatch.setattr(batch_qa, "get_anthropic_client", lambda: client)
+
+    def run(results, batches):
+        client.messages.batches = FakeBatches(results)
+        paths.checkpoint.write_text(json.dumps({"done": [], "batches": batches}), encoding="utf-8")
+        failed = batch_qa.run(str(paths.input), str(paths.output), poll_min=0.01)
+        return failed, client.messages.batches
+
+    paths.run = run
+    return paths
+
+
+def records(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def write_records(path, *records, tail=""):
+    path.write_text("".join(json.dumps(record) + "\n" for record in records) + tail, encoding="utf-8")
+
+
+def test_interrupted_collection_does_not_duplicate_records(job):
+    # The previous run wrote two of b1's results, then died before updating the checkpoint
+    write_records(job.output,
+                  {"custom_id": "a", "batch_id": "b1", "success": True, "qa_sets": []},
+                  {"custom_id": "b", "batch_id": "b1", "success": False, "error": "request expired"})
+
+    failed, batches = job.run({"b1": [succeeded("a"), expired("b"), succeeded("c")]}, {"b1": ["a", "b", "c"]})
+
+    assert [(r["custom_id"], r["batch_id"], r["success"]) for r in records(job.output)] == [
+        ("a", "b1", True), ("b", "b1", False), ("c", "b1", True)]
+    assert failed == 0
+    assert batches.created == []
+    checkpoint = json.loads(job.checkpoint.read_text(encoding="utf-8"))
+    assert checkpoint == {"done": ["a", "c"], "batches": {}}
+
+
+def test_resubmitted_item_gets_a_record_from_its_new_batch(job):
+    # "b" failed in an earlier, fully collected batch and was resubmitted as b2
+    write_records(job.output,
+                  {"custom_id": "a", "batch_id": "b1", "success": True, "qa_sets": []},
+                  {"custom_id": "b", "batch_id": "b1", "success": False, "error": "request expired"},
+                  {"custom_id": "c", "batch_id": "b1", "success": True, "qa_sets": []})
+
+    failed, _ = job.run({"b2": [succeeded("b")]}, {"b2": ["b"]})
+
+    last = records(job.output)[-1]
+    assert (last["custom_id"], last["batch_id"], last["success"]) == ("b", "b2", True)
+    assert len(last["qa_sets"]) == 3
+    assert failed == 0
+
+
+def test_incomplete_last_line_is_dropped(job):
+    write_records(job.output, {"custom_id": "a", "batch_id": "b1", "success": True, "qa_sets": []},
+                  tail='{"custom_id": "b", "batch_id": "b1", "succ')
+
+    job.run({"b1": [succeeded("a"), succeeded("b"), succeeded("c")]}, {"b1": ["a", "b", "c"]})
+
+    assert [r["custom_id"] for r in records(job.output)] == ["a", "b", "c"]
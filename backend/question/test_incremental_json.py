@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for incremental_json.ArrayItemParser.
+
+Run with: python3 -m pytest test_incremental_json.py
+"""
+
+import json
+
+from incremental_json import ArrayItemParser
+
+ITEMS = [
+    {"question": "¿Qué hay en la mesa?", "expected_answer": "Un gato.", "points": 30},
+    {"question": 'Say "hola" {twice}', "expected_answer": "hola \\ hola }]", "points": 30},
+    {"question": "Tags", "expected_answer": "ok", "tags": [["a", "b"], [], [{"deep": [1, 2]}]]},
+]
+DOCUMENT = json.dumps({"level": "A2", "language": "Spanish", "qa_sets": ITEMS, "total": 3}, ensure_ascii=False)
+
+
+def feed_all(parser, chunks):
+    items = []
+    for chunk in chunks:
+        items.extend(parser.feed(chunk))
+    return items
+
+
+def test_whole_document():
+    parser = ArrayItemParser("qa_sets")
+    assert parser.feed(DOCUMENT) == ITEMS
+    assert parser.done
+    assert parser.text == DOCUMENT
+
+
+def test_items_split_at_every_chunk_boundary():
+    for split in range(1, len(DOCUMENT)):
+        parser = ArrayItemParser("qa_sets")
+        assert feed_all(parser, [DOCUMENT[:split], DOCUMENT[split:]]) == ITEMS, split
+
+
+def test_one_character_at_a_time_yields_each_item_when_it_closes():
+    parser = ArrayItemParser("qa_sets")
+    seen = []
+    for i, char in enumerate(DOCUMENT):
+        for item in parser.feed(char):
+            seen.append(item)
+            # The item is complete exactly at its closing brace
+            assert DOCUMENT[:i + 1].endswith(json.dumps(item, ensure_ascii=False))
+    assert seen == ITEMS
+
+
+def test_escaped_quotes_and_braces_inside_strings():
+    text = r'{"qa_sets": [{"q": "a \"quoted\" {brace} [bracket] \\"}, {"q": "\\\"}"}]}'
+    assert ArrayItemParser("qa_sets").feed(text) == json.loads(text)["qa_sets"]
+
+
+def test_nested_arrays_as_items():
+    text = '{"qa_sets": [[1, [2, 3]], {"a": [[]]}, []]}'
+    assert ArrayItemParser("qa_sets").feed(text) == [[1, [2, 3]], {"a": [[]]}, []]
+
+
+def test_truncated_final_item_is_not_returned():
+    cut = DOCUMENT.index('{"question": "Tags"') + 20
+    parser = ArrayItemParser("qa_sets")
+    assert parser.feed(DOCUMENT[:cut]) == ITEMS[:2]
+    assert not parser.done
+
+
+def test_text_before_the_array_and_code_fences_are_ignored():
+    text = 'Sure!\n```json\n{"note": "qa_sets", "qa_sets" :\n [{"q": 1}]}\n```'
+    parser = ArrayItemParser("qa_sets")
+    assert feed_all(parser, [text[:15], text[15:]]) == [{"q": 1}]
+    assert parser.done
+
+
+def test_nothing_after_the_array_closes():
+    parser = ArrayItemParser("qa_sets")
+    assert parser.feed('{"qa_sets": [{"a": 1}], "other": [{"b": 2}]}') == [{"a": 1}]
+    assert parser.feed('{"c": 3}') == []
@@ -1,12 +1,92 @@
-from anthropic import Anthropic
 import os, sys,json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
 
 # Import configuration management from pic_process
 sys.path.append('../pic_process')
-from config import get_anthropic_key, get_anthropic_client
+from config import config, get_anthropic_key, get_anthropic_client
+from qa_cache import QACache
+from incremental_json import ArrayItemParser
+from single_flight import SingleFlight
+from timing import span, submit
+from api_calls import api_calls, is_retryable
+from structured_output import (
+    StructuredOutputError, QAItem, QASetResponse, Evaluation, QuestionList, Feedback,
+    create_structured, structured_request
+)
 
 valid_levels = {"A1", "A2", "B1", "B2", "C1", "C2"}
 
+# Generated Q&A sets, shared by every generate_complete_qa_set call in the
+# process. Built on first use so importing this module doesn't read .env.
+_qa_cache = None
+_qa_cache_lock = threading.Lock()
+
+def get_qa_cache():
+    """Return the process-wide QACache, configured from config on first call."""
+    global _qa_cache
+    if _qa_cache is None:
+        with _qa_cache_lock:
+            if _qa_cache is None:
+                _qa_cache = QACache(
+                    max_entries=config.qa_cache_entries,
+                    variants=config.qa_cache_variants,
+                    ttl=config.qa_cache_ttl
+                )
+    return _qa_cache
+
+# Concurrent generate_complete_qa_set calls for the same cache key share one API call
+qa_flight = SingleFlight()
+
+# Static instruction blocks. They are identical on every call, so they go first
+# and are marked cacheable; the scene, language, level, question and answer
+# follow in a separate, uncached suffix. (The API only caches prefixes above
+# its minimum length; shorter ones are simply billed as normal input.)
+CACHE_CONTROL = {"type": "ephemeral"}
+
+QA_GENERATION_INSTRUCTIONS = """You are an expert language tutor creating educational content for language learners.
+
+Based on the image description you are given, create 3 complete question-answer sets for a learner of the target language at the given CEFR level.
+
+Generate exactly 3 questions with their expected answers. Each question should:
+1. Be relevant to the scene described
+2. Use appropriate grammar and vocabulary for the learner's level
+3. Have a clear, specific expected answer
+4. Be answerable based on the scene description
+
+Write every question and expected answer in the target language.
+
+Record the level, the target language and the 3 question-answer sets with the record_qa_sets tool."""
+
+EVALUATION_INSTRUCTIONS = """You are an expert language tutor providing detailed feedback to help students improve.
+
+You will be told the student's target language and level, the image context, and then one question with its expected answer and the student's answer.
+
+Evaluate the student's answer considering:
+1. Accuracy compared to expected answer
+2. Appropriate language level for the student's level
+3. Understanding of the image context
+4. Grammar and vocabulary usage
+
+Provide constructive feedback in English and assign points.
+
+Record your evaluation with the record_evaluation tool, copying question_id, question, expected_answer, student_answer and max_points from the request."""
+
+
+def _prompt_cache_usage(message=None):
+    """Input-token counters for one API response (all zero if message is None)."""
+    usage = getattr(message, "usage", None)
+    return {
+        "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+        "cache_read_input_tokens": getattr(usage, "cache_read_input_tokens", 0) or 0,
+        "cache_creation_input_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0,
+    }
+
+def _add_usage(total, usage):
+    for key, value in usage.items():
+        total[key] = total.get(key, 0) + value
+    return total
+
 def validate_data(img_data, user_data):
     if (user_data['level'] not in valid_levels):
         return (None, "Invalid user level")
@@ -54,10 +134,11 @@ def get_questions(img_data, user_data):
         Requirements: \n
         Make the questions relevant to the scene.\n
         Keep grammar appropriate to the level.\n
-        Output in this JSON format: \n
-        {{ 'level': '{lvl}', 'questions':['First question here', 'Second question here','Third question here']}}"""
+        Record the level ({lvl}) and the three questions with the record_questions tool."""
 
-    message = client.messages.create(
+    questions, _ = create_structured(
+        client,
+        QuestionList,
         model = "claude-sonnet-4-20250514",
         max_tokens = 1024,
         system = "You are a language tutor helping learners practice {language}.",
@@ -67,7 +148,7 @@ def get_questions(img_data, user_data):
         service_tier="standard_only"
     )
 
-    return json.loads(message.content[0].text)
+    return questions.to_dict()
 
 def get_feedback(img_data, user_data, question, answer):
     client = get_anthropic_client()
@@ -78,11 +159,12 @@ def get_feedback(img_data, user_data, question, answer):
         Give helpful feedback.\n
         Consider if it is a good response to your question.\n
         Grade the student out of 100 points.
-        Output in this JSON format: \n
-        {{ 'question' : {question}, 'answer': {answer}, 'points': <integer between 0 and 100>, 'feedback' : <descriptive feedback> }}
+        Record the question ({question}), the answer ({answer}), the points and descriptive feedback with the record_feedback tool.
     """
 
-    message = client.messages.create(
+    feedback, _ = create_structured(
+        client,
+        Feedback,
         model = "claude-sonnet-4-20250514",
         max_tokens = 1024,
         system = "You are a language tutor helping learners practice {user_data['language']}",
@@ -92,15 +174,63 @@ def get_feedback(img_data, user_data, question, answer):
         service_tier="standard_only"
     )
 
-    return json.loads(message.content[0].text)
+    return feedback.to_dict()
+
+def _qa_generation_request(scene_desc, language, level, shared_scene=False):
+    """
+    Keyword arguments for the Q&A generation call (shared by the streaming and blocking paths).
+
+    With shared_scene the scene comes first, in its own cacheable block, so
+    calls for other targets of the same scene reuse the cached tool schema,
+    instructions and scene (see generate_qa_for_targets).
+    """
+    if shared_scene:
+        content = [
+            {"type": "text", "text": f"Scene: {scene_desc}", "cache_control": CACHE_CONTROL},
+            {"type": "text", "text": f"Target language: {language}\nLevel: {level}"}
+        ]
+    else:
+        content = f"Target language: {language}\nLevel: {level}\n\nScene: {scene_desc}"
+    return {
+        "model": "claude-sonnet-4-20250514",
+        "max_tokens": 2048,
+        "system": [
+            {"type": "text", "text": QA_GENERATION_INSTRUCTIONS, "cache_control": CACHE_CONTROL}
+        ],
+        "messages": [
+            {"role": "user", "content": content}
+        ],
+        "service_tier": "standard_only"
+    }
+
+def qa_batch_params(scene_desc, language, level):
+    """Message Batches `params` for one Q&A generation request (see batch_qa.py)."""
+    params = structured_request(QASetResponse, **_qa_generation_request(scene_desc, language, level))
+    # Batch requests are processed asynchronously; service tiers don't apply
+    params.pop("service_tier", None)
+    return params
+
+def qa_response_from_message(message):
+    """Validate a record_qa_sets reply and finish its Q&A sets as generate_complete_qa_set does."""
+    qa_response = QASetResponse.from_message(message).to_dict()
+    for i, qa_set in enumerate(qa_response['qa_sets']):
+        _finish_qa_set(qa_set, i + 1)
+    return qa_response
+
+def _finish_qa_set(qa_set, qa_id):
+    """Add the id and feedback template the frontend expects to a generated Q&A set."""
+    qa_set['id'] = qa_id
+    qa_set['feedback_template'] = f"Evaluate the student's answer to: '{qa_set['question']}'"
+    return qa_set
 
-def generate_complete_qa_set(img_data, user_data):
+def generate_complete_qa_set(img_data, user_data, shared_scene=False):
     """
     Generate complete Q&A sets with questions, expected answers, and feedback.
     
     Args:
         img_data (dict): Output from pic_process with 'description' and other scene data
         user_data (dict): User preferences with 'language' and 'level'
+        shared_scene (bool): Cache the scene as part of the prompt prefix (for multi-target runs)
         
     Returns:
         dict: Complete Q&A sets with questions, answers, points, and feedback
@@ -109,87 +239,44 @@ def generate_complete_qa_set(img_data, user_data):
     if (out[0] == None):
         return {"error": True, "message": out[1]}
 
-    client = get_anthropic_client()
-    
     scene_desc = img_data['description']
     language = user_data['language']
     level = user_data['level']
     
-    # Enhanced prompt to generate complete Q&A sets
-    prompt = f"""Based on the following image description, create 3 complete question-answer sets for a {language} learner at {level} level:
-
-Scene: {scene_desc}
-
-Generate exactly 3 questions with their expected answers. Each question should:
-1. Be relevant to the scene described
-2. Use appropriate grammar and vocabulary for {level} level
-3. Have a clear, specific expected answer
-4. Be answerable based on the scene description
-
-Output in this exact JSON format:
-{{
-  "level": "{level}",
-  "language": "{language}",
-  "qa_sets": [
-    {{
-      "question": "First question in {language}",
-      "expected_answer": "Expected answer in {language}",
-      "question_type": "comprehension|vocabulary|grammar|cultural",
-      "difficulty": 1-5,
-      "points": 0-100
-    }},
-    {{
-      "question": "Second question in {language}",
-      "expected_answer": "Expected answer in {language}",
-      "question_type": "comprehension|vocabulary|grammar|cultural",
-      "difficulty": 1-5,
-      "points": 0-100
-    }},
-    {{
-      "question": "Third question in {language}",
-      "expected_answer": "Expected answer in {language}",
-      "question_type": "comprehension|vocabulary|grammar|cultural",
-      "difficulty": 1-5,
-      "points": 0-100
-    }}
-  ]
-}}"""
+    # Same scene, language and level: reuse a previously generated set
+    cache_key = QACache.key(scene_desc, language, level)
+    if config.qa_cache_entries:
+        cached = get_qa_cache().get(cache_key)
+        if cached is not None:
+            return cached
+    
+    # The same scene, language and level already being generated: share that result
+    qa_response, shared = qa_flight.do(cache_key, _generate_qa_set, scene_desc, language, level, cache_key,
+                                       shared_scene)
+    if shared and not qa_response.get('error'):
+        # Tokens were spent (and counted) by the request that generated it
+        qa_response['prompt_cache'] = _prompt_cache_usage()
+    return qa_response
 
+def _generate_qa_set(scene_desc, language, level, cache_key, shared_scene=False):
+    """Make the Q&A generation call and cache the result; failures become an error dict."""
+    client = get_anthropic_client()
+    
     try:
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=2048,
-            system=f"You are an expert {language} language tutor creating educational content for {level} level students.",
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            service_tier="standard_only"
-        )
-        
-        raw_response = message.content[0].text
-        
-        # Clean the response - remove markdown code blocks if present
-        cleaned_response = raw_response.strip()
-        if cleaned_response.startswith('```json'):
-            # Remove ```json at the start and ``` at the end
-            first_brace = cleaned_response.find('{')
-            last_brace = cleaned_response.rfind('}')
-            if first_brace != -1 and last_brace != -1:
-                cleaned_response = cleaned_response[first_brace:last_brace + 1]
-        elif cleaned_response.startswith('```'):
-            # Remove ``` at the start and ``` at the end
-            first_brace = cleaned_response.find('{')
-            last_brace = cleaned_response.rfind('}')
-            if first_brace != -1 and last_brace != -1:
-                cleaned_response = cleaned_response[first_brace:last_brace + 1]
-        
-        qa_response = json.loads(cleaned_response)
+        with span("qa_generation", language=language, level=level):
+            qa_result, message = create_structured(
+                client, QASetResponse, stage="qa",
+                **_qa_generation_request(scene_desc, language, level, shared_scene))
+        qa_response = qa_result.to_dict()
         
         # Add feedback generation for each Q&A pair
         for i, qa_set in enumerate(qa_response['qa_sets']):
-            qa_set['id'] = i + 1
-            qa_set['feedback_template'] = f"Evaluate the student's answer to: '{qa_set['question']}'"
+            _finish_qa_set(qa_set, i + 1)
+        
+        if config.qa_cache_entries:
+            get_qa_cache().put(cache_key, qa_response)
         
+        qa_response['prompt_cache'] = _prompt_cache_usage(message)
         return qa_response
         
     except Exception as e:
@@ -198,111 +285,313 @@ Output in this exact JSON format:
             "message": f"Failed to generate Q&A sets: {str(e)}"
         }
 
-def evaluate_student_answers(img_data, user_data, qa_sets, student_answers):
+def target_key(language, level):
+    """Key for one (language, level) target in multi-target results, e.g. "Spanish:A2"."""
+    return f"{language}:{level}"
+
+def parse_targets(targets):
     """
-    Evaluate student answers against expected answers and provide detailed feedback.
+    Normalize targets to a de-duplicated list of (language, level) pairs.
+
+    Accepts (language, level) pairs, {"language", "level"} dicts or "Language:LEVEL" strings.
+    """
+    pairs = []
+    for target in targets:
+        if isinstance(target, str):
+            language, sep, level = target.rpartition(":")
+            if not sep:
+                raise ValueError(f"Target '{target}' should look like Language:LEVEL")
+        elif isinstance(target, dict):
+            language, level = target["language"], target["level"]
+        else:
+            language, level = target
+        pair = (language.strip(), level.strip().upper())
+        if pair not in pairs:
+            pairs.append(pair)
+    return pairs
+
+def generate_qa_for_targets(img_data, targets, max_concurrency=None, warm_prefix=True):
+    """
+    Generate Q&A sets for several (language, level) targets of one scene.
+    
+    Every call sends the same prefix (tool schema, instructions, scene) and
+    differs only in a short target suffix, so the prefix is marked cacheable.
+    The first target runs alone to write that cache entry; the others then
+    run concurrently and read it. Each target still goes through the Q&A
+    cache and single-flight, and one failing target doesn't affect the rest.
+    (The API only caches prefixes above its minimum length, so a very short
+    scene may be billed in full for every target.)
     
     Args:
-        img_data (dict): Original image data
-        user_data (dict): User preferences 
-        qa_sets (list): Q&A sets from generate_complete_qa_set
-        student_answers (list): Student's answers to the questions
+        img_data (dict): Output from pic_process with 'description' and other scene data
+        targets (list): (language, level) pairs, {"language", "level"} dicts or "Language:LEVEL" strings
+        max_concurrency (int): Generation calls in flight (default: config.qa_target_concurrency)
+        warm_prefix (bool): Generate the first target before fanning out
         
     Returns:
-        dict: Evaluation results with scores and feedback
+        dict: {"results": {"Language:LEVEL": generate_complete_qa_set result}, "prompt_cache": totals}
     """
-    client = get_anthropic_client()
+    pairs = parse_targets(targets)
+    max_concurrency = max_concurrency or config.qa_target_concurrency
+    results = {}
+    
+    def generate(language, level):
+        return generate_complete_qa_set(img_data, {"language": language, "level": level}, shared_scene=True)
+    
+    remaining = list(pairs)
+    if warm_prefix and len(remaining) > 1:
+        language, level = remaining.pop(0)
+        results[target_key(language, level)] = generate(language, level)
+    
+    if remaining:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(remaining)))) as executor:
+            futures = {
+                submit(executor, None, generate, language, level): target_key(language, level)
+                for language, level in remaining
+            }
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+    
+    prompt_cache = _prompt_cache_usage()
+    for result in results.values():
+        _add_usage(prompt_cache, result.get("prompt_cache") or {})
+    # Report targets in the order they were requested
+    return {
+        "results": {target_key(*pair): results[target_key(*pair)] for pair in pairs},
+        "prompt_cache": prompt_cache
+    }
+
+def stream_complete_qa_set(img_data, user_data):
+    """
+    Streaming version of generate_complete_qa_set.
     
+    Yields each Q&A set (with 'id' and 'feedback_template') as soon as the
+    model closes it in the streamed response, then one final dict with
+    {"done": True, "level", "language", "total_questions", "prompt_cache"}.
+    On failure yields {"error": True, "message": ...} and stops.
+    
+    Args:
+        img_data (dict): Output from pic_process with 'description' and other scene data
+        user_data (dict): User preferences with 'language' and 'level'
+    """
+    out = validate_data(img_data, user_data)
+    if (out[0] == None):
+        yield {"error": True, "message": out[1]}
+        return
+
     scene_desc = img_data['description']
     language = user_data['language']
     level = user_data['level']
     
-    evaluations = []
+    cache_key = QACache.key(scene_desc, language, level)
+    if config.qa_cache_entries:
+        cached = get_qa_cache().get(cache_key)
+        if cached is not None:
+            yield from cached['qa_sets']
+            yield {"done": True, "level": level, "language": language,
+                   "total_questions": len(cached['qa_sets']), "prompt_cache": _prompt_cache_usage()}
+            return
+    
+    client = get_anthropic_client()
+    request = structured_request(QASetResponse, **_qa_generation_request(scene_desc, language, level))
+    qa_sets = []
+    
+    # The forced tool call streams its input as JSON fragments; each Q&A set is
+    # validated and sent as soon as it closes. api_calls retries opening the
+    # stream; a schema-invalid reply or an error mid-stream is retried here
+    # only while nothing has been sent yet.
+    for attempt in range(1, config.structured_output_attempts + 1):
+        parser = ArrayItemParser("qa_sets")
+        try:
+            with span("qa_generation", streamed=True), \
+                    api_calls.stream("qa", client, **request) as stream:
+                for event in stream:
+                    if event.type != "input_json":
+                        continue
+                    for item in parser.feed(event.partial_json):
+                        qa_set = _finish_qa_set(QAItem.from_dict(item).to_dict(), len(qa_sets) + 1)
+                        qa_sets.append(qa_set)
+                        yield qa_set
+                message = stream.get_final_message()
+            QASetResponse.from_message(message)
+            break
+        except StructuredOutputError as e:
+            if qa_sets or attempt == config.structured_output_attempts:
+                yield {"error": True, "message": f"Failed to generate Q&A sets: {str(e)}"}
+                return
+            print(f"record_qa_sets: attempt {attempt} invalid ({e}), retrying", file=sys.stderr)
+        except Exception as e:
+            if not qa_sets and is_retryable(e) and attempt < config.structured_output_attempts:
+                print(f"qa: stream failed before any Q&A set ({type(e).__name__}), retrying",
+                      file=sys.stderr)
+                continue
+            yield {
+                "error": True,
+                "message": f"Failed to generate Q&A sets: {str(e)}"
+            }
+            return
     
-    for i, (qa_set, student_answer) in enumerate(zip(qa_sets, student_answers)):
-        evaluation_prompt = f"""You are evaluating a {language} language student at {level} level.
+    if config.qa_cache_entries:
+        get_qa_cache().put(cache_key, {"level": level, "language": language, "qa_sets": qa_sets})
+    
+    yield {"done": True, "level": level, "language": language,
+           "total_questions": len(qa_sets), "prompt_cache": _prompt_cache_usage(message)}
 
-Image context: {scene_desc}
+def _evaluate_answer(client, scene_desc, language, level, question_id, qa_set, student_answer, timeout):
+    """
+    Grade a single answer.
 
+    Returns:
+        tuple: (evaluation dict or error entry, prompt cache usage)
+    """
+    # The student context is shared by every question in this request, so it is
+    # cached too; only the question block below differs between calls.
+    context = f"""You are evaluating a {language} language student at {level} level.
+
+Image context: {scene_desc}"""
+    question_block = f"""Question ID: {question_id}
 Question: {qa_set['question']}
 Expected Answer: {qa_set['expected_answer']}
 Student Answer: {student_answer}
 Question Type: {qa_set.get('question_type', 'comprehension')}
-Max Points: {qa_set.get('points', 100)}
-
-Evaluate the student's answer considering:
-1. Accuracy compared to expected answer
-2. Appropriate language level for {level}
-3. Understanding of the image context
-4. Grammar and vocabulary usage
-
-Provide constructive feedback in English and assign points.
-
-Output in this exact JSON format:
-{{
-  "question_id": {i + 1},
-  "question": "{qa_set['question']}",
-  "expected_answer": "{qa_set['expected_answer']}",
-  "student_answer": "{student_answer}",
-  "points_earned": 0-{qa_set.get('points', 100)},
-  "max_points": {qa_set.get('points', 100)},
-  "percentage": 0-100,
-  "feedback": "Detailed constructive feedback in English",
-  "areas_for_improvement": ["area1", "area2"],
-  "strengths": ["strength1", "strength2"]
-}}"""
+Max Points: {qa_set.get('points', 100)}"""
 
-        try:
-            message = client.messages.create(
+    message = None
+    try:
+        with span("evaluation", question_id=question_id):
+            evaluation, message = create_structured(
+                client,
+                Evaluation,
+                stage="evaluation",
                 model="claude-sonnet-4-20250514",
                 max_tokens=1024,
-                system=f"You are an expert {language} language tutor providing detailed feedback to help students improve.",
+                system=[
+                    {"type": "text", "text": EVALUATION_INSTRUCTIONS, "cache_control": CACHE_CONTROL}
+                ],
                 messages=[
-                    {"role": "user", "content": evaluation_prompt}
+                    {"role": "user", "content": [
+                        {"type": "text", "text": context, "cache_control": CACHE_CONTROL},
+                        {"type": "text", "text": question_block}
+                    ]}
                 ],
-                service_tier="standard_only"
+                service_tier="standard_only",
+                timeout=timeout
             )
-            
-            raw_eval_response = message.content[0].text
-            
-            # Clean the evaluation response - remove markdown code blocks if present
-            cleaned_eval_response = raw_eval_response.strip()
-            if cleaned_eval_response.startswith('```json'):
-                first_brace = cleaned_eval_response.find('{')
-                last_brace = cleaned_eval_response.rfind('}')
-                if first_brace != -1 and last_brace != -1:
-                    cleaned_eval_response = cleaned_eval_response[first_brace:last_brace + 1]
-            elif cleaned_eval_response.startswith('```'):
-                first_brace = cleaned_eval_response.find('{')
-                last_brace = cleaned_eval_response.rfind('}')
-                if first_brace != -1 and last_brace != -1:
-                    cleaned_eval_response = cleaned_eval_response[first_brace:last_brace + 1]
-            
-            evaluation = json.loads(cleaned_eval_response)
-            evaluations.append(evaluation)
-            
-        except Exception as e:
-            evaluations.append({
-                "question_id": i + 1,
-                "error": True,
-                "message": f"Failed to evaluate answer: {str(e)}"
-            })
+        
+        return evaluation.to_dict(), _prompt_cache_usage(message)
+        
+    except Exception as e:
+        return {
+            "question_id": question_id,
+            "error": True,
+            "message": f"Failed to evaluate answer: {str(e)}"
+        }, _prompt_cache_usage(message)
+
+def iter_student_evaluations(img_data, user_data, qa_sets, student_answers, max_concurrency=None, timeout=None):
+    """
+    Grade answers concurrently and yield each result as soon as it is ready.
+    
+    Results arrive in completion order, not question order. A call that fails
+    or times out is yielded as an error entry.
+    
+    Args:
+        img_data (dict): Original image data
+        user_data (dict): User preferences 
+        qa_sets (list): Q&A sets from generate_complete_qa_set
+        student_answers (list): Student's answers to the questions
+        max_concurrency (int): Maximum grading calls in flight (default: config.evaluation_concurrency)
+        timeout (float): Per-call timeout in seconds (default: config.evaluation_timeout)
+        
+    Yields:
+        tuple: (question index, evaluation dict, prompt cache usage)
+    """
+    scene_desc = img_data['description']
+    language = user_data['language']
+    level = user_data['level']
+    max_concurrency = max_concurrency or config.evaluation_concurrency
+    timeout = timeout or config.evaluation_timeout
+    
+    pairs = list(zip(qa_sets, student_answers))
+    if not pairs:
+        return
     
-    # Calculate overall results
+    client = get_anthropic_client()
+    executor = ThreadPoolExecutor(max_workers=min(max_concurrency, len(pairs)))
+    try:
+        futures = {
+            submit(executor, None, _evaluate_answer, client, scene_desc, language, level,
+                   i + 1, qa_set, student_answer, timeout): i
+            for i, (qa_set, student_answer) in enumerate(pairs)
+        }
+        # Calls queued behind the concurrency limit get their own full timeout,
+        # so the overall deadline is one timeout per wave of calls
+        waves = -(-len(pairs) // max_concurrency)
+        pending = set(futures)
+        try:
+            for future in as_completed(futures, timeout=timeout * waves):
+                pending.discard(future)
+                evaluation, usage = future.result()
+                yield futures[future], evaluation, usage
+        except FutureTimeoutError:
+            for future in sorted(pending, key=futures.get):
+                i = futures[future]
+                if future.done():
+                    evaluation, usage = future.result()
+                    yield i, evaluation, usage
+                else:
+                    yield i, {
+                        "question_id": i + 1,
+                        "error": True,
+                        "message": f"Failed to evaluate answer: timed out after {timeout}s"
+                    }, _prompt_cache_usage()
+    finally:
+        # Don't hold the response for calls that already timed out
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def summarize_evaluations(evaluations, level, language):
+    """Overall score summary for a list of evaluations (error entries are skipped)."""
     total_points = sum([eval.get('points_earned', 0) for eval in evaluations if not eval.get('error')])
     max_total_points = sum([eval.get('max_points', 100) for eval in evaluations if not eval.get('error')])
     overall_percentage = round((total_points / max_total_points * 100) if max_total_points > 0 else 0, 1)
     
+    return {
+        "total_points": total_points,
+        "max_points": max_total_points,
+        "percentage": overall_percentage,
+        "questions_answered": len(evaluations),
+        "level": level,
+        "language": language
+    }
+
+def evaluate_student_answers(img_data, user_data, qa_sets, student_answers, max_concurrency=None, timeout=None):
+    """
+    Evaluate student answers against expected answers and provide detailed feedback.
+    
+    Answers are graded concurrently. Evaluations are returned in question order;
+    a call that fails or times out becomes an error entry and the summary is
+    computed from the answers that were graded.
+    
+    Args:
+        img_data (dict): Original image data
+        user_data (dict): User preferences 
+        qa_sets (list): Q&A sets from generate_complete_qa_set
+        student_answers (list): Student's answers to the questions
+        max_concurrency (int): Maximum grading calls in flight (default: config.evaluation_concurrency)
+        timeout (float): Per-call timeout in seconds (default: config.evaluation_timeout)
+        
+    Returns:
+        dict: Evaluation results with scores and feedback
+    """
+    results = {}
+    for i, evaluation, _usage in iter_student_evaluations(
+            img_data, user_data, qa_sets, student_answers, max_concurrency, timeout):
+        results[i] = evaluation
+    
+    evaluations = [results[i] for i in sorted(results)]
+    
     return {
         "evaluations": evaluations,
-        "summary": {
-            "total_points": total_points,
-            "max_points": max_total_points,
-            "percentage": overall_percentage,
-            "questions_answered": len(evaluations),
-            "level": level,
-            "language": language
-        }
+        "summary": summarize_evaluations(evaluations, user_data['level'], user_data['language'])
     }
 
 def process_image_to_qa(pic_process_output, language, level):
@@ -349,5 +638,56 @@ def process_image_to_qa(pic_process_output, language, level):
         },
         "questions": qa_result["qa_sets"],
         "total_questions": len(qa_result["qa_sets"]),
-        "instructions": f"Answer these {len(qa_result['qa_sets'])} questions in {language} based on the image you saw."
+        "instructions": f"Answer these {len(qa_result['qa_sets'])} questions in {language} based on the image you saw.",
+        "prompt_cache": qa_result.get("prompt_cache", _prompt_cache_usage())
+    }
+
+def process_image_to_qa_targets(pic_process_output, targets, max_concurrency=None):
+    """
+    Multi-target version of process_image_to_qa: one scene, several (language, level) targets.
+    
+    Args:
+        pic_process_output (dict): Direct output from pic_process().process_base64_image()
+        targets (list): (language, level) pairs, {"language", "level"} dicts or "Language:LEVEL" strings
+        max_concurrency (int): Generation calls in flight (default: config.qa_target_concurrency)
+        
+    Returns:
+        dict: {"success", "image_context", "results": {"Language:LEVEL": {...}}, "prompt_cache"}.
+        Each result has the fields process_image_to_qa returns, or "error" and "message".
+        "success" is False only if every target failed.
+    """
+    img_data = {
+        "description": pic_process_output.get("description", ""),
+        "primary_object": pic_process_output.get("primary_object", ""),
+        "objects": pic_process_output.get("objects", [])
+    }
+    
+    generated = generate_qa_for_targets(img_data, targets, max_concurrency)
+    results = {}
+    for key, qa_result in generated["results"].items():
+        language, _, level = key.rpartition(":")
+        if qa_result.get("error"):
+            results[key] = qa_result
+            continue
+        results[key] = {
+            "success": True,
+            "learning_context": {
+                "language": language,
+                "level": level
+            },
+            "questions": qa_result["qa_sets"],
+            "total_questions": len(qa_result["qa_sets"]),
+            "instructions": f"Answer these {len(qa_result['qa_sets'])} questions in {language} based on the image you saw.",
+            "prompt_cache": qa_result.get("prompt_cache", _prompt_cache_usage())
+        }
+    
+    return {
+        "success": any(not result.get("error") for result in results.values()),
+        "image_context": {
+            "description": img_data["description"],
+            "primary_object": img_data.get("primary_object"),
+            "detected_objects": img_data.get("objects", [])
+        },
+        "results": results,
+        "prompt_cache": generated["prompt_cache"]
     }